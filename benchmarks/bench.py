@@ -0,0 +1,366 @@
+"""
+Launch latency benchmarks for the containerizer.
+
+Drives the real subcommands the way the `serve` daemon does, feeding each the
+length prefixed protobuf mesos would send on stdin and collecting what it
+writes to stdout, against a fake docker daemon (`benchmarks/fake_docker.py`),
+a fake docker CLI (`benchmarks/bin/docker`) and a generated cgroup tree. Each
+operation is run for every container at the given concurrency, and the p50
+and p99 latency are reported along with the number of processes forked per
+operation.
+
+    python -m benchmarks.bench --containers 50 --concurrency 8
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+from containerizer import cgroups, environment
+from containerizer.reaper import start_background_reaper
+from containerizer.commands.serve import run_command
+from containerizer.proto import Launch, Update, Usage, Wait, Destroy, Value
+
+from benchmarks.fake_docker import FakeDockerDaemon, container_id
+
+BIN_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bin")
+
+OPERATIONS = ("launch", "usage", "update", "wait", "destroy")
+
+
+class ForkCounter(object):
+    """
+    Counts the processes forked by this process, by wrapping `os.fork`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.fork = os.fork
+
+    def install(self):
+        def fork():
+            with self.lock:
+                self.count += 1
+            return self.fork()
+        os.fork = fork
+
+    def uninstall(self):
+        os.fork = self.fork
+
+
+class Result(object):
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.latencies = []
+        self.errors = 0
+        self.forks = 0
+
+    def add(self, latency, status):
+        self.latencies.append(latency)
+        if status != 0:
+            self.errors += 1
+
+    def percentile(self, p):
+        """
+        The nearest rank percentile of the latencies, in seconds.
+
+        >>> r = Result("x")
+        >>> r.latencies = [0.1, 0.2, 0.3, 0.4]
+        >>> r.percentile(50), r.percentile(99)
+        (0.2, 0.4)
+        """
+
+        if not self.latencies:
+            return 0.0
+
+        ordered = sorted(self.latencies)
+        rank = int(-(-len(ordered) * p // 100))  # Rounded up
+        return ordered[max(rank, 1) - 1]
+
+    def row(self):
+        count = len(self.latencies)
+        return "%-10s %6d %6d %10.2f %10.2f %10.2f %8.2f" % (
+            self.operation, count, self.errors,
+            self.percentile(50) * 1000, self.percentile(99) * 1000,
+            (sum(self.latencies) / count if count else 0.0) * 1000,
+            float(self.forks) / count if count else 0.0
+        )
+
+
+def generate_cgroup_tree(root, docker_ids, version):
+    """
+    Write out the cgroup files docker would create for each container.
+    """
+
+    if version == "1":
+        files = {
+            "cpu/cpu.shares": "512\n",
+            "cpu/cpu.stat": "nr_periods 100\nnr_throttled 3\nthrottled_time 12345678\n",
+            "cpu/cpu.cfs_period_us": "100000\n",
+            "cpu/cpu.cfs_quota_us": "-1\n",
+            "cpuacct/cpuacct.stat": "user 1200\nsystem 300\n",
+            "memory/memory.limit_in_bytes": "134217728\n",
+            "memory/memory.soft_limit_in_bytes": "134217728\n",
+            "memory/memory.usage_in_bytes": "67108864\n",
+            "memory/memory.stat": "cache 1048576\nrss 50331648\nmapped_file 0\n",
+            "memory/memory.oom_control": "oom_kill_disable 0\nunder_oom 0\noom_kill 0\n",
+            "memory/cgroup.event_control": "",
+            "blkio/blkio.throttle.io_service_bytes": "8:0 Read 4096\n8:0 Write 0\nTotal 4096\n",
+            "blkio/blkio.throttle.io_serviced": "8:0 Read 1\n8:0 Write 0\nTotal 1\n",
+        }
+        paths = lambda subsystem, docker_id: os.path.join(root, subsystem, "docker", docker_id)
+    else:
+        with open(os.path.join(root, "cgroup.controllers"), "w") as f:
+            f.write("cpu io memory pids\n")
+
+        files = {
+            "cpu.weight": "20\n",
+            "cpu.max": "max 100000\n",
+            "cpu.stat": "usage_usec 15000000\nuser_usec 12000000\nsystem_usec 3000000\n"
+                        "nr_periods 100\nnr_throttled 3\nthrottled_usec 12345\n",
+            "cpu.pressure": "some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n",
+            "memory.max": "134217728\n",
+            "memory.low": "0\n",
+            "memory.current": "67108864\n",
+            "memory.stat": "anon 50331648\nfile 1048576\n",
+            "memory.events": "low 0\nhigh 0\nmax 0\noom 0\noom_kill 0\n",
+            "io.stat": "8:0 rbytes=4096 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n",
+            "memory.pressure": "some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+                               "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n",
+        }
+        paths = lambda subsystem, docker_id: os.path.join(root, "docker", docker_id)
+
+    for docker_id in docker_ids:
+        for name, content in files.iteritems():
+            subsystem, _, metric = name.rpartition("/")
+            directory = paths(subsystem, docker_id)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(os.path.join(directory, metric), "w") as f:
+                f.write(content)
+
+
+def add_resource(resources, name, value):
+    resource = resources.add()
+    resource.name = name
+    resource.type = Value.SCALAR
+    resource.scalar.value = value
+
+
+def launch_payload(name, sandbox_directory):
+    launch = Launch()
+    launch.container_id.value = name
+    launch.directory = sandbox_directory
+
+    task = launch.task_info
+    task.name = name
+    task.task_id.value = name
+    task.slave_id.value = "benchmark-slave"
+    task.command.value = "true"
+    add_resource(task.resources, "cpus", 0.5)
+    add_resource(task.resources, "mem", 128)
+
+    ports = task.resources.add()
+    ports.name = "ports"
+    ports.type = Value.RANGES
+    port_range = ports.ranges.range.add()
+    port_range.begin = 31000
+    port_range.end = 31003
+
+    return launch.SerializeToString()
+
+
+def update_payload(name):
+    update = Update()
+    update.container_id.value = name
+    add_resource(update.resources, "cpus", 1.0)
+    add_resource(update.resources, "mem", 256)
+    return update.SerializeToString()
+
+
+def container_payload(message_type, name):
+    message = message_type()
+    message.container_id.value = name
+    return message.SerializeToString()
+
+
+def run_operation(operation, payloads, env, concurrency, forks):
+    """
+    Run a subcommand once for each payload, `concurrency` at a time.
+    """
+
+    result = Result(operation)
+
+    def run(payload):
+        started = time.time()
+        status, _ = run_command(operation, payload, env)
+        return time.time() - started, status
+
+    forks_before = forks.count
+    pool = ThreadPool(concurrency)
+    try:
+        for latency, status in pool.imap_unordered(run, payloads):
+            result.add(latency, status)
+    finally:
+        pool.close()
+        pool.join()
+
+    result.forks = forks.count - forks_before
+    return result
+
+
+def start_waits(names, env):
+    """
+    Start a `wait` for every container in the background, returning the
+    threads and a dictionary that each fills in with the time it returned.
+    """
+
+    returned = {}
+
+    def wait(name):
+        status, _ = run_command("wait", container_payload(Wait, name), env)
+        returned[name] = (time.time(), status)
+
+    threads = [threading.Thread(target=wait, args=(name,)) for name in names]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    return threads, returned
+
+
+def run_benchmark(options):
+    work_directory = tempfile.mkdtemp(prefix="containerizer-bench-")
+    docker_socket = os.path.join(work_directory, "docker.sock")
+    cgroup_root = os.path.join(work_directory, "cgroup")
+    os.makedirs(cgroup_root)
+
+    latencies = {"default": options.api_latency}
+    daemon = FakeDockerDaemon(docker_socket, latencies)
+    daemon.start()
+
+    names = ["bench-%05d" % i for i in xrange(options.containers)]
+    generate_cgroup_tree(cgroup_root, map(container_id, names), options.cgroup_version)
+
+    env = dict(os.environ)
+    env.update({
+        "CONTAINERIZER_DOCKER_SOCKET": docker_socket,
+        "CONTAINERIZER_STATE_DIR": os.path.join(work_directory, "state"),
+        "CONTAINERIZER_RUN_DIR": os.path.join(work_directory, "run"),
+        "CONTAINERIZER_CGROUP_VERSION": options.cgroup_version,
+        "CONTAINERIZER_PULL_POLICY": options.pull_policy,
+        "MESOS_LIBEXEC_DIRECTORY": "/usr/libexec/mesos",
+        "MESOS_DEFAULT_CONTAINER_IMAGE": "busybox",
+    })
+
+    # The docker CLI is found on the PATH of the forked process
+    os.environ["PATH"] = BIN_DIRECTORY + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_DOCKER_CLI_LATENCY"] = str(options.cli_latency)
+
+    original_root = cgroups.CGROUP_ROOT
+    cgroups.CGROUP_ROOT = cgroup_root
+
+    # Remove destroyed containers in this process, as the daemon does
+    with environment(env):
+        start_background_reaper()
+
+    forks = ForkCounter()
+    forks.install()
+
+    results = []
+    try:
+        if "launch" in options.operations:
+            payloads = []
+            for name in names:
+                sandbox_directory = os.path.join(work_directory, "sandboxes", name)
+                os.makedirs(sandbox_directory)
+                payloads.append(launch_payload(name, sandbox_directory))
+            results.append(run_operation("launch", payloads, env, options.concurrency, forks))
+
+        if "usage" in options.operations:
+            payloads = [container_payload(Usage, name) for name in names] * options.rounds
+            results.append(run_operation("usage", payloads, env, options.concurrency, forks))
+
+        if "update" in options.operations:
+            payloads = [update_payload(name) for name in names]
+            results.append(run_operation("update", payloads, env, options.concurrency, forks))
+
+        if "wait" in options.operations:
+            wait_threads, returned = start_waits(names, env)
+
+        if "destroy" in options.operations or "wait" in options.operations:
+            payloads = [container_payload(Destroy, name) for name in names]
+            destroy_result = run_operation("destroy", payloads, env, options.concurrency, forks)
+            if "destroy" in options.operations:
+                results.append(destroy_result)
+
+        if "wait" in options.operations:
+            for thread in wait_threads:
+                thread.join(options.timeout)
+
+            # A wait blocks for the life of the container, so what matters is
+            # how long it takes to notice the container exiting.
+            wait_result = Result("wait")
+            for name in names:
+                if name not in returned:
+                    wait_result.errors += 1
+                    continue
+                returned_at, status = returned[name]
+                wait_result.add(returned_at - daemon.killed.get(name, returned_at), status)
+            results.append(wait_result)
+    finally:
+        forks.uninstall()
+        cgroups.CGROUP_ROOT = original_root
+        cgroups.close_handles()
+        daemon.stop()
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark containerizer operations")
+    parser.add_argument("--containers", type=int, default=20,
+                        help="number of containers to launch")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="number of operations in flight at once")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="number of usage calls per container")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="seconds added to every docker API request")
+    parser.add_argument("--cli-latency", type=float, default=0.0,
+                        help="seconds added to every docker CLI invocation")
+    parser.add_argument("--cgroup-version", choices=("1", "2"), default="1")
+    parser.add_argument("--pull-policy", default="if-not-present")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help="comma separated operations to run")
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="seconds to wait for containers to be reported as exited")
+    parser.add_argument("--verbose", action="store_true")
+
+    options = parser.parse_args(argv[1:])
+    options.operations = options.operations.split(",")
+
+    logging.basicConfig(level=logging.INFO if options.verbose else logging.CRITICAL)
+
+    results = run_benchmark(options)
+
+    print "%-10s %6s %6s %10s %10s %10s %8s" % (
+        "operation", "count", "errors", "p50 (ms)", "p99 (ms)", "mean (ms)", "forks/op"
+    )
+    for result in results:
+        print result.row()
+
+    return 1 if any(result.errors for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
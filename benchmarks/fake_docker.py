@@ -0,0 +1,210 @@
+"""
+A scriptable stand-in for the docker daemon's remote API, listening on a unix
+socket. Containers are identified by name, and their full ID is derived from
+the name (see `container_id`) so the fake `docker` CLI used for `run` and
+`pull` can agree on it without sharing any state.
+"""
+
+import sys
+import json
+import time
+import Queue
+import struct
+import socket
+import hashlib
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+def container_id(name):
+    """
+    The full docker ID of a container, as printed by `benchmarks/bin/docker run`.
+    """
+
+    return hashlib.sha256(name).hexdigest()
+
+
+class FakeDockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def handle_request(self):
+        path = self.path.split("?")[0]
+        parts = path.strip("/").split("/")
+        daemon = self.server.daemon
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        latency = daemon.latencies.get(parts[0], daemon.latencies.get("default", 0))
+        if latency:
+            time.sleep(latency)
+
+        if path == "/events":
+            return self.stream_events()
+        if path == "/info":
+            return self.send_json(200, {"LoggingDriver": "json-file"})
+
+        if parts[0] == "containers" and len(parts) >= 2:
+            name = parts[1]
+            action = parts[2] if len(parts) > 2 else None
+
+            if path == "/containers/json":
+                return self.send_json(200, daemon.list_containers())
+            if self.command == "GET" and action == "json":
+                return self.send_json(200, daemon.inspect_container(name))
+            if self.command == "GET" and action == "logs":
+                return self.stream_logs(name)  # Followed by docker ID
+            if self.command == "POST" and action in ("kill", "stop"):
+                daemon.kill_container(name)
+                return self.send_json(204, None)
+            if self.command == "DELETE" and action is None:
+                daemon.remove_container(name)
+                return self.send_json(204, None)
+
+        if parts[0] == "images" and len(parts) >= 2:
+            return self.send_json(200, {"Id": "sha256:" + "0" * 64, "RepoDigests": []})
+
+        self.send_json(404, {"message": "no such route %s" % path})
+
+    do_GET = do_POST = do_DELETE = handle_request
+
+    def send_json(self, status, body):
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+
+        events = self.server.daemon.subscribe()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            data = json.dumps(event)
+            self.wfile.write("%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        self.wfile.write("0\r\n\r\n")
+
+    def stream_logs(self, docker_id):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # A line on each stream, then nothing until the container is killed
+        for stream, line in ((1, "started %s\n" % docker_id), (2, "warming up\n")):
+            data = "%s %s" % (time.strftime("%Y-%m-%dT%H:%M:%S.000000000Z", time.gmtime()), line)
+            frame = struct.pack(">BxxxL", stream, len(data)) + data
+            self.wfile.write("%x\r\n%s\r\n" % (len(frame), frame))
+        self.wfile.flush()
+
+        self.server.daemon.stopped(docker_id).wait()
+        self.wfile.write("0\r\n\r\n")
+
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDockerServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, FakeDockerHandler)
+        self.daemon = daemon
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up on idle keep-alive connections is expected
+        if not isinstance(sys.exc_info()[1], socket.error):
+            SocketServer.UnixStreamServer.handle_error(self, request, client_address)
+
+
+class FakeDockerDaemon(object):
+    """
+    The state behind the fake API. Every container is considered running
+    until it is killed, at which point a `die` event is sent to subscribers.
+    `latencies` maps the first path component of a request ("containers",
+    "images", "events" or "default") to a delay in seconds.
+    """
+
+    def __init__(self, socket_path, latencies=None):
+        self.latencies = latencies or {}
+        self.lock = threading.Lock()
+        self.killed = {}  # Container name to time killed
+        self.removed = set()
+        self.subscribers = []
+        self.stop_events = {}  # Container ID to an event set once it's killed
+        self.server = FakeDockerServer(socket_path, self)
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+            for event in self.stop_events.values():
+                event.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def subscribe(self):
+        events = Queue.Queue()
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def stopped(self, docker_id):
+        with self.lock:
+            if docker_id not in self.stop_events:
+                self.stop_events[docker_id] = threading.Event()
+                if docker_id in map(container_id, self.killed):
+                    self.stop_events[docker_id].set()
+            return self.stop_events[docker_id]
+
+    def inspect_container(self, name):
+        with self.lock:
+            killed = name in self.killed
+
+        return {
+            "Id": container_id(name),
+            "Name": "/" + name,
+            "State": {"Running": not killed, "ExitCode": 137 if killed else 0,
+                      "OOMKilled": False},
+            "HostConfig": {"LogConfig": {"Type": "json-file", "Config": {}}}
+        }
+
+    def list_containers(self):
+        return []
+
+    def kill_container(self, name):
+        with self.lock:
+            self.killed[name] = time.time()
+            subscribers = list(self.subscribers)
+            self.stop_events.setdefault(container_id(name), threading.Event()).set()
+
+        event = {"id": container_id(name), "status": "die",
+                 "Actor": {"Attributes": {"name": name}}}
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def remove_container(self, name):
+        with self.lock:
+            self.removed.add(name)
@@ -1,12 +1,26 @@
 import os
 import click
-import lockfile
 import logging
 import sys
 import struct
+import threading
+
+from contextlib import contextmanager
+
+from containerizer.locks import FileLock
 
 logger = logging.getLogger(__name__)
 
+# Per-thread overrides of the process streams and environment, used when the
+# commands are invoked by the `serve` daemon rather than by mesos directly.
+_invocation = threading.local()
+
+DEFAULT_STATE_DIRECTORY = "/var/lib/docker-containerizer"
+DEFAULT_RUN_DIRECTORY = "/var/run/docker-containerizer"
+
+# How often in seconds a subprocess is checked for being cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
 
 @click.group()
 def app():
@@ -25,9 +39,11 @@ def send_proto(proto):
     string of bytes to stdout.
     """
 
+    stdout = getattr(_invocation, "stdout", sys.stdout)
+
     data = proto.SerializeToString()
-    sys.stdout.write(struct.pack('I', len(data)))
-    sys.stdout.write(data)
+    stdout.write(struct.pack('I', len(data)))
+    stdout.write(data)
 
 
 def recv_proto(proto):
@@ -36,12 +52,14 @@ def recv_proto(proto):
     protobuf type.
     """
 
-    data_size = struct.unpack('I', sys.stdin.read(4))[0]
+    stdin = getattr(_invocation, "stdin", sys.stdin)
+
+    data_size = struct.unpack('I', stdin.read(4))[0]
     if data_size <= 0:
         logger.error("Failed to receive protobuf, zero bytes recevied")
         exit(1)
 
-    data = sys.stdin.read(data_size)
+    data = stdin.read(data_size)
     if len(data) != data_size:
         logger.error("Didn't receive %d bytes from stdin", data_size)
         exit(1)
@@ -52,11 +70,100 @@ def recv_proto(proto):
     return parsed
 
 
-def container_lock(container_id, label="global"):
+def container_lock(container_id, shared=False, timeout=None):
+    """
+    Return a new `FileLock` for a container. Calls that change a container
+    take the lock exclusively, and calls that only look at it take it shared.
+    The timeout defaults to `CONTAINERIZER_LOCK_TIMEOUT` seconds, if set.
+    """
+
+    if timeout is None and environ().get("CONTAINERIZER_LOCK_TIMEOUT"):
+        timeout = float(environ()["CONTAINERIZER_LOCK_TIMEOUT"])
+
+    return FileLock(run_path("locks", container_id), shared=shared, timeout=timeout)
+
+
+def environ():
+    """
+    Return the environment of the current invocation. This is the process
+    environment, unless the command is being run on behalf of a client of the
+    `serve` daemon, in which case it's the environment of that client.
+    """
+
+    return getattr(_invocation, "environ", os.environ)
+
+
+def state_path(*parts):
+    """
+    Return a path inside the containerizer's state directory, which can be
+    configured with `CONTAINERIZER_STATE_DIR`.
+    """
+
+    directory = environ().get("CONTAINERIZER_STATE_DIR", DEFAULT_STATE_DIRECTORY)
+    return os.path.join(directory, *parts)
+
+
+def run_path(*parts):
+    """
+    Return a path inside the containerizer's run directory, for files that
+    only matter while the host is up, such as locks. It can be configured
+    with `CONTAINERIZER_RUN_DIR`.
     """
-    Return a new `lockfile.FileLock` for the container lock. The label parameter
-    is used to differentiate between multiple lock types for the same container.
+
+    directory = environ().get("CONTAINERIZER_RUN_DIR", DEFAULT_RUN_DIRECTORY)
+    return os.path.join(directory, *parts)
+
+
+def wait_process(proc, cancelled=None):
     """
+    Wait for a subprocess to exit and return its exit code. If the
+    `cancelled` event is set first, the process is terminated.
+    """
+
+    if cancelled is None:
+        return proc.wait()
+
+    while proc.poll() is None:
+        if cancelled.wait(CANCEL_POLL_INTERVAL):
+            logger.info("Terminating cancelled process %d", proc.pid)
+            proc.terminate()
+            proc.wait()
+
+    return proc.returncode
+
+
+@contextmanager
+def environment(env):
+    """
+    Make `environ` return the given environment in the current thread, for
+    the duration of the block.
+    """
+
+    previous = getattr(_invocation, "environ", None)
+    _invocation.environ = env
+
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _invocation.environ
+        else:
+            _invocation.environ = previous
+
+
+@contextmanager
+def invocation(stdin, stdout, env):
+    """
+    Redirect `recv_proto`, `send_proto` and `environ` for the current thread
+    to the given streams and environment, for the duration of the block.
+    """
+
+    _invocation.stdin = stdin
+    _invocation.stdout = stdout
 
-    lock_path = os.path.join("/tmp/docker-container-lock-%s-%s" % (label, container_id))
-    return lockfile.FileLock(lock_path)
+    try:
+        with environment(env):
+            yield
+    finally:
+        del _invocation.stdin
+        del _invocation.stdout
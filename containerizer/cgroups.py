@@ -1,42 +1,266 @@
 
+import io
 import os
+import errno
 import logging
+import resource
+import threading
+
+from collections import OrderedDict
+
+from containerizer import environ
 
 logger = logging.getLogger(__name__)
 
+CGROUP_ROOT = "/sys/fs/cgroup"
 
-def read_metrics(lxc_container_id, metric):
+# The number of cgroup control files kept open between reads, raised to fit
+# every file of a sweep (up to half the open file limit of the process)
+MAX_OPEN_HANDLES = 512
+
+
+class CgroupRecord(object):
     """
-    A method to retrieve metrics about a given linux container. Returns a
-    generator of key,value pairs for the given container metric.
+    The parsed contents of a cgroup control file. Flat keyed files such as
+    `memory.stat` have one key per line, single value files such as
+    `cpu.shares` have a single key of None. Values are kept as strings.
+    """
+
+    __slots__ = ("keys", "values")
+
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+
+    def get(self, key=None, default=None):
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            return default
+
+    def items(self):
+        return zip(self.keys, self.values)
+
+
+class CgroupHandle(object):
+    """
+    A cgroup control file that is opened once and can then be re-read any
+    number of times. Each read seeks back to the start of the file and reads
+    it into a buffer that is reused between reads, and the keys of the file
+    (which never change between reads) are only stored once.
+    """
+
+    __slots__ = ("path", "file", "buffer", "record", "lock", "device_keyed")
+
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.file = io.FileIO(path, "r")
+        self.buffer = bytearray(buffer_size)
+        self.record = None
+        self.lock = threading.Lock()
+        self.device_keyed = os.path.basename(path).startswith("blkio.")
+
+    def close(self):
+        # Wait for a read in progress, rather than close the file under it
+        with self.lock:
+            self.file.close()
+
+    def read(self):
+        """
+        Re-read the control file and return the updated `CgroupRecord`.
+        """
+
+        with self.lock:
+            while True:
+                self.file.seek(0)
+                size = self.file.readinto(self.buffer)
+                if size < len(self.buffer):
+                    break
+
+                # The file didn't fit in the buffer, so grow it and re-read
+                self.buffer = bytearray(len(self.buffer) * 2)
+
+            data = str(buffer(self.buffer, 0, size))
+            if self.device_keyed:
+                return self.parse(flatten_device_keys(data))
+            if "=" in data:
+                return self.parse(flatten_nested_keys(data))
+
+            return self.parse(data.split())
+
+    def parse(self, fields):
+        if len(fields) == 1:
+            keys, values = (None,), fields
+        elif len(fields) % 2 == 0:
+            keys, values = tuple(fields[0::2]), fields[1::2]
+        else:
+            raise Exception("Unknown metric syntax in %s %r" % (self.path, fields))
+
+        # Keep the keys from the previous read if they haven't changed
+        record = self.record
+        if record is not None and record.keys == keys:
+            record.values = values
+        else:
+            record = self.record = CgroupRecord(keys, values)
+
+        return record
+
+
+def flatten_nested_keys(data):
+    """
+    Flatten the contents of a nested keyed cgroup file, such as `io.stat` or
+    `memory.pressure`, into alternating keys and values. Each line is a key
+    followed by `name=value` pairs, which become keys of `<key>.<name>`.
     """
 
-    metric_keys = metric.split(".")
-    if len(metric_keys) < 2:
-        raise Exception("Invalid metric %r" % (metric))
+    fields = []
+    for line in data.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
 
-    path = os.path.join(
-        "/sys/fs/cgroup", metric_keys[0], "docker", lxc_container_id, metric
+        for pair in parts[1:]:
+            name, _, value = pair.partition("=")
+            fields.append("%s.%s" % (parts[0], name))
+            fields.append(value)
+
+    return fields
+
+
+def flatten_device_keys(data):
+    """
+    Flatten the contents of a v1 blkio file, such as
+    `blkio.throttle.io_service_bytes`, into alternating keys and values. Each
+    line is a device, an operation and a value, which become a key of
+    `<device>.<operation>`. The closing `Total` line is kept as it is.
+    """
+
+    fields = []
+    for line in data.splitlines():
+        parts = line.split()
+        if len(parts) == 3:
+            fields.append("%s.%s" % (parts[0], parts[1]))
+            fields.append(parts[2])
+        elif parts:
+            fields.extend(parts)
+
+    return fields
+
+
+def sum_device_keys(stats, *names):
+    """
+    Sum the values of the given per device keys, across every device.
+
+    >>> sum_device_keys({"8:0.Read": "1", "8:16.Read": "2", "8:0.Write": "3"}, "Read")
+    3
+    """
+
+    return sum(
+        int(value) for key, value in stats.iteritems()
+        if key.rpartition(".")[2] in names
     )
 
-    if not os.path.exists(path):
-        raise Exception("LXC metric file does not exist %r" % (path))
 
-    # Parse the individual keys out of the file
-    with open(path, "r") as f:
-        line = f.readline()
-        while line:
-            parts = line.strip().split(" ")
+_handles = OrderedDict()
+_handles_lock = threading.Lock()
+_handles_limit = MAX_OPEN_HANDLES
+
+
+def metric_path(lxc_container_id, metric):
+    return hierarchy().metric_path(lxc_container_id, metric)
+
+
+def open_handle(path):
+    """
+    Return an open `CgroupHandle` for the given control file, reusing one from
+    a previous call if possible. The least recently used handles are closed
+    once more than the limit are open.
+    """
+
+    with _handles_lock:
+        handle = _handles.pop(path, None)
+        if handle is None:
+            handle = CgroupHandle(path)
+
+        _handles[path] = handle
+
+        while len(_handles) > _handles_limit:
+            _, stale_handle = _handles.popitem(last=False)
+            stale_handle.close()
+
+    return handle
+
+
+def reserve_handles(count):
+    """
+    Raise the number of handles kept open to at least `count`, so the files
+    read by every sweep stay open between sweeps rather than evict each
+    other. It's capped at half the open file limit of the process.
+    """
+
+    global _handles_limit
+
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit != resource.RLIM_INFINITY:
+        count = min(count, soft_limit / 2)
+
+    with _handles_lock:
+        _handles_limit = max(_handles_limit, count)
 
-            if len(parts) == 1:
-                yield None, parts[0]
-            elif len(parts) == 2:
-                key, value = parts
-                yield key, value
-            else:
-                raise Exception("Unknown metric syntax %r %r" % (line, parts))
 
-            line = f.readline()
+def close_handles(lxc_container_id=None):
+    """
+    Close the open handles for a linux container, or every open handle.
+    """
+
+    with _handles_lock:
+        for path in _handles.keys():
+            if lxc_container_id is None or lxc_container_id in path:
+                _handles.pop(path).close()
+
+
+def read_record(path):
+    """
+    Read the cgroup control file at the given path, returning a `CgroupRecord`.
+    """
+
+    while True:
+        try:
+            handle = open_handle(path)
+            return handle.read()
+        except ValueError:
+            # Evicted and closed by another thread since it was opened, so
+            # open it again
+            if not handle.file.closed:
+                raise
+        except (IOError, OSError), e:
+            # The cgroup has gone away, so don't hold on to the handle
+            with _handles_lock:
+                handle = _handles.pop(path, None)
+            if handle is not None:
+                handle.close()
+
+            if e.errno in (errno.ENOENT, errno.ENODEV):
+                raise Exception("LXC metric file does not exist %r" % (path))
+            raise
+
+
+def cgroup_exists(lxc_container_id):
+    """
+    Return whether a linux container has a cgroup.
+    """
+
+    return hierarchy().cgroup_directory(lxc_container_id, "cpu") is not None
+
+
+def read_metrics(lxc_container_id, metric):
+    """
+    A method to retrieve metrics about a given linux container. Returns a
+    generator of key,value pairs for the given container metric.
+    """
+
+    for key, value in read_record(metric_path(lxc_container_id, metric)).items():
+        yield key, value
 
 
 def read_metric(lxc_container_id, metric, key=None):
@@ -45,35 +269,563 @@ def read_metric(lxc_container_id, metric, key=None):
     container.
     """
 
-    for metric_key, metric_value in read_metrics(lxc_container_id, metric):
-        if metric_key == key:
-            return metric_value
-
-    return None
+    return read_record(metric_path(lxc_container_id, metric)).get(key)
 
 
 def write_metric(lxc_container_id, metric, value):
     """
     Write a value to a group metric, for example changing the memory
-    limit. `memory.soft_limit_in_bytes`
+    limit. `memory.soft_limit_in_bytes`. The kernel rejects invalid values by
+    failing the write, so the value isn't read back.
     """
 
-    metric_keys = metric.split(".")
-    if len(metric_keys) < 2:
-        raise Exception("Invalid metric %r" % (metric))
-
-    path = os.path.join(
-        "/sys/fs/cgroup", metric_keys[0], "docker", lxc_container_id, metric
-    )
-
-    previous_value = read_metric(lxc_container_id, metric)
+    path = metric_path(lxc_container_id, metric)
     new_value = str(value)
 
-    logger.info("Updating cgroup metric %s from %r to %r", path, previous_value, new_value)
+    logger.info("Updating cgroup metric %s to %r", path, new_value)
 
     with open(path, "w") as f:
         f.write(new_value)
 
-    updated_value = read_metric(lxc_container_id, metric)
-    if updated_value != new_value:
-        raise Exception("Failed to write updated cgroup value to %s" % path)
+
+def sweep_metrics(lxc_container_ids, metrics):
+    """
+    Read the given metrics for many linux containers at once. Each cgroup
+    directory that holds containers is listed once, and only the files for
+    containers that exist in it are read. Returns a dictionary mapping each
+    container ID to a dictionary of metric name to a dictionary of key,value
+    pairs. Containers (or metrics) that don't exist are left out of the result.
+    """
+
+    backend = hierarchy()
+    wanted = set(lxc_container_ids)
+    results = {}
+
+    reserve_handles(len(wanted) * len(metrics))
+
+    # Group the metrics by the subsystem they live in
+    subsystems = {}
+    for metric in metrics:
+        subsystems.setdefault(backend.subsystem(metric), []).append(metric)
+
+    for subsystem, subsystem_metrics in subsystems.iteritems():
+        cgroups = backend.list_cgroups(subsystem)
+
+        for lxc_container_id in wanted.intersection(cgroups):
+            container_metrics = results.setdefault(lxc_container_id, {})
+            for metric in subsystem_metrics:
+                path = os.path.join(cgroups[lxc_container_id], metric)
+                try:
+                    container_metrics[metric] = dict(read_record(path).items())
+                except Exception:
+                    logger.error("Unable to read cgroup metric %s", path)
+
+    return results
+
+
+def list_directory(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+class CgroupV1Hierarchy(object):
+    """
+    The legacy cgroup hierarchy, with one mount per subsystem and docker's
+    cgroups at `<subsystem>/docker/<id>`.
+    """
+
+    version = 1
+
+    usage_metrics = (
+        "cpu.shares",
+        "cpuacct.stat",
+        "cpu.stat",
+        "memory.limit_in_bytes",
+        "memory.usage_in_bytes",
+        "memory.stat"
+    )
+
+    # Metrics only the exporter reports, that `usage` has no field for
+    exporter_metrics = (
+        "blkio.throttle.io_service_bytes",
+        "blkio.throttle.io_serviced"
+    )
+
+    # Metrics counting memory events, such as the OOM killer being invoked
+    event_metrics = (
+        "memory.oom_control",
+    )
+
+    cpu_burst_metric = "cpu.cfs_burst_us"
+
+    # Whether memory can be reclaimed from a container before its limit is
+    # lowered, rather than by lowering it
+    reclaims_memory = False
+
+    def subsystem(self, metric):
+        metric_keys = metric.split(".")
+        if len(metric_keys) < 2:
+            raise Exception("Invalid metric %r" % (metric))
+
+        return metric_keys[0]
+
+    def metric_path(self, lxc_container_id, metric):
+        return os.path.join(
+            CGROUP_ROOT, self.subsystem(metric), "docker", lxc_container_id, metric
+        )
+
+    def cgroup_directory(self, lxc_container_id, subsystem):
+        path = os.path.join(CGROUP_ROOT, subsystem, "docker", lxc_container_id)
+        return path if os.path.isdir(path) else None
+
+    def cgroup_directories(self, lxc_container_id):
+        """
+        Return a dictionary of subsystem to cgroup directory, for each
+        subsystem the containerizer reads that the container has a cgroup in.
+        """
+
+        directories = {}
+        for subsystem in set(map(self.subsystem, self.usage_metrics + self.exporter_metrics)):
+            directory = self.cgroup_directory(lxc_container_id, subsystem)
+            if directory is not None:
+                directories[subsystem] = directory
+
+        return directories
+
+    def list_cgroups(self, subsystem):
+        """
+        Return a dictionary of container ID to cgroup directory for every
+        container with a cgroup in the given subsystem.
+        """
+
+        docker_path = os.path.join(CGROUP_ROOT, subsystem, "docker")
+        return dict(
+            (name, os.path.join(docker_path, name))
+            for name in list_directory(docker_path)
+            if os.path.isdir(os.path.join(docker_path, name))
+        )
+
+    def usage_statistics(self, metrics, cpu_ticks):
+        """
+        Convert the metrics read for a container into a dictionary keyed by
+        `ResourceStatistics` field names.
+        """
+
+        usage = {}
+
+        shares = metrics.get("cpu.shares", {}).get(None)
+        if shares is not None:
+            usage["cpus_limit"] = float(shares) / 256
+
+        cpu_stats = metrics.get("cpuacct.stat", {})
+        if "user" in cpu_stats and "system" in cpu_stats:
+            usage["cpus_user_time_secs"] = float(cpu_stats["user"]) / cpu_ticks
+            usage["cpus_system_time_secs"] = float(cpu_stats["system"]) / cpu_ticks
+
+        cpu_stats = metrics.get("cpu.stat", {})
+        if "nr_periods" in cpu_stats:
+            usage["cpus_nr_periods"] = int(cpu_stats["nr_periods"])
+        if "nr_throttled" in cpu_stats:
+            usage["cpus_nr_throttled"] = int(cpu_stats["nr_throttled"])
+        if "throttled_time" in cpu_stats:
+            usage["cpus_throttled_time_secs"] = float(cpu_stats["throttled_time"]) / 1000000000
+
+        limit = metrics.get("memory.limit_in_bytes", {}).get(None)
+        if limit is not None:
+            usage["mem_limit_bytes"] = int(limit)
+
+        rss = metrics.get("memory.usage_in_bytes", {}).get(None)
+        if rss is not None:
+            usage["mem_rss_bytes"] = int(rss)
+
+        mem_stats = metrics.get("memory.stat", {})
+        if "total_cache" in mem_stats:
+            usage["mem_file_bytes"] = int(mem_stats["total_cache"])
+        if "total_rss" in mem_stats:
+            usage["mem_anon_bytes"] = int(mem_stats["total_rss"])
+        if "total_mapped_file" in mem_stats:
+            usage["mem_mapped_file_bytes"] = int(mem_stats["total_mapped_file"])
+
+        # Only I/O that bypasses the page cache is counted per cgroup by v1
+        io_bytes = metrics.get("blkio.throttle.io_service_bytes")
+        if io_bytes is not None:
+            usage["disk_read_bytes"] = sum_device_keys(io_bytes, "Read")
+            usage["disk_write_bytes"] = sum_device_keys(io_bytes, "Write")
+
+        io_ops = metrics.get("blkio.throttle.io_serviced")
+        if io_ops is not None:
+            usage["disk_read_ops"] = sum_device_keys(io_ops, "Read")
+            usage["disk_write_ops"] = sum_device_keys(io_ops, "Write")
+
+        return usage
+
+    def event_statistics(self, metrics):
+        """
+        Convert the event metrics read for a container into a dictionary of
+        counters and flags.
+        """
+
+        events = {}
+
+        oom_control = metrics.get("memory.oom_control", {})
+        if "oom_kill" in oom_control:  # Linux 4.13 and later
+            events["mem_oom_kills"] = int(oom_control["oom_kill"])
+        if "under_oom" in oom_control:
+            events["mem_under_oom"] = int(oom_control["under_oom"])
+
+        return events
+
+    def read_memory_limit(self, lxc_container_id):
+        return int(read_metric(lxc_container_id, "memory.limit_in_bytes"))
+
+    def read_memory_soft_limit(self, lxc_container_id):
+        return int(read_metric(lxc_container_id, "memory.soft_limit_in_bytes"))
+
+    def read_memory_usage(self, lxc_container_id):
+        return int(read_metric(lxc_container_id, "memory.usage_in_bytes"))
+
+    def read_memory_pressure(self, lxc_container_id):
+        """
+        Return the percentage of recent time tasks in the container were
+        stalled waiting for memory, or None if the kernel doesn't say.
+        """
+
+        return None
+
+    def reclaim_memory(self, lxc_container_id, amount):
+        """
+        Ask the kernel to reclaim memory from a container. The v1 hierarchy
+        can't be asked for a specific amount, and `memory.force_empty` would
+        drop the whole page cache of a running container, so nothing is done.
+        Lowering the limit reclaims instead, failing with EBUSY if it can't.
+        """
+
+        pass
+
+    def read_cpu_shares(self, lxc_container_id):
+        return int(read_metric(lxc_container_id, "cpu.shares"))
+
+    def write_memory_limit(self, lxc_container_id, limit):
+        write_metric(lxc_container_id, "memory.limit_in_bytes", limit)
+
+    def write_memory_soft_limit(self, lxc_container_id, limit):
+        write_metric(lxc_container_id, "memory.soft_limit_in_bytes", limit)
+
+    def write_cpu_shares(self, lxc_container_id, shares):
+        write_metric(lxc_container_id, "cpu.shares", shares)
+
+    def read_cpu_quota(self, lxc_container_id):
+        """
+        Return the CFS bandwidth limit of a container as a tuple of the quota
+        and period in microseconds, the quota is -1 if there's no limit.
+        """
+
+        return (int(read_metric(lxc_container_id, "cpu.cfs_quota_us")),
+                int(read_metric(lxc_container_id, "cpu.cfs_period_us")))
+
+    def read_cpu_burst(self, lxc_container_id):
+        """
+        Return how much unused quota a container may carry over to later
+        periods, in microseconds. Kernels before 5.14 don't support bursting,
+        so report none.
+        """
+
+        if not os.path.exists(metric_path(lxc_container_id, self.cpu_burst_metric)):
+            return 0
+
+        return int(read_metric(lxc_container_id, self.cpu_burst_metric))
+
+    def write_cpu_quota(self, lxc_container_id, quota, period):
+        """
+        Set the CFS bandwidth limit of a container, a quota of -1 removes it.
+        """
+
+        write_metric(lxc_container_id, "cpu.cfs_period_us", period)
+        write_metric(lxc_container_id, "cpu.cfs_quota_us", quota)
+
+    def write_cpuset(self, lxc_container_id, cpus):
+        """
+        Move a container on to the given CPUs, a kernel CPU list.
+        """
+
+        write_metric(lxc_container_id, "cpuset.cpus", cpus)
+
+    def write_cpu_burst(self, lxc_container_id, burst):
+        """
+        Set how much unused quota a container may carry over to later periods.
+        Returns False if the kernel doesn't support bursting.
+        """
+
+        if not os.path.exists(metric_path(lxc_container_id, self.cpu_burst_metric)):
+            logger.info("CPU burst isn't supported by the kernel, ignoring")
+            return False
+
+        write_metric(lxc_container_id, self.cpu_burst_metric, burst)
+        return True
+
+
+class CgroupV2Hierarchy(CgroupV1Hierarchy):
+    """
+    The unified cgroup hierarchy, with every controller's files in a single
+    directory per container. Docker puts containers at `docker/<id>` with the
+    cgroupfs driver, and at `system.slice/docker-<id>.scope` with systemd.
+    """
+
+    version = 2
+
+    usage_metrics = (
+        "cpu.weight",
+        "cpu.stat",
+        "memory.max",
+        "memory.current",
+        "memory.stat"
+    )
+
+    exporter_metrics = (
+        "cpu.pressure",
+        "memory.pressure",
+        "io.stat"
+    )
+
+    event_metrics = (
+        "memory.events",
+    )
+
+    cpu_burst_metric = "cpu.max.burst"
+
+    reclaims_memory = True
+
+    def subsystem(self, metric):
+        return None
+
+    def metric_path(self, lxc_container_id, metric):
+        directory = self.cgroup_directory(lxc_container_id)
+        if directory is None:
+            directory = os.path.join(CGROUP_ROOT, "docker", lxc_container_id)
+
+        return os.path.join(directory, metric)
+
+    def cgroup_directory(self, lxc_container_id, subsystem=None):
+        for path in (os.path.join(CGROUP_ROOT, "docker", lxc_container_id),
+                     os.path.join(CGROUP_ROOT, "system.slice",
+                                  "docker-%s.scope" % lxc_container_id)):
+            if os.path.isdir(path):
+                return path
+
+        return None
+
+    def cgroup_directories(self, lxc_container_id):
+        directory = self.cgroup_directory(lxc_container_id)
+        return {"unified": directory} if directory is not None else {}
+
+    def list_cgroups(self, subsystem=None):
+        cgroups = {}
+
+        docker_path = os.path.join(CGROUP_ROOT, "docker")
+        for name in list_directory(docker_path):
+            if os.path.isdir(os.path.join(docker_path, name)):
+                cgroups[name] = os.path.join(docker_path, name)
+
+        slice_path = os.path.join(CGROUP_ROOT, "system.slice")
+        for name in list_directory(slice_path):
+            if name.startswith("docker-") and name.endswith(".scope"):
+                cgroups[name[7:-6]] = os.path.join(slice_path, name)
+
+        return cgroups
+
+    def usage_statistics(self, metrics, cpu_ticks):
+        usage = {}
+
+        weight = metrics.get("cpu.weight", {}).get(None)
+        if weight is not None:
+            usage["cpus_limit"] = float(weight_to_shares(int(weight))) / 256
+
+        cpu_stats = metrics.get("cpu.stat", {})
+        if "user_usec" in cpu_stats and "system_usec" in cpu_stats:
+            usage["cpus_user_time_secs"] = float(cpu_stats["user_usec"]) / 1000000
+            usage["cpus_system_time_secs"] = float(cpu_stats["system_usec"]) / 1000000
+        if "nr_periods" in cpu_stats:
+            usage["cpus_nr_periods"] = int(cpu_stats["nr_periods"])
+        if "nr_throttled" in cpu_stats:
+            usage["cpus_nr_throttled"] = int(cpu_stats["nr_throttled"])
+        if "throttled_usec" in cpu_stats:
+            usage["cpus_throttled_time_secs"] = float(cpu_stats["throttled_usec"]) / 1000000
+
+        limit = metrics.get("memory.max", {}).get(None)
+        if limit is not None:
+            usage["mem_limit_bytes"] = UNLIMITED_MEMORY if limit == "max" else int(limit)
+
+        rss = metrics.get("memory.current", {}).get(None)
+        if rss is not None:
+            usage["mem_rss_bytes"] = int(rss)
+
+        mem_stats = metrics.get("memory.stat", {})
+        if "file" in mem_stats:
+            usage["mem_file_bytes"] = int(mem_stats["file"])
+        if "anon" in mem_stats:
+            usage["mem_anon_bytes"] = int(mem_stats["anon"])
+        if "file_mapped" in mem_stats:
+            usage["mem_mapped_file_bytes"] = int(mem_stats["file_mapped"])
+
+        io_stats = metrics.get("io.stat")
+        if io_stats is not None:
+            usage["disk_read_bytes"] = sum_device_keys(io_stats, "rbytes")
+            usage["disk_write_bytes"] = sum_device_keys(io_stats, "wbytes")
+            usage["disk_read_ops"] = sum_device_keys(io_stats, "rios")
+            usage["disk_write_ops"] = sum_device_keys(io_stats, "wios")
+
+        # Pressure stall information has no equivalent in the v1 hierarchy,
+        # and no field in ResourceStatistics, so it's only swept for export
+        for resource in ("cpu", "memory"):
+            pressure = metrics.get("%s.pressure" % resource, {})
+            for key in ("some.avg10", "full.avg10"):
+                if key in pressure:
+                    usage["%s_pressure_%s" % (resource, key.replace(".", "_"))] = \
+                        float(pressure[key])
+
+        return usage
+
+    def event_statistics(self, metrics):
+        events = {}
+
+        memory_events = metrics.get("memory.events", {})
+        if "oom_kill" in memory_events:
+            events["mem_oom_kills"] = int(memory_events["oom_kill"])
+        if "oom" in memory_events:
+            events["mem_oom_events"] = int(memory_events["oom"])
+        if "high" in memory_events:
+            events["mem_high_events"] = int(memory_events["high"])
+
+        return events
+
+    def read_memory_limit(self, lxc_container_id):
+        limit = read_metric(lxc_container_id, "memory.max")
+        return UNLIMITED_MEMORY if limit == "max" else int(limit)
+
+    def read_memory_soft_limit(self, lxc_container_id):
+        limit = read_metric(lxc_container_id, "memory.low")
+        return UNLIMITED_MEMORY if limit == "max" else int(limit)
+
+    def read_memory_usage(self, lxc_container_id):
+        return int(read_metric(lxc_container_id, "memory.current"))
+
+    def read_memory_pressure(self, lxc_container_id):
+        return float(read_metric(lxc_container_id, "memory.pressure", "some.avg10"))
+
+    def reclaim_memory(self, lxc_container_id, amount):
+        write_metric(lxc_container_id, "memory.reclaim", amount)
+
+    def read_cpu_shares(self, lxc_container_id):
+        return weight_to_shares(int(read_metric(lxc_container_id, "cpu.weight")))
+
+    def write_memory_limit(self, lxc_container_id, limit):
+        write_metric(lxc_container_id, "memory.max", limit)
+
+    def write_memory_soft_limit(self, lxc_container_id, limit):
+        write_metric(lxc_container_id, "memory.low", limit)
+
+    def write_cpu_shares(self, lxc_container_id, shares):
+        write_metric(lxc_container_id, "cpu.weight", shares_to_weight(shares))
+
+    def read_cpu_quota(self, lxc_container_id):
+        quota, period = list(read_metrics(lxc_container_id, "cpu.max"))[0]
+        return -1 if quota == "max" else int(quota), int(period)
+
+    def write_cpu_quota(self, lxc_container_id, quota, period):
+        if quota < 0:
+            quota = "max"
+        write_metric(lxc_container_id, "cpu.max", "%s %d" % (quota, period))
+
+
+CPU_SHARES_MODE = "shares"
+CPU_QUOTA_MODE = "quota"
+
+# The CFS period in microseconds, and the smallest quota the kernel accepts
+DEFAULT_CPU_PERIOD = 100000
+MIN_CPU_QUOTA = 1000
+
+# The memory limit the v1 hierarchy reports for an unlimited cgroup. The v2
+# hierarchy reports "max", which is translated to this for consistency.
+UNLIMITED_MEMORY = 9223372036854771712
+
+
+def shares_to_weight(shares):
+    """
+    Convert v1 `cpu.shares` to a v2 `cpu.weight`, the same way docker does.
+    """
+
+    return 1 + ((int(shares) - 2) * 9999) / 262142
+
+
+def weight_to_shares(weight):
+    """
+    Convert a v2 `cpu.weight` back to v1 `cpu.shares`. Around 26 shares map to
+    each weight, so this returns the middle of the range for the given weight.
+    """
+
+    return 2 + ((int(weight) - 1) * 262142 + 131071) / 9999
+
+
+def cpu_limit_mode():
+    """
+    Return how the `cpus` resource of a container is enforced, set with
+    `CONTAINERIZER_CPU_LIMIT`. With "shares" (the default) a container gets
+    its share of the CPU under contention but can use every idle core, with
+    "quota" it's also held to its `cpus` by a CFS bandwidth limit.
+    """
+
+    mode = environ().get("CONTAINERIZER_CPU_LIMIT", CPU_SHARES_MODE)
+    if mode not in (CPU_SHARES_MODE, CPU_QUOTA_MODE):
+        raise Exception("Unknown CPU limit mode %r" % mode)
+
+    return mode
+
+
+def cpu_bandwidth(cpus):
+    """
+    Return the CFS bandwidth limit enforcing a hard limit of `cpus`, as a
+    tuple of the quota, period and burst in microseconds. The period is set
+    with `CONTAINERIZER_CPU_PERIOD`, and `CONTAINERIZER_CPU_BURST` is the
+    fraction of its quota a container may save up from idle periods and
+    spend on top of its quota later.
+
+    >>> cpu_bandwidth(1.5)
+    (150000, 100000, 0)
+    >>> cpu_bandwidth(0.001)
+    (1000, 100000, 0)
+    """
+
+    period = int(environ().get("CONTAINERIZER_CPU_PERIOD", DEFAULT_CPU_PERIOD))
+    burst = float(environ().get("CONTAINERIZER_CPU_BURST", 0))
+
+    quota = max(int(round(cpus * period)), MIN_CPU_QUOTA)
+
+    # The kernel won't let the burst exceed the quota
+    return quota, period, int(quota * min(max(burst, 0.0), 1.0))
+
+
+HIERARCHIES = {
+    "1": CgroupV1Hierarchy(),
+    "2": CgroupV2Hierarchy()
+}
+
+_detected_versions = {}
+
+
+def hierarchy():
+    """
+    Return the cgroup hierarchy backend in use. This can be forced with
+    `CONTAINERIZER_CGROUP_VERSION`, otherwise the unified (v2) hierarchy is
+    used if it's mounted at the cgroup root.
+    """
+
+    version = environ().get("CONTAINERIZER_CGROUP_VERSION")
+    if not version:
+        version = _detected_versions.get(CGROUP_ROOT)
+        if version is None:
+            unified = os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+            version = _detected_versions[CGROUP_ROOT] = "2" if unified else "1"
+
+    return HIERARCHIES[version]
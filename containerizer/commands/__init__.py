@@ -2,8 +2,11 @@
 # Import all of the relevent sub-commands
 import containerizer.commands.containers
 import containerizer.commands.destroy
+import containerizer.commands.exporter
 import containerizer.commands.launch
+import containerizer.commands.reap
 import containerizer.commands.recover
+import containerizer.commands.serve
 import containerizer.commands.update
 import containerizer.commands.usage
 import containerizer.commands.wait
@@ -11,8 +11,10 @@ Containerizer subcommand to list all running containers.
 import logging
 
 from containerizer import app, send_proto
-from containerizer.docker import invoke_docker, PIPE
+from containerizer.docker import docker_client, DockerAPIError, CONTAINER_LABEL
 from containerizer.proto import Containers
+from containerizer.state import list_container_states
+from containerizer.pool import docker_labels, list_claims
 
 logger = logging.getLogger(__name__)
 
@@ -24,20 +26,54 @@ def containers():
     which lists all of the container IDs.
     """
 
-    stdout, _, exit_code = invoke_docker("ps", stdout=PIPE, stderr=PIPE)
-    if exit_code > 0:
-        logger.error("Docker returned a bad status code (%d)" % exit_code)
+    try:
+        docker_containers = list_mesos_containers()
+    except DockerAPIError, e:
+        logger.error("Failed to list containers: %s", e)
         exit(1)
 
-    send_proto(parse_docker_ps(stdout))
+    send_proto(parse_container_list(docker_containers))
 
 
-def parse_docker_ps(stream):
+def list_mesos_containers():
+    """
+    Return the docker container list entries of the running containers that
+    mesos launched. Containers are found by their label, with one more call
+    for any containers the state records know of that weren't labelled when
+    they were launched, or were claimed from the pool.
+    """
+
+    client = docker_client()
+    docker_containers = client.list_containers(filters={"label": [CONTAINER_LABEL]})
+
+    labelled = set(container["Id"] for container in docker_containers)
+    docker_ids = [record.get("docker_id") for record in list_container_states().itervalues()]
+    docker_ids.extend(list_claims())
+    unlabelled = []
+    for docker_id in docker_ids:
+        if docker_id and docker_id not in labelled and docker_id not in unlabelled:
+            unlabelled.append(docker_id)
+
+    if unlabelled:
+        docker_containers.extend(client.list_containers(filters={"id": unlabelled}))
+
+    return docker_containers
+
+
+def parse_container_list(docker_containers):
+    """
+    Build a Containers proto from the container list returned by the docker
+    API. The mesos container ID is taken from the container's label, or its
+    name for containers without one. Names are prefixed with a slash by docker.
+    """
+
     running_containers = Containers()
 
-    stream.readline()  # Read off the header
-    for line in stream:
-        container_id = line.rstrip().split(" ")[-1]
+    for docker_container in docker_containers:
+        container_id = docker_labels(docker_container).get(CONTAINER_LABEL)
+        if not container_id:
+            names = docker_container.get("Names") or []
+            container_id = names[0].lstrip("/") if names else ""
 
         if len(container_id) > 0:
             container = running_containers.containers.add()
@@ -11,43 +11,62 @@ Containerizer subcommand to destroy a container.
 
 import logging
 
-from containerizer import app, recv_proto, container_lock
-from containerizer.docker import invoke_docker, PIPE
+from containerizer import app, recv_proto, container_lock, environ
+from containerizer.docker import docker_client, DockerAPIError
+from containerizer.ids import cached_container_id, forget_container_id
+from containerizer.cgroups import close_handles
+from containerizer.cpusets import release_cpuset
 from containerizer.proto import Destroy
+from containerizer.reaper import enqueue_removal, wake_reaper
 
 logger = logging.getLogger(__name__)
 
+# Seconds a container has to exit after SIGTERM before it's sent SIGKILL
+DEFAULT_STOP_TIMEOUT = 10
+
 
 @app.command()
 def destroy():
     """
-    Kill and remove a container.
+    Stop a container, leaving it to be removed in the background.
     """
 
     destroy = recv_proto(Destroy)
 
     # Acquire a lock for this container
-    with container_lock(destroy.container_id.value):
+    with container_lock(destroy.container_id.value) as lock:
         success = destroy_container(destroy.container_id)
 
+        # The container is gone, so is the need for its lock
+        if success:
+            lock.remove()
+
     if not success:
         exit(1)
 
+    wake_reaper()
+
 
 def destroy_container(container_id):
 
-    logger.info("Ensuring container %s is killed", container_id.value)
+    client = docker_client()
+    timeout = int(environ().get("CONTAINERIZER_STOP_TIMEOUT", DEFAULT_STOP_TIMEOUT))
 
-    stdout, _, return_code = invoke_docker("kill", [container_id.value], stdout=PIPE)
-    if return_code > 0:
-        logger.error("Failed to kill container, bad exit code (%d)", return_code)
+    logger.info("Stopping container %s", container_id.value)
+
+    try:
+        client.stop_container(container_id.value, timeout=timeout)
+    except DockerAPIError, e:
+        logger.error("Failed to stop container: %s", e)
         return False
 
-    logger.info("Removing container %s", container_id.value)
+    # Removing a container can take a while, so it's left to the reaper
+    lxc_container_id = cached_container_id(container_id.value)
+    if lxc_container_id:
+        close_handles(lxc_container_id)
 
-    stdout, _, return_code = invoke_docker("rm", [container_id.value], stdout=PIPE)
-    if return_code > 0:
-        logger.error("Failed to remove container, bad exit code (%d)", return_code)
-        return False
+    enqueue_removal(lxc_container_id or container_id.value)
+    release_cpuset(container_id.value)
+    forget_container_id(container_id.value)
 
     return True
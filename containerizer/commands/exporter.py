@@ -0,0 +1,282 @@
+"""
+                            _
+  _____  ___ __   ___  _ __| |_ ___ _ __
+ / _ \ \/ / '_ \ / _ \| '__| __/ _ \ '__|
+|  __/>  <| |_) | (_) | |  | ||  __/ |
+ \___/_/\_\ .__/ \___/|_|   \__\___|_|
+          |_|
+
+Containerizer subcommand to serve the resource usage of every running
+container over HTTP, in the Prometheus text exposition format. The cgroup
+hierarchy is swept once per scrape interval no matter how often, or by how
+many, `/metrics` is scraped.
+"""
+
+import os
+import time
+import logging
+import threading
+import SocketServer
+import BaseHTTPServer
+
+from containerizer import app, environ
+from containerizer.cgroups import hierarchy, sweep_metrics, close_handles
+from containerizer.network import network_statistics
+from containerizer.state import list_container_states
+from containerizer.events import PRESSURE_LEVELS
+from containerizer.pool import docker_labels
+from containerizer.docker import docker_client, DockerAPIError, FRAMEWORK_LABEL, \
+    EXECUTOR_LABEL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORTER_ADDRESS = "0.0.0.0:9105"
+DEFAULT_EXPORTER_INTERVAL = 15
+
+# The exported metrics, as (usage key, metric name, type, help)
+METRICS = (
+    ("cpus_limit", "containerizer_cpu_limit", "gauge",
+     "CPU shares of the container, in cpus."),
+    ("cpus_user_time_secs", "containerizer_cpu_user_seconds_total", "counter",
+     "CPU time spent in user mode."),
+    ("cpus_system_time_secs", "containerizer_cpu_system_seconds_total", "counter",
+     "CPU time spent in kernel mode."),
+    ("cpus_nr_periods", "containerizer_cpu_periods_total", "counter",
+     "CFS enforcement periods that have elapsed."),
+    ("cpus_nr_throttled", "containerizer_cpu_throttled_periods_total", "counter",
+     "CFS enforcement periods in which the container was throttled."),
+    ("cpus_throttled_time_secs", "containerizer_cpu_throttled_seconds_total", "counter",
+     "Time the container was throttled for."),
+    ("cpu_pressure_some_avg10", "containerizer_cpu_pressure_some_avg10", "gauge",
+     "Percentage of the last 10 seconds some tasks were stalled on CPU."),
+    ("mem_limit_bytes", "containerizer_memory_limit_bytes", "gauge",
+     "Memory limit of the container."),
+    ("mem_rss_bytes", "containerizer_memory_usage_bytes", "gauge",
+     "Memory used by the container."),
+    ("mem_anon_bytes", "containerizer_memory_anon_bytes", "gauge",
+     "Anonymous memory used by the container."),
+    ("mem_file_bytes", "containerizer_memory_file_bytes", "gauge",
+     "Page cache used by the container."),
+    ("mem_mapped_file_bytes", "containerizer_memory_mapped_file_bytes", "gauge",
+     "Memory mapped files used by the container."),
+    ("memory_pressure_some_avg10", "containerizer_memory_pressure_some_avg10", "gauge",
+     "Percentage of the last 10 seconds some tasks were stalled on memory."),
+    ("memory_pressure_full_avg10", "containerizer_memory_pressure_full_avg10", "gauge",
+     "Percentage of the last 10 seconds all tasks were stalled on memory."),
+    ("mem_under_oom", "containerizer_memory_under_oom", "gauge",
+     "Whether the container is currently out of memory."),
+    ("mem_oom_events", "containerizer_memory_oom_events_total", "counter",
+     "Times the container hit its memory limit and failed to reclaim."),
+    ("mem_oom_kills", "containerizer_memory_oom_kills_total", "counter",
+     "Processes in the container killed by the OOM killer."),
+    ("mem_high_events", "containerizer_memory_high_events_total", "counter",
+     "Times the container was throttled for exceeding its soft memory limit."),
+    ("mem_pressure_medium_events", "containerizer_memory_pressure_medium_events_total",
+     "counter", "Notifications of medium memory pressure, while the container was waited on."),
+    ("mem_pressure_critical_events", "containerizer_memory_pressure_critical_events_total",
+     "counter", "Notifications of critical memory pressure, while the container was waited on."),
+    ("disk_read_bytes", "containerizer_disk_read_bytes_total", "counter",
+     "Bytes read from block devices."),
+    ("disk_write_bytes", "containerizer_disk_write_bytes_total", "counter",
+     "Bytes written to block devices."),
+    ("disk_read_ops", "containerizer_disk_reads_total", "counter",
+     "Reads from block devices."),
+    ("disk_write_ops", "containerizer_disk_writes_total", "counter",
+     "Writes to block devices."),
+    ("net_rx_bytes", "containerizer_network_receive_bytes_total", "counter",
+     "Bytes received, for containers with their own network."),
+    ("net_rx_packets", "containerizer_network_receive_packets_total", "counter",
+     "Packets received."),
+    ("net_rx_errors", "containerizer_network_receive_errors_total", "counter",
+     "Errors receiving packets."),
+    ("net_rx_dropped", "containerizer_network_receive_dropped_total", "counter",
+     "Received packets dropped."),
+    ("net_tx_bytes", "containerizer_network_transmit_bytes_total", "counter",
+     "Bytes transmitted, for containers with their own network."),
+    ("net_tx_packets", "containerizer_network_transmit_packets_total", "counter",
+     "Packets transmitted."),
+    ("net_tx_errors", "containerizer_network_transmit_errors_total", "counter",
+     "Errors transmitting packets."),
+    ("net_tx_dropped", "containerizer_network_transmit_dropped_total", "counter",
+     "Transmitted packets dropped."),
+)
+
+
+@app.command()
+def exporter():
+    """
+    Serve container resource usage for Prometheus on /metrics.
+    """
+
+    address = environ().get("CONTAINERIZER_EXPORTER_ADDRESS", DEFAULT_EXPORTER_ADDRESS)
+    interval = float(environ().get("CONTAINERIZER_EXPORTER_INTERVAL", DEFAULT_EXPORTER_INTERVAL))
+
+    host, _, port = address.rpartition(":")
+    server = ExporterServer((host, int(port)), MetricsCache(interval))
+
+    logger.info("Serving container metrics on http://%s/metrics", address)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class MetricsCache(object):
+    """
+    Holds the most recent rendering of the metrics, sampling again once it's
+    older than the interval. Scrapes that arrive while a sample is being taken
+    wait for it rather than taking their own.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.sampled_at = None
+        self.text = None
+        self.labels = {}  # Docker ID to the labels of the container
+        self.cpu_ticks = os.sysconf("SC_CLK_TCK")
+
+    def get(self):
+        with self.lock:
+            if self.sampled_at is None or time.time() - self.sampled_at >= self.interval:
+                started = time.time()
+                self.text = self.sample()
+                self.sampled_at = time.time()
+                logger.info("Sampled container metrics in %.3fs", self.sampled_at - started)
+
+            return self.text
+
+    def sample(self):
+        containers = docker_client().list_containers()
+
+        labels = {}
+        for container in containers:
+            docker_id = container["Id"]
+            labels[docker_id] = self.labels.get(docker_id) or container_labels(container)
+
+        # Forget the open cgroup files of containers that have gone away
+        for docker_id in set(self.labels) - set(labels):
+            close_handles(docker_id)
+        self.labels = labels
+
+        backend = hierarchy()
+        metrics = sweep_metrics(labels.keys(), backend.usage_metrics +
+                                backend.exporter_metrics + backend.event_metrics)
+
+        # Memory pressure is only known from the events recorded by `wait`
+        memory_events = dict(
+            (record.get("docker_id"), record.get("memory_events") or {})
+            for record in list_container_states().itervalues()
+        )
+
+        samples = []
+        for docker_id, container_metrics in metrics.iteritems():
+            usage = backend.usage_statistics(container_metrics, self.cpu_ticks)
+            usage.update(backend.event_statistics(container_metrics))
+            usage.update(network_statistics(docker_id))
+            for level in PRESSURE_LEVELS:
+                name = "pressure_%s_events" % level
+                if name in memory_events.get(docker_id, {}):
+                    usage["mem_%s" % name] = memory_events[docker_id][name]
+            samples.append((labels[docker_id], usage))
+
+        return render_metrics(samples)
+
+
+def container_labels(container):
+    """
+    Return the labels to export for a container from the docker container
+    list, recovering the framework and executor from the environment of the
+    container when docker has no labels for them.
+    """
+
+    names = container.get("Names") or []
+    mesos_labels = docker_labels(container)
+
+    labels = {
+        "container_id": names[0].lstrip("/") if names else container["Id"],
+        "framework_id": mesos_labels.get(FRAMEWORK_LABEL, ""),
+        "executor_id": mesos_labels.get(EXECUTOR_LABEL, "")
+    }
+
+    if not labels["framework_id"] or not labels["executor_id"]:
+        try:
+            info = docker_client().inspect_container(container["Id"])
+        except DockerAPIError, e:
+            logger.error("Failed to inspect container %s: %s", container["Id"], e)
+            return labels
+
+        env = dict(
+            variable.split("=", 1)
+            for variable in (info.get("Config") or {}).get("Env") or []
+            if "=" in variable
+        )
+        labels["framework_id"] = labels["framework_id"] or env.get("MESOS_FRAMEWORK_ID", "")
+        labels["executor_id"] = labels["executor_id"] or env.get("MESOS_EXECUTOR_ID", "")
+
+    return labels
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_metrics(samples):
+    """
+    Render a list of (labels, usage) tuples in the Prometheus text format.
+    """
+
+    lines = [
+        "# HELP containerizer_containers Running containers with a cgroup.",
+        "# TYPE containerizer_containers gauge",
+        "containerizer_containers %d" % len(samples)
+    ]
+
+    for key, name, metric_type, description in METRICS:
+        values = [(labels, usage[key]) for labels, usage in samples if key in usage]
+        if not values:
+            continue
+
+        lines.append("# HELP %s %s" % (name, description))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for labels, value in values:
+            lines.append("%s{%s} %s" % (name, ",".join(
+                "%s=\"%s\"" % (label, escape_label(labels[label]))
+                for label in sorted(labels)
+            ), repr(float(value))))
+
+    return "\n".join(lines) + "\n"
+
+
+class ExporterHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        try:
+            body = self.server.cache.get()
+        except Exception:
+            logger.exception("Failed to sample container metrics")
+            self.send_error(500)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class ExporterServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ExporterHandler)
+        self.cache = cache
@@ -9,16 +9,42 @@ Containerizer subcommand to launch a new container.
 """
 
 import os
+import sys
+import time
+import Queue
+import bisect
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from urlparse import urlparse
 
-from containerizer import app, recv_proto, container_lock
-from containerizer.docker import invoke_docker
-from containerizer.proto import Launch
+from containerizer import app, recv_proto, container_lock, environ, environment
+from containerizer.docker import invoke_docker, docker_client, PIPE, CONTAINER_LABEL, \
+    FRAMEWORK_LABEL, EXECUTOR_LABEL
+from containerizer.cgroups import hierarchy, cpu_limit_mode, cpu_bandwidth, CPU_QUOTA_MODE
+from containerizer.images import ensure_image, read_index, image_digest
+from containerizer.state import update_container_state
+from containerizer.cpusets import allocate_cpuset, release_cpuset, apply_cpuset, \
+    format_cpu_list, cpuset_mode, cpuset_lock, NO_CPUSETS
+from containerizer.logs import docker_log_arguments, sandbox_command
+from containerizer.pool import pool_enabled, claim_pooled_container, offer_pool_shape, \
+    discard_pooled, pooled_command, write_environment_file, bind_sandbox, remove_link, \
+    record_claim
+from containerizer.commands.update import update_container
+from containerizer.proto import Launch, ContainerInfo, Volume, Resource
 from containerizer.fetcher import fetch_uris
 
 logger = logging.getLogger(__name__)
 
+MESOS_ENVIRONMENT = ["MESOS_FRAMEWORK_ID", "MESOS_EXECUTOR_ID",
+                     "MESOS_SLAVE_ID", "MESOS_CHECKPOINT",
+                     "MESOS_SLAVE_PID", "MESOS_RECOVERY_TIMEOUT",
+                     "MESOS_NATIVE_LIBRARY"]
+
+# How many compiled launch templates are kept, in the `serve` daemon
+MAX_LAUNCH_TEMPLATES = 128
+
 
 @app.command()
 def launch():
@@ -33,186 +59,690 @@ def launch():
 
         logger.info("Preparing to launch container %s", launch.container_id.value)
 
-        try:
-            run_arguments = build_docker_args(launch)
-        except Exception, e:
-            logger.error("Caught exception: %s", e)
-            raise  # Re-raise the exception
+        # Take a warm container from the pool, if one of this shape is waiting
+        pooled = None
+        if pool_enabled():
+            pooled = claim_pooled_container(pool_key(launch))
+
+        if pooled:
+            try:
+                launch_pooled(launch, pooled)
+            except Exception, e:
+                logger.error("Failed to launch pooled container %s: %s", pooled["name"], e)
+                release_cpuset(launch.container_id.value)
+                discard_pooled(pooled)
+                exit(1)
+        else:
+            try:
+                run_arguments = build_docker_args(launch)
+            except Exception, e:
+                logger.error("Caught exception: %s", e)
+                release_cpuset(launch.container_id.value)
+                raise  # Re-raise the exception
+
+            logger.info("Launching docker container")
+            stdout, _, return_code = invoke_docker("run", run_arguments, stdout=PIPE)
+
+            if return_code > 0:
+                logger.error("Failed to launch container")
+                release_cpuset(launch.container_id.value)
+                exit(1)
+
+            # Docker prints the full ID of the new container
+            lxc_container_id = stdout.read().strip()
+            logger.info("Launched container with ID %s", lxc_container_id)
+
+            # There's no `docker run` option for the CFS burst, so it's set
+            # once the cgroup exists. The container is running by now, so
+            # failing to set it is left for a later update to retry.
+            limits = launch_limits(*launch_resources(launch)[:2])
+            if limits.get("cpu_burst"):
+                try:
+                    if not hierarchy().write_cpu_burst(lxc_container_id, limits["cpu_burst"]):
+                        limits["cpu_burst"] = 0
+                except (IOError, OSError), e:
+                    logger.error("Failed to set the CPU burst of container %s: %s",
+                                 lxc_container_id, e)
+                    limits["cpu_burst"] = 0
+
+            record_launch(launch, lxc_container_id, limits=limits)
+
+        # Keep containers of this shape warm for the launches that follow
+        if pool_enabled():
+            offer_launch_shape(launch)
 
-        logger.info("Launching docker container")
-        _, _, return_code = invoke_docker("run", run_arguments)
 
-        if return_code > 0:
-            logger.error("Failed to launch container")
-            exit(1)
+def build_docker_args(launch):
 
+    # The parts of the arguments that only depend on the shape of the launch
+    # are compiled once, and filled in with the values of this one
+    template = launch_template(launch)
 
-def build_docker_args(launch):
+    if launch.HasField("executor_info"):
+        uris = launch.executor_info.command.uris
+    else:
+        logger.info("No executor given, launching with mesos-executor")
+        uris = launch.task_info.command.uris
 
-    # Build up the docker arguments
-    arguments = []
+    # Check the launch can go ahead before fetching or pulling anything
+    cpu_shares, max_memory, ports = launch_resources(launch)
+    port_mappings = launch_port_mappings(launch, ports)
 
-    # Set the container ID
-    arguments.extend([
-        "--name", launch.container_id.value
+    # Fetching the URIs and pulling the image are independent and both I/O
+    # bound, so they happen in the background while the arguments are built.
+    started = time.time()
+    phases, done, cancelled = start_phases([
+        ("fetch", lambda cancelled: fetch_sandbox(launch.directory, uris, cancelled)),
+        ("pull", lambda cancelled: ensure_image(template["image"], cancelled))
     ])
 
-    container_info = None
+    try:
+        arguments = launch_arguments(launch, template, cpu_shares, max_memory, ports,
+                                     port_mappings)
+    except Exception:
+        cancelled.set()
+        raise
 
-    # Figure out where the executor is
-    if launch.HasField("executor_info"):
-        executor = launch.executor_info.command.value
-        uris = launch.executor_info.command.uris
+    logger.info("Built docker arguments in %.3fs", time.time() - started)
 
-        # Environment variables
-        for env in launch.executor_info.command.environment.variables:
-            arguments.extend([
-                "-e",
-                "%s=%s" % (env.name, env.value)
-            ])
+    # Wait for the image and the sandbox to be ready
+    wait_for_phases(phases, done, cancelled)
+    logger.info("Prepared launch in %.3fs", time.time() - started)
 
-        if launch.executor_info.HasField("container"):
-            container_info = launch.executor_info.container
-    else:
-        logger.info("No executor given, launching with mesos-executor")
-        executor = "%s/mesos-executor" % os.environ['MESOS_LIBEXEC_DIRECTORY']
-        uris = launch.task_info.command.uris
+    run_arguments = [
+        "-d",  # Enable daemon mode
+    ]
 
-        # Environment variables
-        for env in launch.task_info.command.environment.variables:
-            arguments.extend([
-                "-e",
-                "%s=%s" % (env.name, env.value)
-            ])
+    run_arguments.extend(arguments)
+    run_arguments.extend(template["extra_args"])
+    run_arguments.append(template["image"])
+    run_arguments.extend(["sh", "-c", sandbox_command(template["executor"],
+                                                      template["extra_args"])])
 
-    # Pull out the ContainerInfo from either the task or the executor
-    if launch.executor_info.HasField("container"):
-        container_info = launch.executor_info.container
-    elif launch.task_info.HasField("container"):
-        container_info = launch.task_info.container
+    return run_arguments
 
-    # Pull out DockerInfo if it's there
-    docker_info = None
-    if container_info and container_info.type == 1:  # ContainerInfo.Type.DOCKER
-        docker_info = container_info.docker
 
-    # Configure the docker network to share the hosts
-    net = "host"
+def launch_port_mappings(launch, ports):
+    """
+    Return the `docker run` arguments of the port mappings of a launch, which
+    are given host ports from its resources.
+    """
+
+    arguments = []
+
+    _, docker_info = resolve_container_info(launch)
     if docker_info:
-        if docker_info.network == 1:  # DockerInfo.Network.HOST
-            pass
-        elif docker_info.network == 2:  # DockerInfo.Network.BRIDGE
-            net = "bridge"
-        elif docker_info.network == 3:  # DockerInfo.Network.NONE
-            net = "none"
-        else:
-            raise Exception("Unsupported docker network type")
+        for port_mapping in docker_info.port_mappings:
+            if not port_in_ranges(port_mapping.host_port, ports):
+                raise Exception("Port %i not included in resources" % port_mapping.host_port)
+            port_args = "%i:%i" % (
+                port_mapping.host_port,
+                port_mapping.container_port
+            )
 
+            if port_mapping.HasField("protocol"):
+                port_args += "/%s" % (port_mapping.protocol.lower())
+
+            arguments.extend(["-p", port_args])
+
+    return arguments
+
+
+def launch_arguments(launch, template, cpu_shares, max_memory, ports, port_mappings):
+    """
+    Return the `docker run` arguments of a launch, besides the image and
+    command, filling in the template with the values of this launch.
+    """
+
+    # Build up the docker arguments
+    arguments = []
+
+    # Set the container ID
     arguments.extend([
-        "--net", "%s" % net.lower()
+        "--name", launch.container_id.value
     ])
 
+    # Label the container, so containers mesos launched can be found without
+    # going through every container on the host
+    for label in mesos_labels(launch):
+        arguments.extend(["--label", "%s=%s" % label])
+
+    arguments.extend(template["env_args"])
+    arguments.extend(template["net_args"])
+
     # Configure the user
     if launch.HasField("user"):
         arguments.extend([
             "-u", launch.user
         ])
 
-    # Download the URIs
-    logger.info("Fetching URIs")
-    if fetch_uris(launch.directory, uris) > 0:
-        raise Exception("Mesos fetcher returned bad exit code")
-
     # Set the resource configuration
-    cpu_shares = 0
-    max_memory = 0
-    ports = set()
-
-    # Grab the resources from the task and executor
-    resource_sets = [launch.task_info.resources,
-                     launch.executor_info.resources]
-    for resources in resource_sets:
-        for resource in resources:
-            if resource.name == "cpus":
-                cpu_shares += float(resource.scalar.value)
-            if resource.name == "mem":
-                max_memory += int(resource.scalar.value)
-            if resource.name == "ports":
-                for port_range in resource.ranges.range:
-                    for port in xrange(port_range.begin, port_range.end + 1):
-                        ports.add(port)
-
     if cpu_shares > 0.0:
         arguments.extend(["-c", str(int(cpu_shares * 1024))])
+        if cpu_limit_mode() == CPU_QUOTA_MODE:
+            quota, period, _ = cpu_bandwidth(cpu_shares)
+            arguments.extend(["--cpu-period", str(period), "--cpu-quota", str(quota)])
+
+    # Pin the container to its CPUs, and the memory of their NUMA nodes
+    cpuset = allocate_cpuset(launch.container_id.value, cpu_shares)
+    if cpuset:
+        arguments.extend(["--cpuset-cpus", format_cpu_list(cpuset["cpus"])])
+        if cpuset["mems"]:
+            arguments.extend(["--cpuset-mems", format_cpu_list(cpuset["mems"])])
     if max_memory > 0:
         arguments.extend(["-m", "%dm" % max_memory])
-    if len(ports) > 0:
-        for port in ports:
-            arguments.extend(["-p", ":%i" % port])
+    for begin, end in ports:
+        arguments.extend(["-p", ":%s" % format_port_range(begin, end)])
+
+    logger.info("Configured with executor %s" % template["executor"])
 
-    logger.info("Configured with executor %s" % executor)
+    # The output is written to the sandbox by `wait`, from docker's own copy
+    arguments.extend(docker_log_arguments(template["extra_args"]))
 
     # Set the MESOS_DIRECTORY environment variable to the sandbox mount point
     arguments.extend(["-e", "MESOS_DIRECTORY=/mesos-sandbox"])
 
     # Pass through the rest of the mesos environment variables
-    mesos_env = ["MESOS_FRAMEWORK_ID", "MESOS_EXECUTOR_ID",
-                 "MESOS_SLAVE_ID", "MESOS_CHECKPOINT",
-                 "MESOS_SLAVE_PID", "MESOS_RECOVERY_TIMEOUT",
-                 "MESOS_NATIVE_LIBRARY"]
-    for key in mesos_env:
-        if key in os.environ:
-            arguments.extend(["-e", "%s=%s" % (key, os.environ[key])])
+    for variable in mesos_environment():
+        arguments.extend(["-e", "%s=%s" % variable])
 
     # Add the sandbox directory
     arguments.extend(["-v", "%s:/mesos-sandbox" % (launch.directory)])
     arguments.extend(["-w", "/mesos-sandbox"])
 
+    arguments.extend(template["volume_args"])
+
+    arguments.extend(port_mappings)
+    arguments.extend(template["docker_args"])
+
+    return arguments
+
+
+def mesos_environment():
+    """
+    Return the (name, value) mesos environment variables passed through to
+    the executor.
+    """
+
+    return [(key, environ()[key]) for key in MESOS_ENVIRONMENT if key in environ()]
+
+
+def template_key(launch):
+    """
+    Return a hash of everything about a launch that goes into its template,
+    which is the same for every task launched the same way.
+    """
+
+    container_info, docker_info = resolve_container_info(launch)
+
+    if launch.HasField("executor_info"):
+        command = launch.executor_info.command
+        parts = ["executor", command.value]
+    else:
+        command = launch.task_info.command
+        parts = ["task", environ().get("MESOS_LIBEXEC_DIRECTORY", "")]
+
+    parts.extend([
+        command.environment.SerializePartialToString(),
+        command.container.SerializePartialToString(),
+        environ().get("MESOS_DEFAULT_CONTAINER_IMAGE", "")
+    ])
+
+    if container_info:
+        # The host ports of the port mappings differ between tasks
+        shape = ContainerInfo()
+        shape.CopyFrom(container_info)
+        if docker_info:
+            shape.docker.ClearField("port_mappings")
+        parts.append(shape.SerializePartialToString())
+
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update("%d:%s" % (len(part), part))
+
+    return digest.hexdigest()
+
+
+def compile_launch_template(launch):
+    """
+    Validate and build the parts of the docker arguments of a launch that
+    don't depend on the IDs, sandbox or resources it's given. Returns a
+    dictionary of the `executor` command, the `image` and its `extra_args`,
+    and the `env_args`, `net_args`, `volume_args` and other `docker_args`.
+    """
+
+    # Figure out where the executor is
+    if launch.HasField("executor_info"):
+        executor = launch.executor_info.command.value
+        variables = launch.executor_info.command.environment.variables
+    else:
+        executor = "%s/mesos-executor" % environ()['MESOS_LIBEXEC_DIRECTORY']
+        variables = launch.task_info.command.environment.variables
+
+    # Environment variables
+    env_args = []
+    for env in variables:
+        env_args.extend([
+            "-e",
+            "%s=%s" % (env.name, env.value)
+        ])
+
+    container_info, docker_info = resolve_container_info(launch)
+    docker_image, extra_args = resolve_image(launch, docker_info)
+
+    # Configure the docker network to share the hosts
+    net = "host"
+    if docker_info:
+        if docker_info.network == 1:  # DockerInfo.Network.HOST
+            pass
+        elif docker_info.network == 2:  # DockerInfo.Network.BRIDGE
+            net = "bridge"
+        elif docker_info.network == 3:  # DockerInfo.Network.NONE
+            net = "none"
+        else:
+            raise Exception("Unsupported docker network type")
+
     # Populate the docker arguments with any volumes to be mounted
+    volume_args = []
     if container_info:
         for volume in container_info.volumes:
-            volume_args = volume.container_path
+            volume_arg = volume.container_path
             if volume.HasField("host_path"):
-                volume_args = "%s:%s" % (
+                volume_arg = "%s:%s" % (
                     volume.host_path,
                     volume.container_path
                 )
             if volume.HasField("mode"):
                 if not volume.HasField("host_path"):
                     raise Exception("Host path is required with mode")
-                if volume.mode == Volume.Mode.RW:
-                    volume_args += ":rw"
-                elif volume.mode == Volume.Mode.RO:
-                    volume_args += ":ro"
+                if volume.mode == Volume.RW:
+                    volume_arg += ":rw"
+                elif volume.mode == Volume.RO:
+                    volume_arg += ":ro"
                 else:
                     raise Exception("Unsupported volume mode")
 
-            arguments.extend(["-v", volume_args])
+            volume_args.extend(["-v", volume_arg])
 
-    # Populate the docker arguments with any port mappings
+    docker_args = []
     if docker_info:
-        for port_mapping in docker_info.port_mappings:
-            if port_mapping.host_port not in ports:
-                raise Exception("Port %i not included in resources" % port_mapping.host_port)
-            port_args = "%i:%i" % (
-                port_mapping.host_port,
-                port_mapping.container_port
-            )
-
-            if port_mapping.HasField("protocol"):
-                port_args += "/%s" % (port_mapping.protocol.lower())
-
-            arguments.extend(["-p", port_args])
-
         if docker_info.privileged:
-            arguments.append('--privileged')
+            docker_args.append('--privileged')
 
         if docker_info.parameters:
             for param in docker_info.parameters:
                 if param.key:
-                    arguments.append(param.key)
+                    docker_args.append(param.key)
                 if param.value:
-                    arguments.append(param.value)
+                    docker_args.append(param.value)
+
+    return {
+        "executor": executor,
+        "image": docker_image,
+        "extra_args": extra_args,
+        "env_args": env_args,
+        "net_args": ["--net", "%s" % net.lower()],
+        "volume_args": volume_args,
+        "docker_args": docker_args
+    }
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def launch_template(launch):
+    """
+    Return the compiled template of a launch, reusing the one compiled for
+    an earlier launch of the same shape if possible. The least recently
+    used templates are dropped once more than `MAX_LAUNCH_TEMPLATES` are
+    cached. Templates are shared, so they mustn't be modified.
+    """
+
+    key = template_key(launch)
+
+    with _templates_lock:
+        template = _templates.pop(key, None)
+        if template is not None:
+            _templates[key] = template
+            return template
+
+    # Launches that fail validation raise here, and aren't cached
+    template = compile_launch_template(launch)
+    template["key"] = key
+
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > MAX_LAUNCH_TEMPLATES:
+            _templates.popitem(last=False)
+
+    return template
+
+
+def resolve_container_info(launch):
+    """
+    Pull out the ContainerInfo from either the task or the executor, and its
+    DockerInfo if it has one. Returns a tuple of the two, either may be None.
+    """
+
+    container_info = None
+    if launch.executor_info.HasField("container"):
+        container_info = launch.executor_info.container
+    elif launch.task_info.HasField("container"):
+        container_info = launch.task_info.container
+
+    docker_info = None
+    if container_info and container_info.type == 1:  # ContainerInfo.Type.DOCKER
+        docker_info = container_info.docker
+
+    return container_info, docker_info
+
+
+def mesos_labels(launch):
+    """
+    Return the (key, value) docker labels identifying the mesos container,
+    framework and executor of a launch.
+    """
+
+    labels = [(CONTAINER_LABEL, launch.container_id.value)]
+
+    framework_id = environ().get("MESOS_FRAMEWORK_ID")
+    if launch.executor_info.HasField("framework_id"):
+        framework_id = launch.executor_info.framework_id.value
+    if framework_id:
+        labels.append((FRAMEWORK_LABEL, framework_id))
+
+    executor_id = environ().get("MESOS_EXECUTOR_ID")
+    if launch.HasField("executor_info"):
+        executor_id = launch.executor_info.executor_id.value
+    if executor_id:
+        labels.append((EXECUTOR_LABEL, executor_id))
+
+    return labels
+
+
+def launch_resources(launch):
+    """
+    Total up the resources of the task and executor, returning a tuple of
+    the cpus, the memory in MB and the ports, as a sorted list of disjoint
+    (begin, end) ranges.
+    """
+
+    cpus = 0
+    memory = 0
+    ports = []
+
+    resource_sets = [launch.task_info.resources,
+                     launch.executor_info.resources]
+    for resources in resource_sets:
+        for resource in resources:
+            if resource.name == "cpus":
+                cpus += float(resource.scalar.value)
+            if resource.name == "mem":
+                memory += int(resource.scalar.value)
+            if resource.name == "ports":
+                for port_range in resource.ranges.range:
+                    ports.append((port_range.begin, port_range.end))
+
+    return cpus, memory, merge_port_ranges(ports)
+
+
+def merge_port_ranges(ranges):
+    """
+    Merge overlapping and adjacent (begin, end) port ranges, returning them
+    sorted.
+
+    >>> merge_port_ranges([(31005, 31010), (31000, 31004), (31008, 31020), (80, 80)])
+    [(80, 80), (31000, 31020)]
+    """
+
+    merged = []
+    for begin, end in sorted(ranges):
+        if merged and begin <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+
+    return merged
+
+
+def port_in_ranges(port, ranges):
+    """
+    Return whether a port is in a sorted list of disjoint port ranges.
+
+    >>> port_in_ranges(31500, [(80, 80), (31000, 31999)])
+    True
+    >>> port_in_ranges(81, [(80, 80), (31000, 31999)])
+    False
+    """
+
+    index = bisect.bisect_right(ranges, (port, sys.maxint)) - 1
+    return index >= 0 and ranges[index][1] >= port
+
+
+def format_port_range(begin, end):
+    """
+    Format a port range the way `docker run -p` takes it.
+
+    >>> format_port_range(31000, 31999)
+    '31000-31999'
+    >>> format_port_range(80, 80)
+    '80'
+    """
+
+    if begin == end:
+        return "%d" % begin
+    return "%d-%d" % (begin, end)
+
+
+def record_launch(launch, lxc_container_id, limits=None):
+    """
+    Write the state record of a newly launched container, with the cgroup
+    limits applied to it if they aren't the ones of its resources. The
+    container is already running, so failing to write it is logged rather
+    than raised, and left for `recover` to record from its labels.
+    """
+
+    docker_image = launch_template(launch)["image"]
+    cpus, memory, ports = launch_resources(launch)
+
+    try:
+        digest = (read_index(docker_image) or {}).get("digest") or image_digest(docker_image)
+    except Exception, e:
+        logger.error("Failed to find digest of image %s: %s", docker_image, e)
+        digest = None
+
+    fields = dict(
+        docker_id=lxc_container_id,
+        cgroups=hierarchy().cgroup_directories(lxc_container_id),
+        image=docker_image,
+        image_digest=digest,
+        resources={"cpus": cpus, "mem": memory, "ports": ports},
+        limits=limits if limits is not None else launch_limits(cpus, memory),
+        directory=launch.directory,
+        launched_at=time.time()
+    )
+
+    try:
+        # The record may already hold the CPUs allocated to the container
+        if cpuset_mode() == NO_CPUSETS:
+            update_container_state(launch.container_id.value, **fields)
+            return
+
+        # The shared pool may have shrunk since the CPUs were chosen. The
+        # docker ID is recorded under the cpuset lock, so a later resize
+        # sees it.
+        with cpuset_lock():
+            update_container_state(launch.container_id.value, **fields)
+            apply_cpuset(launch.container_id.value, lxc_container_id)
+    except Exception, e:
+        logger.error("Failed to record the launch of container %s, leaving it for "
+                     "recover: %s", launch.container_id.value, e)
+
+
+def launch_limits(cpus, memory):
+    """
+    Return the cgroup limits docker applies for the `docker run` arguments,
+    in the form `update` compares against.
+    """
+
+    limits = {}
+    if cpus > 0.0:
+        limits["cpu_shares"] = int(cpus * 1024)
+        if cpu_limit_mode() == CPU_QUOTA_MODE:
+            quota, period, burst = cpu_bandwidth(cpus)
+            limits.update(cpu_quota=quota, cpu_period=period, cpu_burst=burst)
+    if memory > 0:
+        limits["memory_limit"] = memory * 1024 * 1024
+
+    return limits
+
+
+def pool_key(launch):
+    """
+    Return the key of the pool of warm containers a launch can be given one
+    from. Containers of the same template, user and resources are
+    interchangeable, so a claimed container starts with the cgroup limits
+    of the launch that claims it.
+    """
+
+    cpus, memory, _ = launch_resources(launch)
+    return "%s:%s:%r:%d" % (launch_template(launch)["key"], launch.user, cpus, memory)
+
+
+def pool_arguments(launch):
+    """
+    Return a tuple of the `docker create` arguments of warm containers for
+    launches shaped like this one, and the cgroup limits they're created
+    with, or None if they can't be pooled. What's particular to a launch,
+    its name, sandbox and mesos environment, is filled in once a container
+    is claimed.
+    """
+
+    template = launch_template(launch)
+    cpus, memory, ports = launch_resources(launch)
+    _, docker_info = resolve_container_info(launch)
+
+    # Published ports are fixed when a container is created, and the host
+    # network doesn't publish them at all
+    if template["net_args"] != ["--net", "host"] and \
+            (ports or (docker_info and docker_info.port_mappings)):
+        return None
+
+    arguments = list(template["env_args"])
+    arguments.extend(template["net_args"])
+
+    if launch.HasField("user"):
+        arguments.extend(["-u", launch.user])
+
+    if cpus > 0.0:
+        arguments.extend(["-c", str(int(cpus * 1024))])
+        if cpu_limit_mode() == CPU_QUOTA_MODE:
+            quota, period, _ = cpu_bandwidth(cpus)
+            arguments.extend(["--cpu-period", str(period), "--cpu-quota", str(quota)])
+    if memory > 0:
+        arguments.extend(["-m", "%dm" % memory])
+
+    arguments.extend(docker_log_arguments(template["extra_args"]))
+    arguments.extend(["-e", "MESOS_DIRECTORY=/mesos-sandbox", "-w", "/mesos-sandbox"])
+    arguments.extend(template["volume_args"])
+    arguments.extend(template["docker_args"])
+    arguments.extend(template["extra_args"])
+    arguments.append(template["image"])
+    arguments.extend(["sh", "-c", pooled_command(sandbox_command(template["executor"],
+                                                                 template["extra_args"]))])
+
+    # The CFS burst is left for the update path to apply
+    limits = launch_limits(cpus, memory)
+    if "cpu_burst" in limits:
+        limits["cpu_burst"] = 0
+
+    return arguments, limits
+
+
+def offer_launch_shape(launch):
+    try:
+        shape = pool_arguments(launch)
+    except Exception, e:
+        logger.error("Unable to pool containers like %s: %s", launch.container_id.value, e)
+        return
+
+    if shape:
+        offer_pool_shape(pool_key(launch), *shape)
+
+
+def launch_pooled(launch, pooled):
+    """
+    Start a warm container claimed from the pool as the container of a
+    launch. It's given the name, sandbox and mesos environment of the
+    launch, and then its resources through the update path.
+    """
+
+    started = time.time()
+
+    if launch.HasField("executor_info"):
+        uris = launch.executor_info.command.uris
+    else:
+        uris = launch.task_info.command.uris
+
+    cpus, memory, _ = launch_resources(launch)
+
+    # The image is already there, only the sandbox needs fetching
+    phases, done, cancelled = start_phases([
+        ("fetch", lambda cancelled: fetch_sandbox(launch.directory, uris, cancelled))
+    ])
+
+    try:
+        allocate_cpuset(launch.container_id.value, cpus)
+    except Exception:
+        cancelled.set()
+        raise
+
+    wait_for_phases(phases, done, cancelled)
+
+    write_environment_file(launch.directory, mesos_environment())
+    bind_sandbox(pooled, launch.directory)
+
+    # The container can't be given the mesos labels, so they're recorded
+    # before it's started for `recover` to find it by
+    record_claim(pooled["docker_id"], mesos_labels(launch))
+
+    client = docker_client()
+    client.rename_container(pooled["docker_id"], launch.container_id.value)
+    client.start_container(pooled["docker_id"])
+    remove_link(pooled)
+
+    lxc_container_id = pooled["docker_id"]
+    logger.info("Started pooled container %s with ID %s in %.3fs", pooled["name"],
+                lxc_container_id, time.time() - started)
+
+    record_launch(launch, lxc_container_id, limits=pooled["limits"])
+    update_container(launch.container_id.value, total_resources(cpus, memory))
+
+
+def total_resources(cpus, memory):
+    """
+    Return the resources of a launch as a list of `Resource` protos, the
+    form the update path takes.
+    """
+
+    resources = []
+    for name, value in (("cpus", cpus), ("mem", memory)):
+        if value > 0:
+            resource = Resource()
+            resource.name = name
+            resource.type = 0  # SCALAR
+            resource.scalar.value = value
+            resources.append(resource)
+
+    return resources
+
+
+def resolve_image(launch, docker_info):
+    """
+    Figure out the docker image to launch, returning a tuple of the image
+    name and any extra `docker run` arguments given with it.
+    """
 
     extra_args = []
     if docker_info:
@@ -229,7 +759,7 @@ def build_docker_args(launch):
                 extra_args.extend(option.split(" "))
 
     if not image:
-        image = os.environ["MESOS_DEFAULT_CONTAINER_IMAGE"]
+        image = environ()["MESOS_DEFAULT_CONTAINER_IMAGE"]
     if not image:
         raise Exception("No default container image")
 
@@ -240,20 +770,77 @@ def build_docker_args(launch):
     else:
         docker_image = url.path
 
-    # Pull the image
-    logger.info("Pulling latest docker image: %s", docker_image)
-    _, _, return_code = invoke_docker("pull", [docker_image])
-    if return_code > 0:
-        raise Exception("Failed to pull image (%d)", return_code)
+    return docker_image, extra_args
 
-    run_arguments = [
-        "-d",  # Enable daemon mode
-    ]
 
-    run_arguments.extend(arguments)
-    run_arguments.extend(extra_args)
-    run_arguments.append(docker_image)
-    run_arguments.extend(["sh", "-c"])
-    run_arguments.append(executor + " >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr")
+def fetch_sandbox(directory, uris, cancelled=None):
+    logger.info("Fetching URIs")
+    if fetch_uris(directory, uris, cancelled) > 0:
+        raise Exception("Mesos fetcher returned bad exit code")
 
-    return run_arguments
+
+class LaunchPhase(threading.Thread):
+    """
+    A step of preparing a launch that runs in the background, reporting to
+    the `done` queue when it finishes. The target is called with the
+    `cancelled` event, which is set once the launch has failed, and should
+    give up when it is.
+    """
+
+    def __init__(self, name, target, done, cancelled):
+        super(LaunchPhase, self).__init__(name="launch-%s" % name)
+        self.daemon = True
+        self.phase = name
+        self.target = target
+        self.done = done
+        self.cancelled = cancelled
+        self.error = None
+        self.duration = None
+
+        # Run with the environment of the launch, which is per thread when
+        # running inside the `serve` daemon.
+        self.environ = environ()
+
+    def run(self):
+        started = time.time()
+        try:
+            with environment(self.environ):
+                self.target(self.cancelled)
+        except Exception:
+            self.error = sys.exc_info()
+
+        self.duration = time.time() - started
+        self.done.put(self)
+
+
+def start_phases(targets):
+    """
+    Start a `LaunchPhase` for each (name, callable) pair, returning a tuple of
+    the phases, the queue they report to and the event that cancels them.
+    """
+
+    done = Queue.Queue()
+    cancelled = threading.Event()
+    phases = [LaunchPhase(name, target, done, cancelled) for name, target in targets]
+    for phase in phases:
+        phase.start()
+
+    return phases, done, cancelled
+
+
+def wait_for_phases(phases, done, cancelled):
+    """
+    Wait for every phase to finish, logging how long each took. The first
+    phase to fail has its exception re-raised straight away, and the rest
+    are cancelled rather than waited for. They are daemon threads, so they
+    won't hold up the exit.
+    """
+
+    for _ in phases:
+        phase = done.get()
+        if phase.error:
+            cancelled.set()
+            logger.error("Launch phase %s failed after %.3fs", phase.phase, phase.duration)
+            raise phase.error[0], phase.error[1], phase.error[2]
+
+        logger.info("Launch phase %s took %.3fs", phase.phase, phase.duration)
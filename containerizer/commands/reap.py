@@ -0,0 +1,27 @@
+"""
+ _ __ ___  __ _ _ __
+| '__/ _ \/ _` | '_ \
+| | |  __/ (_| | |_) |
+|_|  \___|\__,_| .__/
+               |_|
+
+Containerizer subcommand to remove the containers queued by `destroy`. It's
+started in the background by `destroy`, unless a `serve` daemon is reaping
+containers itself.
+"""
+
+import logging
+
+from containerizer import app
+from containerizer.reaper import reap_containers
+
+logger = logging.getLogger(__name__)
+
+
+@app.command()
+def reap():
+    """
+    Remove destroyed containers from disk.
+    """
+
+    reap_containers()
@@ -11,6 +11,11 @@ Containerizer subcommand to perform any internal recovery operations.
 import logging
 
 from containerizer import app
+from containerizer.cgroups import hierarchy, close_handles
+from containerizer.docker import docker_client, DockerAPIError, CONTAINER_LABEL
+from containerizer.state import list_container_states, write_container_state, \
+    remove_container_state
+from containerizer.pool import docker_labels, list_claims, remove_claim
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +23,71 @@ logger = logging.getLogger(__name__)
 @app.command()
 def recover():
     """
-    Recover any internal containerizer state. Note: this does nothing.
+    Reconcile the recorded state of each container with docker.
     """
 
-    pass
+    try:
+        docker_containers = docker_client().list_containers(all=True)
+    except DockerAPIError, e:
+        logger.error("Failed to list containers: %s", e)
+        exit(1)
+
+    reconcile_containers(list_container_states(), docker_containers)
+
+
+def reconcile_containers(records, docker_containers):
+    """
+    Bring the state records up to date with the containers docker knows
+    about. Records of containers that no longer exist are removed, and the
+    docker ID and cgroups of the rest are refreshed in case the container was
+    replaced while the containerizer wasn't looking. Labelled containers
+    without a record are recorded, including pooled containers by the labels
+    recorded when they were claimed.
+    """
+
+    by_name = {}
+    labelled = {}
+    for docker_container in docker_containers:
+        for name in docker_container.get("Names") or []:
+            by_name[name.lstrip("/")] = docker_container
+
+        container_id = docker_labels(docker_container).get(CONTAINER_LABEL)
+        if container_id:
+            by_name[container_id] = labelled[container_id] = docker_container
+
+    backend = hierarchy()
+    recovered = 0
+
+    # Containers launched by mesos that the records have lost track of, for
+    # example if the state directory was wiped
+    for container_id, docker_container in labelled.iteritems():
+        if container_id not in records:
+            logger.info("Recording state of unknown container %s", container_id)
+            records[container_id] = {"image": docker_container.get("Image")}
+
+    for container_id, record in records.iteritems():
+        docker_container = by_name.get(container_id)
+
+        if docker_container is None:
+            logger.info("Removing state of orphaned container %s", container_id)
+            if record.get("docker_id"):
+                close_handles(record["docker_id"])
+            remove_container_state(container_id)
+            continue
+
+        docker_id = docker_container["Id"]
+        cgroups = backend.cgroup_directories(docker_id)
+        if record.get("docker_id") != docker_id or record.get("cgroups") != cgroups:
+            logger.info("Refreshing state of container %s", container_id)
+            record.update(docker_id=docker_id, cgroups=cgroups)
+            write_container_state(container_id, record)
+
+        recovered += 1
+
+    # Claims of pooled containers that have since been removed
+    docker_ids = set(docker_container["Id"] for docker_container in docker_containers)
+    for docker_id in list_claims():
+        if docker_id not in docker_ids:
+            remove_claim(docker_id)
+
+    logger.info("Recovered %d containers", recovered)
@@ -0,0 +1,151 @@
+"""
+ ___  ___ _ ____   _____
+/ __|/ _ \ '__\ \ / / _ \
+\__ \  __/ |   \ V /  __/
+|___/\___|_|    \_/ \___|
+
+Containerizer subcommand to run a long lived daemon that answers the other
+subcommands on behalf of `bin/docker-containerizer-client`, so each call made
+by mesos costs a socket round trip rather than an interpreter start.
+
+Each request on the socket is framed as the length prefixed (native `I`)
+subcommand name and its arguments, NUL separated, the length prefixed protobuf
+that would have been written to stdin (empty if the subcommand reads nothing)
+and the length prefixed environment of the client, as NUL separated
+`KEY=VALUE` pairs. The response is the exit status followed by the length
+prefixed bytes the subcommand wrote to stdout.
+"""
+
+import os
+import stat
+import struct
+import logging
+import SocketServer
+
+from StringIO import StringIO
+
+from containerizer import app, environ, invocation
+from containerizer.reaper import start_background_reaper
+from containerizer.pool import start_container_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAEMON_SOCKET = "/var/run/docker-containerizer.sock"
+
+
+@app.command()
+def serve():
+    """
+    Run the containerizer as a daemon listening on a unix socket.
+    """
+
+    socket_path = environ().get("CONTAINERIZER_DAEMON_SOCKET", DEFAULT_DAEMON_SOCKET)
+
+    # Clean up a socket left behind by a previous daemon
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        os.unlink(socket_path)
+
+    # Destroyed containers are removed by a thread of the daemon, rather than
+    # a process started for each one
+    start_background_reaper()
+
+    # Warm containers can only be kept by a long lived process
+    start_container_pool()
+
+    server = ContainerizerServer(socket_path)
+    os.chmod(socket_path, 0600)
+
+    logger.info("Listening for containerizer requests on %s", socket_path)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def read_frame(stream):
+    """
+    Read a single length prefixed frame from the given stream.
+    """
+
+    header = stream.read(4)
+    if len(header) != 4:
+        raise EOFError("Connection closed before frame header")
+
+    size = struct.unpack('I', header)[0]
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError("Connection closed before end of frame")
+
+    return data
+
+
+def write_frame(stream, data):
+    stream.write(struct.pack('I', len(data)))
+    stream.write(data)
+
+
+def run_command(command, payload, env, arguments=[]):
+    """
+    Run a containerizer subcommand in the current thread with the given
+    command line arguments and protobuf payload as its stdin, and return a
+    tuple of (exit_status, stdout).
+    """
+
+    stdin = StringIO()
+    if payload:
+        write_frame(stdin, payload)
+        stdin.seek(0)
+
+    stdout = StringIO()
+
+    with invocation(stdin, stdout, env):
+        try:
+            app.main(args=[command] + arguments, prog_name="docker-containerizer")
+            status = 0
+        except SystemExit, e:
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                status = 1
+        except Exception:
+            logger.exception("Containerizer command %s failed", command)
+            status = 1
+
+    return status, stdout.getvalue()
+
+
+class ContainerizerHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            arguments = read_frame(self.rfile).split("\0")
+            payload = read_frame(self.rfile)
+            env = dict(
+                pair.split("=", 1)
+                for pair in read_frame(self.rfile).split("\0") if "=" in pair
+            )
+        except EOFError, e:
+            logger.error("Dropping malformed request: %s", e)
+            return
+
+        command, arguments = arguments[0], arguments[1:]
+
+        logger.info("Handling %s request", command)
+        status, output = run_command(command, payload, env, arguments)
+
+        self.wfile.write(struct.pack('I', status))
+        write_frame(self.wfile, output)
+
+
+class ContainerizerServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    # Calls such as `wait` block for the lifetime of a container, so every
+    # request gets its own thread.
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, ContainerizerHandler)
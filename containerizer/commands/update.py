@@ -12,12 +12,20 @@ Containerizer subcommand to update a running container with new resources.
 import logging
 
 from containerizer import app, recv_proto, container_lock
-from containerizer.docker import inspect_container
+from containerizer.ids import lookup_container_id
 from containerizer.proto import Update
-from containerizer.cgroups import read_metric, write_metric
+from containerizer.cgroups import hierarchy, cpu_limit_mode, cpu_bandwidth, CPU_QUOTA_MODE
+from containerizer.state import read_container_state, update_container_state
 
 logger = logging.getLogger(__name__)
 
+# How many steps a reduction of the hard memory limit is made in
+SHRINK_STEPS = 4
+
+# The memory pressure (the percentage of the last 10 seconds tasks were
+# stalled waiting for memory) above which the hard limit isn't lowered
+MAX_MEMORY_PRESSURE = 10.0
+
 
 @app.command()
 def update():
@@ -28,46 +36,182 @@ def update():
     update = recv_proto(Update)
 
     logger.info("Updating resources for container %s", update.container_id.value)
-    with container_lock(update.container_id.value, "update"):
+    with container_lock(update.container_id.value):
         update_container(update.container_id.value, update.resources)
 
 
 def update_container(container_id, resources):
+    """
+    Bring the cgroup limits of a container in line with its resources,
+    writing only the limits that have changed since they were last applied.
+    """
 
     # Get the container ID
-    info = inspect_container(container_id)
-    lxc_container_id = info.get("ID", info.get("Id"))
+    lxc_container_id = lookup_container_id(container_id)
+    backend = hierarchy()
+
+    desired = resource_limits(resources)
+
+    # The limits last applied are kept with the state of the container, so an
+    # update that changes nothing doesn't need to look at the cgroups at all
+    record = read_container_state(container_id) or {}
+    applied = record.get("limits")
+    if applied is None:
+        applied = read_limits(backend, lxc_container_id)
+
+    changed = dict(
+        (name, value) for name, value in desired.iteritems()
+        if applied.get(name) != value
+    )
+
+    if not changed:
+        logger.info("Container resources are unchanged")
+        return
+
+    applied = dict(applied)
+
+    if "cpu_shares" in changed:
+        backend.write_cpu_shares(lxc_container_id, changed["cpu_shares"])
+        applied["cpu_shares"] = changed["cpu_shares"]
+
+    if any(name in changed for name in ("cpu_quota", "cpu_period", "cpu_burst")):
+        write_cpu_bandwidth(backend, lxc_container_id, applied, desired)
+
+    # The soft limit goes first, so the kernel starts reclaiming memory before
+    # any reduction of the hard limit
+    if "memory_soft_limit" in changed:
+        backend.write_memory_soft_limit(lxc_container_id, changed["memory_soft_limit"])
+        applied["memory_soft_limit"] = changed["memory_soft_limit"]
+
+    if "memory_limit" in changed:
+        limit = changed["memory_limit"]
+        current = applied.get("memory_limit")
+        if current is None:
+            current = backend.read_memory_limit(lxc_container_id)
+
+        if limit >= current:
+            backend.write_memory_limit(lxc_container_id, limit)
+            applied["memory_limit"] = limit
+        else:
+            applied["memory_limit"] = shrink_memory_limit(backend, lxc_container_id, current, limit)
 
-    if lxc_container_id is None:
-        raise Exception("Failed to get full container ID")
+    update_container_state(container_id, limits=applied)
+
+    logger.info("Finished processing container update")
+
+
+def resource_limits(resources):
+    """
+    Return the cgroup limits for the given resources, as a dictionary.
+    """
 
-    # Gather the resoures
-    max_mem = None
-    max_cpus = None
+    limits = {}
 
     for resource in resources:
         if resource.name == "mem":
-            max_mem = int(resource.scalar.value) * 1024 * 1024
+            memory = int(resource.scalar.value) * 1024 * 1024
+            limits["memory_limit"] = memory
+            limits["memory_soft_limit"] = memory
         if resource.name == "cpus":
-            max_cpus = int(resource.scalar.value)
+            limits["cpu_shares"] = int(resource.scalar.value * 1024)
+            if cpu_limit_mode() == CPU_QUOTA_MODE:
+                quota, period, burst = cpu_bandwidth(resource.scalar.value)
+                limits.update(cpu_quota=quota, cpu_period=period, cpu_burst=burst)
         if resource.name == "ports":
             logger.error("Unable to process an update to port configuration!")
 
-    if max_mem:
-        # Update the soft limit
-        write_metric(lxc_container_id, "memory.soft_limit_in_bytes", max_mem)
+    return limits
 
-        # Figure out if we can update the hard limit
-        # If we reduce the hard limit and too much memory is in use, this
-        # can invoke an OOM.
-        current_mem = int(read_metric(lxc_container_id, "memory.limit_in_bytes"))
-        if current_mem < max_mem:
-            write_metric(lxc_container_id, "memory.limit_in_bytes", max_mem)
-        else:
-            logger.info("Skipping hard memory limit, would invoke OOM")
 
-    if max_cpus:
-        shares = max_cpus * 1024
-        write_metric(lxc_container_id, "cpu.shares", shares)
+def read_limits(backend, lxc_container_id):
+    """
+    Read the limits currently applied to a container from its cgroups.
+    """
 
-    logger.info("Finished processing container update")
+    limits = {
+        "cpu_shares": backend.read_cpu_shares(lxc_container_id),
+        "memory_limit": backend.read_memory_limit(lxc_container_id),
+        "memory_soft_limit": backend.read_memory_soft_limit(lxc_container_id)
+    }
+
+    if cpu_limit_mode() == CPU_QUOTA_MODE:
+        limits["cpu_quota"], limits["cpu_period"] = backend.read_cpu_quota(lxc_container_id)
+        limits["cpu_burst"] = backend.read_cpu_burst(lxc_container_id)
+
+    return limits
+
+
+def write_cpu_bandwidth(backend, lxc_container_id, applied, desired):
+    """
+    Write the CFS bandwidth limit of a container, updating the applied
+    limits. The kernel won't let the burst exceed the quota, so a smaller
+    burst is written before the quota and a larger one after it.
+    """
+
+    quota, period, burst = desired["cpu_quota"], desired["cpu_period"], desired["cpu_burst"]
+
+    # The burst is only recorded once the kernel has taken it
+    applied_burst = applied.get("cpu_burst", 0)
+
+    if burst < applied_burst and backend.write_cpu_burst(lxc_container_id, burst):
+        applied_burst = burst
+
+    if (quota, period) != (applied.get("cpu_quota"), applied.get("cpu_period")):
+        backend.write_cpu_quota(lxc_container_id, quota, period)
+
+    if burst > applied_burst and backend.write_cpu_burst(lxc_container_id, burst):
+        applied_burst = burst
+
+    applied.update(cpu_quota=quota, cpu_period=period, cpu_burst=applied_burst)
+
+
+def shrink_memory_limit(backend, lxc_container_id, current, target):
+    """
+    Lower the hard memory limit of a container towards the target in steps,
+    reclaiming memory before each one. Shrinking stops short, rather than
+    provoke the OOM killer, if usage can't be brought under the next step or
+    the container is under memory pressure. Returns the limit reached, and a
+    later update will try again.
+
+    The v1 hierarchy can't be asked to reclaim an amount, so it's left to
+    reclaim when each step is written, which fails with EBUSY if it can't.
+    """
+
+    step = max((current - target) / SHRINK_STEPS, 1)
+    limit = current
+
+    while limit > target:
+        next_limit = max(target, limit - step)
+
+        if backend.reclaims_memory:
+            usage = backend.read_memory_usage(lxc_container_id)
+            if usage > next_limit:
+                try:
+                    backend.reclaim_memory(lxc_container_id, usage - next_limit)
+                except (IOError, OSError), e:
+                    logger.info("Unable to reclaim memory: %s", e)
+                usage = backend.read_memory_usage(lxc_container_id)
+
+            if usage > next_limit:
+                logger.info("Memory usage %d is above %d, not shrinking further",
+                            usage, next_limit)
+                break
+
+        pressure = backend.read_memory_pressure(lxc_container_id)
+        if pressure is not None and pressure > MAX_MEMORY_PRESSURE:
+            logger.info("Container is under memory pressure (%.2f%%), not shrinking further",
+                        pressure)
+            break
+
+        try:
+            backend.write_memory_limit(lxc_container_id, next_limit)
+        except (IOError, OSError), e:
+            logger.info("Failed to lower memory limit to %d: %s", next_limit, e)
+            break
+
+        limit = next_limit
+
+    if limit > target:
+        logger.info("Skipping the rest of the hard memory limit reduction, would invoke OOM")
+
+    return limit
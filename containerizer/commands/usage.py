@@ -11,45 +11,53 @@ running container.
 """
 
 import os
+import click
 import logging
 import time
 
-from containerizer import app, recv_proto, send_proto
-from containerizer.docker import inspect_container
-from containerizer.cgroups import read_metric, read_metrics
-from containerizer.proto import Usage, ResourceStatistics
+from containerizer import app, recv_proto, send_proto, container_lock
+from containerizer.ids import lookup_container_id
+from containerizer.cgroups import hierarchy, read_metrics, sweep_metrics
+from containerizer.network import network_statistics
+from containerizer.proto import Usage, Containers, ResourceStatistics
 
 logger = logging.getLogger(__name__)
 
 
 @app.command()
-def usage():
+@click.option("--batch", is_flag=True,
+              help="Read a Containers proto and write usage for each of them.")
+def usage(batch):
     """
     Retrieve usage information about a running container.
     """
 
+    # Get the number of CPU ticks
+    ticks = os.sysconf("SC_CLK_TCK")
+    if not ticks > 0:
+        logger.error("Unable to retrieve number of CPU clock ticks")
+        exit(1)
+
+    if batch:
+        batch_usage(ticks)
+        return
+
     usage = recv_proto(Usage)
     logger.info("Retrieving usage for container %s", usage.container_id.value)
 
-    # Find the lxc container ID
-    info = inspect_container(usage.container_id.value)
-    lxc_container_id = info.get("ID", info.get("Id"))
-
-    if lxc_container_id is None:
-        raise Exception("Failed to get full container ID")
+    # Share the lock with other readers, so only changes to the container
+    # are waited for
+    with container_lock(usage.container_id.value, shared=True):
 
-    logger.info("Using LXC container ID %s", lxc_container_id)
+        # Find the lxc container ID
+        lxc_container_id = lookup_container_id(usage.container_id.value)
 
-    stats = ResourceStatistics()
-    stats.timestamp = int(time.time())
+        logger.info("Using LXC container ID %s", lxc_container_id)
 
-    # Get the number of CPU ticks
-    ticks = os.sysconf("SC_CLK_TCK")
-    if not ticks > 0:
-        logger.error("Unable to retrieve number of CPU clock ticks")
-        exit(1)
+        stats = ResourceStatistics()
+        stats.timestamp = int(time.time())
 
-    collect_container_stats(lxc_container_id, stats, ticks)
+        collect_container_stats(lxc_container_id, stats, ticks)
 
     logger.debug("Container usage: %s", stats)
 
@@ -57,48 +65,89 @@ def usage():
     send_proto(stats)
 
 
+def batch_usage(ticks):
+    """
+    Retrieve usage information for every container in a `Containers` proto,
+    sending back one `ResourceStatistics` per container in the same order.
+    Containers that aren't running get statistics with only a timestamp.
+    """
+
+    containers = recv_proto(Containers)
+    logger.info("Retrieving usage for %d containers", len(containers.containers))
+
+    lxc_container_ids = {}
+    for container_id in containers.containers:
+        try:
+            lxc_container_ids[container_id.value] = lookup_container_id(container_id.value)
+        except Exception, e:
+            logger.error("Failed to find container %s: %s", container_id.value, e)
+
+    all_stats = collect_containers_stats(lxc_container_ids.values(), ticks)
+
+    for container_id in containers.containers:
+        lxc_container_id = lxc_container_ids.get(container_id.value)
+        stats = all_stats.get(lxc_container_id)
+
+        if stats is None:
+            logger.error("No usage found for container %s", container_id.value)
+            stats = ResourceStatistics()
+            stats.timestamp = int(time.time())
+
+        send_proto(stats)
+
+
+def collect_containers_stats(lxc_container_ids, cpu_ticks):
+    """
+    Collect resource statistics for many containers with a single sweep of
+    the cgroup hierarchy. Returns a dictionary mapping lxc container ID to a
+    `ResourceStatistics`, leaving out containers that have no cgroup.
+    """
+
+    backend = hierarchy()
+    timestamp = int(time.time())
+    all_stats = {}
+
+    for lxc_container_id, metrics in sweep_metrics(lxc_container_ids, backend.usage_metrics).iteritems():
+        stats = ResourceStatistics()
+        stats.timestamp = timestamp
+
+        usage = backend.usage_statistics(metrics, cpu_ticks)
+        usage.update(network_statistics(lxc_container_id))
+        all_stats[lxc_container_id] = fill_container_stats(usage, stats)
+
+    return all_stats
+
+
 def collect_container_stats(container_id, stats, cpu_ticks):
 
-    # Retrieve the CPU stats
-    try:
-        stats.cpus_limit = float(read_metric(container_id, "cpu.shares")) / 256
-        cpu_stats = dict(read_metrics(container_id, "cpuacct.stat"))
-        if "user" in cpu_stats and "system" in cpu_stats:
-            stats.cpus_user_time_secs = float(cpu_stats["user"]) / cpu_ticks
-            stats.cpus_system_time_secs = float(cpu_stats["system"]) / cpu_ticks
-    except:
-        raise
-        logger.error("Failed to get CPU usage")
+    backend = hierarchy()
+
+    metrics = {}
+    for metric in backend.usage_metrics:
+        try:
+            metrics[metric] = dict(read_metrics(container_id, metric))
+        except Exception, e:
+            logger.error("Failed to read %s: %s", metric, e)
+
+    usage = backend.usage_statistics(metrics, cpu_ticks)
+    usage.update(network_statistics(container_id))
+
+    return fill_container_stats(usage, stats)
 
-    try:
-        cpu_stats = dict(read_metrics(container_id, "cpu.stat"))
-        if "nr_periods" in cpu_stats:
-            stats.cpus_nr_periods = int(cpu_stats["nr_periods"])
-        if "nr_throttled" in cpu_stats:
-            stats.cpus_nr_throttled = int(cpu_stats["nr_throttled"])
-        if "throttled_time" in cpu_stats:
-            throttled_time_nano = int(cpu_stats["throttled_time"])
-            throttled_time_secs = throttled_time_nano / 1000000000
-            stats.cpus_throttled_time_secs = throttled_time_secs
-    except:
-        logger.error("Failed to get detailed CPU usage")
-
-    # Retrieve the mem stats
-    try:
-        stats.mem_limit_bytes = int(read_metric(container_id, "memory.limit_in_bytes"))
-        stats.mem_rss_bytes = int(read_metric(container_id, "memory.usage_in_bytes"))
-    except:
+
+def fill_container_stats(usage, stats):
+    """
+    Populate a `ResourceStatistics` from a dictionary of usage read from the
+    cgroup hierarchy. Values without a matching field are ignored.
+    """
+
+    if "cpus_limit" not in usage:
+        logger.error("Failed to get CPU usage")
+    if "mem_rss_bytes" not in usage:
         logger.error("Failed to get memory usage")
 
-    try:
-        mem_stats = dict(read_metrics(container_id, "memory.stat"))
-        if "total_cache" in mem_stats:
-            stats.mem_file_bytes = int(mem_stats["total_cache"])
-        if "total_rss" in mem_stats:
-            stats.mem_anon_bytes = int(mem_stats["total_rss"])
-        if "total_mapped_file" in mem_stats:
-            stats.mem_mapped_file_bytes = int(mem_stats["total_mapped_file"])
-    except:
-        logger.error("Failed to get detailed memory usage")
+    for field in ResourceStatistics.DESCRIPTOR.fields_by_name:
+        if field in usage:
+            setattr(stats, field, usage[field])
 
     return stats
@@ -10,8 +10,11 @@ Containerizer subcommand to wait for a running container to exit.
 
 import logging
 
-from containerizer import app, send_proto, recv_proto, container_lock
-from containerizer.docker import invoke_docker, PIPE
+from containerizer import app, send_proto, recv_proto
+from containerizer.waiter import container_waiter
+from containerizer.events import watch_memory_events, unwatch_memory_events, memory_events
+from containerizer.logs import capture_logs, finish_logs
+from containerizer.state import read_container_state
 from containerizer.proto import Wait, Termination
 
 logger = logging.getLogger(__name__)
@@ -25,22 +28,49 @@ def wait():
 
     wait = recv_proto(Wait)
 
-    # Acquire a lock for this container
-    with container_lock(wait.container_id.value, "wait"):
+    # No lock is taken, waiting lasts for the life of the container and
+    # holding its lock for that long would stop it from being destroyed
+    logger.info("Waiting for container %s", wait.container_id.value)
 
-        logger.info("Waiting for container %s", wait.container_id.value)
+    # Write the output of the container to its sandbox, and record its OOM
+    # kills and memory pressure, while it runs
+    record = read_container_state(wait.container_id.value) or {}
+    lxc_container_id = record.get("docker_id")
+    if lxc_container_id:
+        capture_logs(wait.container_id.value, lxc_container_id, record.get("directory"))
+        watch_memory_events(wait.container_id.value, lxc_container_id)
 
-        stdout, _, return_code = invoke_docker("wait", [wait.container_id.value], stdout=PIPE)
-        if return_code > 0:
-            logger.error("Failed to wait for container, bad exit code (%d)", return_code)
-            exit(1)
+    try:
+        container_exit = container_waiter().wait(wait.container_id.value)
+    except Exception, e:
+        logger.error("Failed to wait for container: %s", e)
+        exit(1)
+    finally:
+        unwatch_memory_events(wait.container_id.value)
+        finish_logs(wait.container_id.value)
 
-        container_exit = int(stdout.readline().rstrip())
-        logger.info("Container exit code: %d", container_exit)
+    logger.info("Container exit code: %r", container_exit.status)
 
-        termination = Termination()
-        termination.killed = False
-        termination.status = container_exit
-        termination.message = ""
+    termination = Termination()
+    termination.killed = container_exit.oom_killed
+    termination.message = ""
 
-        send_proto(termination)
+    # A container removed before its exit was seen has no exit code
+    if container_exit.status is not None:
+        termination.status = container_exit.status
+    else:
+        termination.message = "Container was removed before its exit code was known"
+
+    # Docker only knows about the OOM killer when it killed the container's
+    # first process, so a failure after any of the others were killed is put
+    # down to it too
+    oom_kills = memory_events(wait.container_id.value).get("oom_kills", 0)
+
+    if container_exit.oom_killed:
+        termination.message = "Container was killed by the OOM killer"
+    elif oom_kills and container_exit.status != 0:
+        termination.killed = True
+        termination.message = "%d processes in the container were killed by the OOM killer" % \
+            oom_kills
+
+    send_proto(termination)
@@ -0,0 +1,259 @@
+
+import os
+import re
+import logging
+from collections import OrderedDict
+
+from containerizer import environ, run_path
+from containerizer.cgroups import hierarchy
+from containerizer.locks import FileLock
+from containerizer.state import read_container_state, update_container_state, \
+    list_container_states
+
+logger = logging.getLogger(__name__)
+
+SYSFS_ROOT = "/sys/devices/system"
+
+NO_CPUSETS = "none"
+EXCLUSIVE_CPUSETS = "exclusive"
+
+# Exclusive allocations always leave at least this many CPUs to share
+MIN_SHARED_CPUS = 1
+
+
+def parse_cpu_list(text):
+    """
+    Parse a kernel CPU (or memory node) list into a sorted list of numbers.
+
+    >>> parse_cpu_list("0-3,8,10-11\\n")
+    [0, 1, 2, 3, 8, 10, 11]
+    >>> parse_cpu_list("")
+    []
+    """
+
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        begin, _, end = part.partition("-")
+        cpus.update(xrange(int(begin), int(end or begin) + 1))
+
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """
+    Format numbers as a kernel CPU list, the form `--cpuset-cpus` takes.
+
+    >>> format_cpu_list([0, 1, 2, 3, 8, 10, 11])
+    '0-3,8,10-11'
+    """
+
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ",".join(
+        "%d" % begin if begin == end else "%d-%d" % (begin, end)
+        for begin, end in ranges
+    )
+
+
+def read_topology():
+    """
+    Return an ordered dictionary of NUMA node to the CPUs on it, read from
+    sysfs. Hosts without NUMA are treated as a single node.
+    """
+
+    node_directory = os.path.join(SYSFS_ROOT, "node")
+
+    nodes = {}
+    if os.path.isdir(node_directory):
+        for name in os.listdir(node_directory):
+            match = re.match(r"^node(\d+)$", name)
+            if match:
+                with open(os.path.join(node_directory, name, "cpulist"), "r") as f:
+                    nodes[int(match.group(1))] = parse_cpu_list(f.read())
+
+    if not nodes:
+        with open(os.path.join(SYSFS_ROOT, "cpu", "online"), "r") as f:
+            nodes[0] = parse_cpu_list(f.read())
+
+    return OrderedDict(sorted(nodes.items()))
+
+
+def cpuset_mode():
+    """
+    Return how containers are pinned to CPUs, set with `CONTAINERIZER_CPUSET`.
+    With "none" (the default) they aren't. With "exclusive" a container
+    asking for whole CPUs is given cores of its own, on a single NUMA node if
+    one has enough free, and every other container shares the rest.
+    """
+
+    mode = environ().get("CONTAINERIZER_CPUSET", NO_CPUSETS)
+    if mode not in (NO_CPUSETS, EXCLUSIVE_CPUSETS):
+        raise Exception("Unknown cpuset mode %r" % mode)
+
+    return mode
+
+
+def cpuset_lock():
+    return FileLock(run_path("cpusets.lock"))
+
+
+def choose_cpus(topology, free, count):
+    """
+    Choose `count` of the free CPUs, returning None if there aren't enough.
+    They come from a single node if possible, the one with the fewest free
+    CPUs that's big enough, leaving larger gaps for larger containers.
+    Otherwise they're spread over as few nodes as possible.
+
+    >>> topology = OrderedDict([(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])])
+    >>> choose_cpus(topology, set([1, 2, 3, 4, 5, 6, 7]), 3)
+    [1, 2, 3]
+    >>> choose_cpus(topology, set([2, 3, 4, 5, 6]), 4)
+    [4, 5, 6, 2]
+    """
+
+    free_by_node = [
+        (node, [cpu for cpu in cpus if cpu in free])
+        for node, cpus in topology.iteritems()
+    ]
+
+    fits = [(len(cpus), node, cpus) for node, cpus in free_by_node if len(cpus) >= count]
+    if fits:
+        _, _, cpus = min(fits)
+        return cpus[:count]
+
+    chosen = []
+    for _, cpus in sorted(free_by_node, key=lambda item: (-len(item[1]), item[0])):
+        chosen.extend(cpus[:count - len(chosen)])
+        if len(chosen) == count:
+            return chosen
+
+    return None
+
+
+def shared_pool(topology, records):
+    """
+    Return the CPUs not given to any container exclusively.
+    """
+
+    allocated = set()
+    for record in records.itervalues():
+        cpuset = record.get("cpuset")
+        if cpuset and cpuset.get("exclusive"):
+            allocated.update(cpuset["cpus"])
+
+    return [cpu for cpus in topology.itervalues() for cpu in cpus if cpu not in allocated]
+
+
+def resize_shared_pool(records, pool):
+    """
+    Move every running container sharing CPUs on to the given shared pool.
+    Running containers launched before CPUs were allocated are moved on to
+    it too, so they stay off the CPUs given to containers exclusively.
+    """
+
+    backend = hierarchy()
+    for container_id, record in records.iteritems():
+        if "cpuset" not in record and record.get("docker_id"):
+            record = dict(record, cpuset={"cpus": [], "mems": [], "exclusive": False})
+
+        cpuset = record.get("cpuset")
+        if not cpuset or cpuset.get("exclusive") or cpuset["cpus"] == pool:
+            continue
+
+        if record.get("docker_id"):
+            try:
+                backend.write_cpuset(record["docker_id"], format_cpu_list(pool))
+            except Exception, e:
+                logger.error("Failed to resize the cpuset of container %s: %s", container_id, e)
+                continue
+
+        update_container_state(container_id, cpuset=dict(cpuset, cpus=pool))
+
+
+def allocate_cpuset(container_id, cpus):
+    """
+    Choose the CPUs and memory nodes for a new container asking for `cpus`,
+    returning a dictionary of the `cpus` and `mems` (empty for any) and
+    whether it has the CPUs to itself, or None if pinning is disabled. The
+    allocation is kept with the state of the container, so it survives
+    restarts and is released when the container is destroyed.
+    """
+
+    if cpuset_mode() == NO_CPUSETS:
+        return None
+
+    with cpuset_lock():
+        topology = read_topology()
+        records = list_container_states()
+        pool = shared_pool(topology, records)
+
+        reserved = set(parse_cpu_list(environ().get("CONTAINERIZER_CPUSET_RESERVED", "")))
+
+        chosen = None
+        if cpus >= 1 and cpus == int(cpus):
+            if len(pool) - int(cpus) >= MIN_SHARED_CPUS:
+                free = set(pool) - reserved
+                chosen = choose_cpus(topology, free, int(cpus))
+            if chosen is None:
+                logger.info("Not enough free CPUs to give container %s %d of its own",
+                            container_id, cpus)
+
+        if chosen is None:
+            cpuset = {"cpus": pool, "mems": [], "exclusive": False}
+        else:
+            mems = [node for node, node_cpus in topology.iteritems()
+                    if set(node_cpus) & set(chosen)]
+            cpuset = {"cpus": sorted(chosen), "mems": mems, "exclusive": True}
+
+        logger.info("Allocated CPUs %s to container %s", format_cpu_list(cpuset["cpus"]),
+                    container_id)
+        records[container_id] = update_container_state(container_id, cpuset=cpuset)
+
+        if cpuset["exclusive"]:
+            resize_shared_pool(records, shared_pool(topology, records))
+
+    return cpuset
+
+
+def apply_cpuset(container_id, lxc_container_id):
+    """
+    Write the CPUs allocated to a container that's just been started to its
+    cgroup. The shared pool may have shrunk between the allocation and the
+    start, while the container had no docker ID to be moved by. Callers hold
+    the cpuset lock, and record the docker ID while they do.
+    """
+
+    cpuset = (read_container_state(container_id) or {}).get("cpuset")
+    if cpuset:
+        hierarchy().write_cpuset(lxc_container_id, format_cpu_list(cpuset["cpus"]))
+
+
+def release_cpuset(container_id):
+    """
+    Release the CPUs allocated to a container, giving any it had to itself
+    back to the shared pool.
+    """
+
+    record = read_container_state(container_id)
+    if not record or not record.get("cpuset"):
+        return
+
+    with cpuset_lock():
+        cpuset = (read_container_state(container_id) or {}).get("cpuset")
+        if not cpuset:
+            return
+
+        logger.info("Releasing CPUs %s of container %s", format_cpu_list(cpuset["cpus"]),
+                    container_id)
+        update_container_state(container_id, cpuset=None)
+
+        if cpuset.get("exclusive"):
+            records = list_container_states()
+            resize_shared_pool(records, shared_pool(read_topology(), records))
@@ -1,36 +1,61 @@
 
 import os
 import json
+import struct
+import socket
+import httplib
+import urllib
+import threading
 import subprocess
 import logging
 
 from subprocess import PIPE
 
+from containerizer import environ, wait_process
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+
+# The header of each frame of a multiplexed (non-TTY) output stream, the
+# stream it's from (1 for stdout, 2 for stderr) and the size of the frame
+FRAME_HEADER = struct.Struct(">BxxxL")
+
+# Labels given to the containers the containerizer launches
+CONTAINER_LABEL = "mesos.container_id"
+FRAMEWORK_LABEL = "mesos.framework_id"
+EXECUTOR_LABEL = "mesos.executor_id"
+
+# Label given to the warm containers waiting in the pool
+POOL_LABEL = "mesos.pool"
+
+# Methods of API requests that are safe to send again after a failure
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
 
-def invoke_docker(command, arguments=[], stdout=None, stderr=None):
+def invoke_docker(command, arguments=[], stdout=None, stderr=None, cancelled=None):
     """
     Invoke the docker command line tool. This function returns a tuple that
-    contains (stdout, stderr, return_code)
+    contains (stdout, stderr, return_code). The command is terminated if the
+    optional `cancelled` event is set while it runs.
     """
 
     # Build up the docker command
     invoke = ["docker"]
 
     # Include any global docker arguments
-    docker_args = os.environ.get("CONTAINERIZER_DOCKER_ARGS")
+    docker_args = environ().get("CONTAINERIZER_DOCKER_ARGS")
     if docker_args:
         invoke.extend(docker_args.split(" "))
 
     # Add the command and arguments
     invoke.append(command)
     invoke.extend(arguments)
-    
+
     logger.info("Invoking docker with %r", invoke)
 
     proc = subprocess.Popen(invoke, stdout=stdout, stderr=stderr)
-    return proc.stdout, proc.stderr, proc.wait()
+    return proc.stdout, proc.stderr, wait_process(proc, cancelled)
 
 
 def inspect_container(container):
@@ -38,9 +63,316 @@ def inspect_container(container):
     Inspect a container a return a dictionary of its properties.
     """
 
-    stdout, _, exit_code = invoke_docker("inspect", [container], stdout=PIPE)
-    if exit_code > 0:
-        raise Exception("Docker returned a bad exit code (%d)" % exit_code)
+    return docker_client().inspect_container(container)
+
+
+class DockerAPIError(Exception):
+    """
+    Raised when the docker daemon responds to an API call with an error
+    status code.
+    """
+
+    def __init__(self, status, message):
+        super(DockerAPIError, self).__init__(
+            "Docker API returned a bad status code (%d): %s" % (status, message)
+        )
+        self.status = status
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """
+    An HTTP connection that talks to a server listening on a unix socket,
+    rather than on a TCP port.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        httplib.HTTPConnection.__init__(self, "localhost")
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerClient(object):
+    """
+    A minimal client for the docker remote API, spoken over the docker unix
+    socket. HTTP/1.1 connections are kept alive and reused between requests,
+    and a small pool of them allows the client to be shared between threads.
+    """
+
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = environ().get(
+                "CONTAINERIZER_DOCKER_SOCKET", DEFAULT_DOCKER_SOCKET
+            )
+
+        self.socket_path = socket_path
+        self.idle_connections = []
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            connections, self.idle_connections = self.idle_connections, []
+
+        for connection in connections:
+            connection.close()
+
+    def acquire_connection(self):
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+
+        return UnixHTTPConnection(self.socket_path)
+
+    def release_connection(self, connection):
+        with self.lock:
+            self.idle_connections.append(connection)
+
+    def request(self, method, path, params=None, body=None):
+        """
+        Make a request to the docker API and return a tuple of the connection
+        used and the `httplib.HTTPResponse` object. The caller owns the
+        connection until it either hands it back with `release_connection`
+        once the response has been read, or closes it.
+        """
+
+        if params:
+            path = "%s?%s" % (path, urllib.urlencode(params))
+
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        logger.debug("Docker API request %s %s", method, path)
+
+        # The docker daemon is free to close an idle keep-alive connection,
+        # in which case we reconnect and retry the request once. A request
+        # that was sent may have been acted on even though no response came
+        # back, so only idempotent ones are retried once they're sent.
+        for attempt in (1, 2):
+            connection = self.acquire_connection()
+            sent = False
+            try:
+                connection.request(method, path, body, headers)
+                sent = True
+                return connection, connection.getresponse()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+                connection.close()
+                if attempt == 2 or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+
+    def call(self, method, path, params=None, body=None):
+        """
+        Make a request to the docker API and return the decoded JSON response
+        body, or None if the response had no body.
+        """
+
+        connection, response = self.request(method, path, params=params, body=body)
+        data = response.read()
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.release_connection(connection)
+
+        if response.status >= 400:
+            raise DockerAPIError(response.status, data.strip())
+
+        if not data:
+            return None
+
+        return json.loads(data)
+
+    def info(self):
+        return self.call("GET", "/info")
+
+    def inspect_container(self, container):
+        return self.call("GET", "/containers/%s/json" % container)
+
+    def inspect_image(self, image):
+        return self.call("GET", "/images/%s/json" % image)
+
+    def list_containers(self, all=False, filters=None):
+        params = {}
+        if all:
+            params["all"] = 1
+        if filters:
+            params["filters"] = json.dumps(filters)
+
+        return self.call("GET", "/containers/json", params=params)
+
+    def start_container(self, container):
+        self.call("POST", "/containers/%s/start" % container)
+
+    def rename_container(self, container, name):
+        self.call("POST", "/containers/%s/rename" % container, params={"name": name})
+
+    def stop_container(self, container, timeout=None):
+        """
+        Stop a container, sending it SIGTERM and then SIGKILL if it's still
+        running after `timeout` seconds.
+        """
+
+        params = {}
+        if timeout is not None:
+            params["t"] = timeout
+
+        self.call("POST", "/containers/%s/stop" % container, params=params)
+
+    def kill_container(self, container, signal=None):
+        params = {}
+        if signal:
+            params["signal"] = signal
+
+        self.call("POST", "/containers/%s/kill" % container, params=params)
+
+    def remove_container(self, container, volumes=False, force=False):
+        params = {}
+        if volumes:
+            params["v"] = 1
+        if force:
+            params["force"] = 1
+
+        self.call("DELETE", "/containers/%s" % container, params=params)
+
+    def events(self, filters=None):
+        """
+        Subscribe to the docker event stream, returning a generator of event
+        dictionaries. The subscription is in place by the time this returns.
+        The generator blocks waiting for events, and holds its own connection
+        to docker until it is closed.
+        """
+
+        params = {}
+        if filters:
+            params["filters"] = json.dumps(filters)
+
+        connection, response = self.request("GET", "/events", params=params)
+
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            raise DockerAPIError(response.status, data.strip())
+
+        return self.iter_events(connection, response)
+
+    def iter_events(self, connection, response):
+        decoder = json.JSONDecoder()
+        data = ""
+
+        try:
+            for chunk in iter_response_chunks(response):
+                data += chunk
+
+                # Events may or may not be separated by newlines
+                while True:
+                    data = data.lstrip()
+                    if not data:
+                        break
+                    try:
+                        event, end = decoder.raw_decode(data)
+                    except ValueError:
+                        break  # Incomplete, wait for the rest
+
+                    data = data[end:]
+                    yield event
+        finally:
+            connection.close()
+
+    def logs(self, container, since=None):
+        """
+        Follow the output of a container, returning a generator of (stream,
+        data) tuples where the stream is 1 for stdout and 2 for stderr. Each
+        line of output is prefixed with the time it was written, and only
+        output since the given unix time is included. The generator ends
+        once the container stops, and holds its own connection to docker.
+        """
+
+        params = {"follow": 1, "stdout": 1, "stderr": 1, "timestamps": 1}
+        if since:
+            params["since"] = int(since)
+
+        connection, response = self.request("GET", "/containers/%s/logs" % container,
+                                            params=params)
+
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            raise DockerAPIError(response.status, data.strip())
+
+        return self.iter_frames(connection, response)
+
+    def iter_frames(self, connection, response):
+        data = ""
+
+        try:
+            for chunk in iter_response_chunks(response):
+                data += chunk
+
+                offset = 0
+                while len(data) - offset >= FRAME_HEADER.size:
+                    stream, size = FRAME_HEADER.unpack_from(data, offset)
+                    end = offset + FRAME_HEADER.size + size
+                    if len(data) < end:
+                        break  # Incomplete, wait for the rest
+
+                    yield stream, data[offset + FRAME_HEADER.size:end]
+                    offset = end
+
+                data = data[offset:]
+        finally:
+            connection.close()
+
+    def wait_container(self, container):
+        """
+        Block until the given container stops, and return its exit code.
+        """
+
+        result = self.call("POST", "/containers/%s/wait" % container)
+        return int(result["StatusCode"])
+
+
+def iter_response_chunks(response):
+    """
+    Return a generator of the chunks of a streamed HTTP response as they
+    arrive. `httplib` would otherwise block until it had read a fixed amount.
+    """
+
+    if not response.chunked:
+        while True:
+            line = response.fp.readline()
+            if not line:
+                return
+            yield line
+
+    while True:
+        size = int(response.fp.readline().split(";", 1)[0], 16)
+        if size == 0:
+            return
+
+        chunk = response.fp.read(size)
+        response.fp.read(2)  # Trailing CRLF
+        yield chunk
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def docker_client():
+    """
+    Return the shared `DockerClient` for this process, creating it if needed.
+    """
+
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DockerClient()
 
-    containers = json.load(stdout)
-    return containers[0]
+    return _client
@@ -0,0 +1,434 @@
+
+import os
+import time
+import errno
+import fcntl
+import select
+import struct
+import ctypes
+import logging
+import threading
+
+from containerizer import environ, environment
+from containerizer.cgroups import hierarchy
+from containerizer.state import read_container_state, update_container_state
+
+logger = logging.getLogger(__name__)
+
+EFD_NONBLOCK = 04000
+EFD_CLOEXEC = 02000000
+
+IN_NONBLOCK = 04000
+IN_CLOEXEC = 02000000
+IN_MODIFY = 0x2
+IN_IGNORED = 0x8000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# The memory pressure levels notified about, from least to most severe. On
+# the unified hierarchy these are pressure stall triggers, of tasks stalled
+# on memory for the given time (in microseconds) in each second.
+PRESSURE_LEVELS = ("medium", "critical")
+PRESSURE_TRIGGERS = {
+    "medium": "some 150000 1000000",
+    "critical": "full 150000 1000000"
+}
+
+# Memory pressure is recorded at most this often, in seconds, per container.
+# OOM events are recorded straight away.
+FLUSH_INTERVAL = 1
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    return _libc
+
+
+def check_call(result):
+    if result < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return result
+
+
+def eventfd():
+    return check_call(libc().eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC))
+
+
+def read_counter(fd):
+    """
+    Read and reset the counter of an eventfd, returning 0 if it wasn't set.
+    """
+
+    try:
+        return struct.unpack("Q", os.read(fd, 8))[0]
+    except OSError, e:
+        if e.errno != errno.EAGAIN:
+            raise
+        return 0
+
+
+def read_counters(path):
+    """
+    Read a flat keyed cgroup file of counters. It isn't read through a cached
+    handle, which would keep the file around after the cgroup is removed and
+    stop inotify from noticing.
+    """
+
+    with open(path, "r") as f:
+        fields = f.read().split()
+
+    return dict(zip(fields[0::2], fields[1::2]))
+
+
+class ContainerEvents(object):
+    """
+    The memory events seen for a container, and the file descriptors open to
+    be notified of them.
+    """
+
+    def __init__(self, container_id, lxc_container_id):
+        self.container_id = container_id
+        self.lxc_container_id = lxc_container_id
+        self.directory = None
+        self.fds = []
+        self.watch_descriptor = None
+        self.dirty = False
+        self.flushed_at = 0
+
+        # Events are handled by the monitor thread, in the environment of
+        # whoever asked for them to be watched
+        self.environ = environ()
+
+        # Carry on counting from any events recorded by a previous watch
+        record = read_container_state(container_id) or {}
+        self.events = dict(record.get("memory_events") or {})
+
+    def count(self, name, amount=1):
+        self.events[name] = self.events.get(name, 0) + amount
+        self.dirty = True
+
+    def set(self, name, value):
+        if self.events.get(name) != value:
+            self.events[name] = value
+            self.dirty = True
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+
+class MemoryMonitor(threading.Thread):
+    """
+    Records OOM kills and memory pressure of containers into their state as
+    the kernel notifies us of them, rather than anything polling for them.
+    The legacy (v1) hierarchy notifies through eventfds registered against
+    `memory.oom_control` and `memory.pressure_level`. The unified (v2)
+    hierarchy is watched with inotify on `memory.events`, and pressure stall
+    triggers on `memory.pressure`. Every file descriptor is waited on by this
+    one thread.
+    """
+
+    def __init__(self):
+        super(MemoryMonitor, self).__init__(name="memory-monitor")
+        self.daemon = True
+        self.lock = threading.RLock()
+        self.poller = select.epoll()
+        self.handlers = {}  # File descriptor to (ContainerEvents, callable)
+        self.containers = {}  # Container ID to ContainerEvents
+        self.inotify_fd = None
+        self.watch_descriptors = {}  # inotify watch descriptor to ContainerEvents
+
+    def watch(self, container_id, lxc_container_id):
+        """
+        Start recording the memory events of a container, if they aren't
+        already being recorded.
+        """
+
+        with self.lock:
+            if container_id in self.containers:
+                return
+
+            events = ContainerEvents(container_id, lxc_container_id)
+            backend = hierarchy()
+            try:
+                if backend.version == 1:
+                    self.watch_v1(backend, events)
+                else:
+                    self.watch_v2(backend, events)
+            except Exception:
+                self.forget(events)
+                raise
+
+            self.containers[container_id] = events
+
+        logger.info("Watching memory events of container %s", container_id)
+
+    def unwatch(self, container_id):
+        """
+        Stop recording the memory events of a container, recording any that
+        haven't been yet.
+        """
+
+        with self.lock:
+            events = self.containers.pop(container_id, None)
+            if events is None:
+                return
+
+            self.forget(events)
+
+        self.flush(events)
+
+    def forget(self, events):
+        for fd in events.fds:
+            self.handlers.pop(fd, None)
+            try:
+                self.poller.unregister(fd)
+            except (IOError, ValueError):
+                pass
+
+        if events.watch_descriptor is not None:
+            self.watch_descriptors.pop(events.watch_descriptor, None)
+            libc().inotify_rm_watch(self.inotify_fd, events.watch_descriptor)
+
+        events.close()
+
+    def register(self, events, fd, handler, mask=select.EPOLLIN):
+        events.fds.append(fd)
+        self.poller.register(fd, mask)
+        self.handlers[fd] = (events, handler)
+
+    def watch_v1(self, backend, events):
+        events.directory = backend.cgroup_directory(events.lxc_container_id, "memory")
+        if events.directory is None:
+            raise Exception("No memory cgroup for container %s" % events.container_id)
+
+        def register_event(control_file, handler, arguments=None):
+            control_fd = os.open(os.path.join(events.directory, control_file), os.O_RDONLY)
+            events.fds.append(control_fd)
+
+            event_fd = eventfd()
+            self.register(events, event_fd, lambda: handler(event_fd))
+
+            event = "%d %d" % (event_fd, control_fd)
+            if arguments:
+                event += " " + arguments
+            with open(os.path.join(events.directory, "cgroup.event_control"), "w") as f:
+                f.write(event)
+
+        register_event("memory.oom_control", lambda fd: self.oom_v1(events, fd))
+
+        # Pressure notifications need Linux 3.10 or later
+        if os.path.exists(os.path.join(events.directory, "memory.pressure_level")):
+            for level in PRESSURE_LEVELS:
+                register_event("memory.pressure_level",
+                               lambda fd, level=level: self.pressure(events, level, fd),
+                               level)
+
+    def oom_v1(self, events, fd):
+        oom_events = read_counter(fd)
+
+        # The eventfd is also signalled when the cgroup is removed
+        if not os.path.isdir(events.directory):
+            self.unwatch(events.container_id)
+            return
+
+        if oom_events:
+            events.count("oom_events", oom_events)
+
+        oom_control = read_counters(os.path.join(events.directory, "memory.oom_control"))
+        if "oom_kill" in oom_control:  # Linux 4.13 and later
+            events.set("oom_kills", int(oom_control["oom_kill"]))
+
+        self.flush(events)
+
+    def watch_v2(self, backend, events):
+        events.directory = backend.cgroup_directory(events.lxc_container_id)
+        if events.directory is None:
+            raise Exception("No cgroup for container %s" % events.container_id)
+
+        if self.inotify_fd is None:
+            self.inotify_fd = check_call(libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+            self.poller.register(self.inotify_fd, select.EPOLLIN)
+            self.handlers[self.inotify_fd] = (None, self.inotify_v2)
+
+        path = os.path.join(events.directory, "memory.events")
+        events.watch_descriptor = check_call(
+            libc().inotify_add_watch(self.inotify_fd, path, IN_MODIFY)
+        )
+        self.watch_descriptors[events.watch_descriptor] = events
+
+        # Pick up anything that happened before the watch was added
+        self.refresh_v2(events)
+
+        for level in PRESSURE_LEVELS:
+            path = os.path.join(events.directory, "memory.pressure")
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+                break
+
+            try:
+                fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+                os.write(fd, PRESSURE_TRIGGERS[level] + "\0")
+                self.poller.register(fd, select.EPOLLPRI)
+            except (IOError, OSError), e:
+                # Pressure stall triggers need Linux 5.2 or later
+                logger.info("Unable to watch memory pressure of %s: %s", events.container_id, e)
+                os.close(fd)
+                break
+
+            events.fds.append(fd)
+            self.handlers[fd] = (events, lambda level=level: self.pressure(events, level))
+
+    def inotify_v2(self):
+        try:
+            data = os.read(self.inotify_fd, 65536)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+            return
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size + length
+
+            events = self.watch_descriptors.get(watch_descriptor)
+            if events is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # The cgroup has been removed
+                events.watch_descriptor = None
+                with environment(events.environ):
+                    self.unwatch(events.container_id)
+            elif events not in changed:
+                changed.append(events)
+
+        for events in changed:
+            if events.container_id in self.containers:
+                with environment(events.environ):
+                    self.refresh_v2(events)
+                    self.flush(events)
+
+    def refresh_v2(self, events):
+        memory_events = read_counters(os.path.join(events.directory, "memory.events"))
+        for key, name in (("oom_kill", "oom_kills"), ("oom", "oom_events"),
+                          ("high", "high_events")):
+            if key in memory_events:
+                events.set(name, int(memory_events[key]))
+
+    def pressure(self, events, level, fd=None):
+        # The eventfds are also signalled when the cgroup is removed
+        if not os.path.isdir(events.directory):
+            self.unwatch(events.container_id)
+            return
+
+        if fd is not None:
+            read_counter(fd)
+
+        events.count("pressure_%s_events" % level)
+        events.set("pressure_level", level)
+        events.set("pressure_at", int(time.time()))
+
+        # Pressure can be notified many times a second, so it's only recorded
+        # every so often
+        if time.time() - events.flushed_at >= FLUSH_INTERVAL:
+            self.flush(events)
+
+    def flush(self, events):
+        if not events.dirty:
+            return
+
+        events.dirty = False
+        events.flushed_at = time.time()
+
+        # Don't bring back the record of a container that's been destroyed
+        if read_container_state(events.container_id) is not None:
+            update_container_state(events.container_id, memory_events=dict(events.events))
+
+    def run(self):
+        while True:
+            try:
+                ready = self.poller.poll(FLUSH_INTERVAL)
+            except IOError, e:
+                if e.errno != errno.EINTR:
+                    raise
+                continue
+
+            for fd, _ in ready:
+                with self.lock:
+                    if fd not in self.handlers:
+                        continue
+                    events, handler = self.handlers[fd]
+                    try:
+                        if events is None:
+                            handler()
+                        else:
+                            with environment(events.environ):
+                                handler()
+                    except Exception:
+                        logger.exception("Failed to handle memory event")
+
+            # Record pressure held back by the flush interval
+            with self.lock:
+                for events in self.containers.values():
+                    if events.dirty and time.time() - events.flushed_at >= FLUSH_INTERVAL:
+                        with environment(events.environ):
+                            self.flush(events)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def start_memory_monitor():
+    """
+    Start recording memory events in a thread of this process.
+    """
+
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = MemoryMonitor()
+            _monitor.start()
+
+
+def watch_memory_events(container_id, lxc_container_id):
+    """
+    Record the memory events of a container while it's running. Failing to
+    watch a container is logged rather than raised, the events are only
+    informational.
+    """
+
+    start_memory_monitor()
+    try:
+        _monitor.watch(container_id, lxc_container_id)
+    except Exception, e:
+        logger.error("Unable to watch memory events of container %s: %s", container_id, e)
+
+
+def unwatch_memory_events(container_id):
+    if _monitor is not None:
+        _monitor.unwatch(container_id)
+
+
+def memory_events(container_id):
+    """
+    Return the memory events recorded for a container, a dictionary that may
+    contain counts of `oom_kills`, `oom_events`, `high_events` and
+    `pressure_<level>_events`, and the last `pressure_level` seen along with
+    the time it was seen (`pressure_at`).
+    """
+
+    record = read_container_state(container_id) or {}
+    return record.get("memory_events") or {}
@@ -1,16 +1,375 @@
-
 import os
 import json
+import stat
+import time
+import errno
+import fcntl
+import shutil
+import hashlib
 import logging
+import tarfile
+import zipfile
+import tempfile
+import urllib2
+import urlparse
 import subprocess
 from subprocess import PIPE
+from multiprocessing.pool import ThreadPool
+
+from containerizer import environ, state_path, wait_process
+from containerizer.locks import FileLock, LockTimeout
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+DEFAULT_FETCH_TIMEOUT = 60  # Seconds
+
+# Downloads are copied in chunks of this many bytes, checking between each
+# whether the fetch has been cancelled
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# URI schemes fetched by the containerizer itself, everything else is handed
+# to the mesos-fetcher
+BUILTIN_SCHEMES = ("", "file", "http", "https")
+
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".zip")
+
+# The FICLONE ioctl, to reflink a file on filesystems that support it
+FICLONE = 0x40049409
+
+
+def fetch_uris(sandbox_directory, uris, cancelled=None):
+    """
+    Download the given URIs into the sandbox. URIs the containerizer knows how
+    to fetch go through a content addressed download cache and are fetched in
+    parallel, any others are passed on to the mesos-fetcher tool. Returns a
+    non-zero exit code on failure, including when the `cancelled` event is
+    set part way through.
+    """
+
+    builtin_uris = []
+    fetcher_uris = []
+    for uri in uris:
+        if urlparse.urlparse(uri.value).scheme in BUILTIN_SCHEMES:
+            builtin_uris.append(uri)
+        else:
+            fetcher_uris.append(uri)
+
+    exit_code = 0
+
+    if builtin_uris:
+        workers = int(environ().get("CONTAINERIZER_FETCH_WORKERS", DEFAULT_FETCH_WORKERS))
+        cache = DownloadCache(
+            environ().get("CONTAINERIZER_FETCH_CACHE_DIR", state_path("fetch-cache")),
+            int(environ().get("CONTAINERIZER_FETCH_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        )
+
+        pool = ThreadPool(min(workers, len(builtin_uris)))
+        try:
+            results = pool.map(
+                lambda uri: fetch_uri(cache, sandbox_directory, uri, cancelled), builtin_uris
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        if not all(results):
+            exit_code = 1
+
+        cache.evict()
+
+    if cancelled is not None and cancelled.is_set():
+        return 1
+
+    if fetcher_uris:
+        exit_code = max(exit_code,
+                        run_mesos_fetcher(sandbox_directory, fetcher_uris, cancelled))
+
+    return exit_code
+
+
+def fetch_uri(cache, sandbox_directory, uri, cancelled=None):
+    """
+    Fetch a single URI into the sandbox, by way of the download cache.
+    Returns whether the URI was fetched successfully.
+    """
+
+    if cancelled is not None and cancelled.is_set():
+        return False
+
+    try:
+        path = urlparse.urlparse(uri.value).path
+        destination = os.path.join(sandbox_directory, os.path.basename(path))
+
+        started = time.time()
+        with cache.lock(shared=True):
+            copy_file(cache.fetch(uri.value, cancelled), destination)
+
+        if uri.HasField("executable") and uri.executable:
+            os.chmod(destination, 0755)
+        elif uri.extract and is_archive(destination):
+            extract_archive(destination, sandbox_directory)
+
+        logger.info("Fetched %s in %.3fs", uri.value, time.time() - started)
+        return True
+    except Exception:
+        logger.exception("Failed to fetch %s", uri.value)
+        return False
+
+
+class DownloadCache(object):
+    """
+    A cache of downloaded files, keyed by a hash of the URI and a validator
+    (the ETag or last modified time) so a changed resource is a different
+    entry. The least recently used entries are evicted once the cache grows
+    beyond its maximum size in bytes.
+
+    Entries are fetched and copied out holding a shared lock on the cache,
+    and evicted holding an exclusive one, so an entry can't be removed
+    between being looked up and copied.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def lock(self, shared=False, timeout=None):
+        return FileLock(os.path.join(self.directory, ".lock"), shared=shared, timeout=timeout)
+
+    def fetch(self, uri, cancelled=None):
+        """
+        Return the path of a cached copy of the given URI, downloading it if
+        it isn't already cached. The download stops with an exception if the
+        `cancelled` event is set.
+        """
+
+        url = urlparse.urlparse(uri)
+
+        if url.scheme in ("", "file"):
+            info = os.stat(url.path)
+            validator = "%d-%d" % (info.st_mtime, info.st_size)
+            open_uri = lambda: open(url.path, "rb")
+        else:
+            validator = http_validator(uri)
+            open_uri = lambda: urllib2.urlopen(uri, timeout=fetch_timeout())
+
+        if validator is None:
+            # Nothing to tell if the resource changed, so it can't be cached
+            key = "uncached-%s" % hashlib.sha256("%s %f" % (uri, time.time())).hexdigest()
+        else:
+            key = hashlib.sha256("%s %s" % (uri, validator)).hexdigest()
+
+        path = os.path.join(self.directory, key)
+
+        if os.path.exists(path):
+            logger.info("Download cache hit for %s", uri)
+            os.utime(path, None)  # Mark as recently used
+            return path
+
+        logger.info("Downloading %s", uri)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".download.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                source = open_uri()
+                try:
+                    while True:
+                        if cancelled is not None and cancelled.is_set():
+                            raise Exception("Download of %s was cancelled" % uri)
+                        data = source.read(DOWNLOAD_CHUNK_SIZE)
+                        if not data:
+                            break
+                        f.write(data)
+                finally:
+                    source.close()
+
+            os.rename(temp_path, path)
+        except:
+            os.unlink(temp_path)
+            raise
+
+        return path
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits within its
+        maximum size. Eviction is skipped while entries are being fetched,
+        rather than holding up those launches, and left to whichever fetch
+        finishes last.
+        """
+
+        try:
+            with self.lock(timeout=0):
+                self.evict_entries()
+        except LockTimeout:
+            logger.debug("Download cache is in use, not evicting")
+
+    def evict_entries(self):
+        entries = []
+        total_size = 0
+
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue  # In progress download, or the lock
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, name))
+            total_size += info.st_size
+
+        for mtime, size, name in sorted(entries):
+            if total_size <= self.max_size and not name.startswith("uncached-"):
+                continue
+
+            logger.info("Evicting %s from the download cache", name)
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total_size -= size
+
+
+def fetch_timeout():
+    return float(environ().get("CONTAINERIZER_FETCH_TIMEOUT", DEFAULT_FETCH_TIMEOUT))
+
+
+def http_validator(uri):
+    """
+    Return the ETag or Last-Modified header for an HTTP resource, or None.
+    """
+
+    request = urllib2.Request(uri)
+    request.get_method = lambda: "HEAD"
+
+    try:
+        response = urllib2.urlopen(request, timeout=fetch_timeout())
+    except urllib2.HTTPError, e:
+        # Not every server supports HEAD, in which case the resource can still
+        # be downloaded but not cached
+        logger.info("HEAD request for %s failed (%d)", uri, e.code)
+        return None
+
+    try:
+        return response.info().get("ETag") or response.info().get("Last-Modified")
+    finally:
+        response.close()
+
+
+def copy_file(source, destination):
+    """
+    Copy a file from the cache to the destination, as a copy-on-write
+    reflink if the filesystem supports it. It's never hard linked, so
+    writing to or changing the mode of the copy leaves the cache alone.
+    """
+
+    if os.path.exists(destination):
+        os.unlink(destination)
+
+    with open(source, "rb") as src:
+        with open(destination, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except IOError:
+                pass
+
+    shutil.copy2(source, destination)
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_EXTENSIONS)
+
+
+def check_member(directory, name, links=()):
+    """
+    Raise if an archive member would be extracted outside the directory, or
+    through one of the symbolic `links` in the archive, which could point
+    anywhere by the time the member is written.
+    """
+
+    root = os.path.realpath(directory)
+    target = os.path.realpath(os.path.join(root, name))
+    if target != root and not target.startswith(root + os.sep):
+        raise Exception("Archive member %s is outside the sandbox" % name)
+
+    parent = os.path.dirname(os.path.normpath(name))
+    while parent:
+        if parent in links:
+            raise Exception("Archive member %s is inside the link %s" % (name, parent))
+        parent = os.path.dirname(parent)
+
+
+def is_zip_link(info):
+    return stat.S_ISLNK(info.external_attr >> 16)
+
+
+def extract_archive(path, directory):
+    """
+    Extract an archive into the directory. Extraction runs as root, so
+    members that would land outside the directory, links that point outside
+    it, and devices and fifos are refused before anything is extracted.
+    """
+
+    logger.info("Extracting %s", path)
+
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            members = archive.infolist()
+            links = set(os.path.normpath(i.filename) for i in members if is_zip_link(i))
+
+            targets = {}
+            for info in members:
+                check_member(directory, info.filename, links)
+                if is_zip_link(info):
+                    targets[info.filename] = archive.read(info)
+                    check_member(directory, os.path.join(
+                        os.path.dirname(info.filename), targets[info.filename]))
+
+            # zipfile writes links out as files holding their target
+            for info in members:
+                if info.filename not in targets:
+                    archive.extract(info, directory)
+                    continue
+
+                link_path = os.path.join(directory, info.filename)
+                if not os.path.isdir(os.path.dirname(link_path)):
+                    os.makedirs(os.path.dirname(link_path))
+                if os.path.lexists(link_path):
+                    os.unlink(link_path)
+                os.symlink(targets[info.filename], link_path)
+    else:
+        archive = tarfile.open(path)
+        try:
+            members = archive.getmembers()
+            links = set(os.path.normpath(m.name) for m in members if m.issym())
+
+            for member in members:
+                check_member(directory, member.name, links)
+                if member.issym():
+                    check_member(directory, os.path.join(
+                        os.path.dirname(member.name), member.linkname))
+                elif member.islnk():
+                    # Hard links are relative to the root of the archive
+                    check_member(directory, member.linkname, links)
+                elif member.isdev():
+                    raise Exception("Archive member %s is a device or fifo" % member.name)
+            archive.extractall(directory)
+        finally:
+            archive.close()
+
 
-def fetch_uris(sandbox_directory, uris):
+def run_mesos_fetcher(sandbox_directory, uris, cancelled=None):
     """
-    Invoke the mesos-fetcher tool and download the given URIs.
+    Invoke the mesos-fetcher tool and download the given URIs. The tool is
+    terminated if the `cancelled` event is set while it runs.
     """
 
     # Build up the URIs
@@ -34,14 +393,14 @@ def fetch_uris(sandbox_directory, uris):
         fetcher_uris.append(uri_string)
 
     # Pass through the LD_LIBRARY_PATH
-    library_path = os.environ.get("LD_LIBRARY_PATH", "")
+    library_path = environ().get("LD_LIBRARY_PATH", "")
     logger.info("LD_LIBRARY_PATH: %s", library_path)
 
-    fetcher_path = os.path.join(os.environ["MESOS_LIBEXEC_DIRECTORY"], "mesos-fetcher")
+    fetcher_path = os.path.join(environ()["MESOS_LIBEXEC_DIRECTORY"], "mesos-fetcher")
     proc = subprocess.Popen([fetcher_path], env={
         "MESOS_EXECUTOR_URIS": " ".join(fetcher_uris),
         "MESOS_WORK_DIRECTORY": sandbox_directory,
         "LD_LIBRARY_PATH": library_path
     })
 
-    return proc.wait()
+    return wait_process(proc, cancelled)
@@ -0,0 +1,60 @@
+
+import logging
+
+from containerizer.cgroups import cgroup_exists
+from containerizer.docker import inspect_container
+from containerizer.state import read_container_state, update_container_state, \
+    remove_container_state
+
+logger = logging.getLogger(__name__)
+
+
+def cache_container_id(container_id, lxc_container_id):
+    """
+    Remember the full docker (and cgroup) ID of a container in its state
+    record.
+    """
+
+    update_container_state(container_id, docker_id=lxc_container_id)
+
+
+def forget_container_id(container_id):
+    """
+    Drop the state record of a container, along with its docker ID.
+    """
+
+    remove_container_state(container_id)
+
+
+def cached_container_id(container_id):
+    """
+    Return the recorded docker ID of a container, or None.
+    """
+
+    record = read_container_state(container_id)
+    return record.get("docker_id") if record else None
+
+
+def lookup_container_id(container_id):
+    """
+    Return the full docker (and cgroup) ID of a container. The cache is
+    trusted as long as the container's cgroup still exists, otherwise docker
+    is asked and the cache refreshed.
+    """
+
+    lxc_container_id = cached_container_id(container_id)
+    if lxc_container_id and cgroup_exists(lxc_container_id):
+        return lxc_container_id
+
+    logger.info("Container ID cache miss for %s, inspecting container", container_id)
+
+    info = inspect_container(container_id)
+    lxc_container_id = info.get("ID", info.get("Id"))
+
+    if lxc_container_id is None:
+        raise Exception("Failed to get full container ID")
+
+    if cgroup_exists(lxc_container_id):
+        cache_container_id(container_id, lxc_container_id)
+
+    return lxc_container_id
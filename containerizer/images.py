@@ -0,0 +1,163 @@
+
+import os
+import json
+import time
+import errno
+import hashlib
+import logging
+import tempfile
+
+from containerizer import environ, state_path
+from containerizer.locks import FileLock
+from containerizer.docker import invoke_docker, docker_client, DockerAPIError
+
+logger = logging.getLogger(__name__)
+
+# Pull policies, configured with `CONTAINERIZER_PULL_POLICY`
+ALWAYS = "always"
+IF_NOT_PRESENT = "if-not-present"
+MAX_AGE = "max-age"
+NEVER_FOR_DIGESTS = "never-for-digests"
+
+POLICIES = (ALWAYS, IF_NOT_PRESENT, MAX_AGE, NEVER_FOR_DIGESTS)
+
+DEFAULT_MAX_AGE = 300
+
+
+def index_path(image):
+    return state_path("images", hashlib.sha1(image).hexdigest())
+
+
+def read_index(image):
+    """
+    Return the index entry for an image reference, a dictionary containing
+    the resolved `digest` and the `pulled_at` time, or None.
+    """
+
+    try:
+        with open(index_path(image), "r") as f:
+            return json.load(f)
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    except ValueError:
+        logger.error("Ignoring corrupt image index entry for %s", image)
+
+    return None
+
+
+def make_index_directory():
+    directory = state_path("images")
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def write_index(image, digest, pulled_at):
+    make_index_directory()
+
+    fd, temp_path = tempfile.mkstemp(dir=state_path("images"), prefix=".image.")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"image": image, "digest": digest, "pulled_at": pulled_at}, f)
+
+    os.rename(temp_path, index_path(image))
+
+
+def is_pinned(image):
+    """
+    Return whether an image reference is pinned by digest, and so can never
+    change once it has been pulled.
+    """
+
+    return "@sha256:" in image
+
+
+def image_digest(image):
+    """
+    Return the digest docker has for a local image, its ID if it has no
+    repository digest, or None if the image isn't present.
+    """
+
+    try:
+        info = docker_client().inspect_image(image)
+    except DockerAPIError, e:
+        if e.status == 404:
+            return None
+        raise
+
+    repo_digests = info.get("RepoDigests") or []
+    return repo_digests[0] if repo_digests else info.get("Id")
+
+
+def needs_pull(image, policy, max_age):
+    """
+    Decide whether an image has to be pulled under the given policy.
+    """
+
+    if policy == ALWAYS:
+        return True
+
+    if policy == NEVER_FOR_DIGESTS and not is_pinned(image):
+        return True
+
+    if policy == MAX_AGE and not is_pinned(image):
+        entry = read_index(image)
+        if entry is None or time.time() - entry["pulled_at"] > max_age:
+            return True
+
+    # The image should be present, make sure docker agrees
+    return image_digest(image) is None
+
+
+def pull_image(image, cancelled=None):
+    """
+    Pull an image and record it in the index. Raises an exception if the
+    pull fails, or is stopped by setting the `cancelled` event.
+    """
+
+    logger.info("Pulling docker image: %s", image)
+    _, _, return_code = invoke_docker("pull", [image], cancelled=cancelled)
+    if cancelled is not None and cancelled.is_set():
+        raise Exception("Pull of %s was cancelled" % image)
+    if return_code > 0:
+        raise Exception("Failed to pull image (%d)" % return_code)
+
+    write_index(image, image_digest(image), time.time())
+
+
+def ensure_image(image, cancelled=None):
+    """
+    Make sure an image is available to launch, pulling it if the configured
+    pull policy requires it. Concurrent launches of the same image wait on a
+    single pull rather than each pulling it themselves. A pull is stopped if
+    the `cancelled` event is set, once the launch has failed some other way.
+    """
+
+    policy = environ().get("CONTAINERIZER_PULL_POLICY", ALWAYS)
+    if policy not in POLICIES:
+        raise Exception("Unknown pull policy %r" % policy)
+
+    max_age = int(environ().get("CONTAINERIZER_PULL_MAX_AGE", DEFAULT_MAX_AGE))
+
+    if not needs_pull(image, policy, max_age):
+        logger.info("Using local docker image: %s", image)
+        return
+
+    started = time.time()
+    make_index_directory()
+
+    with FileLock(index_path(image) + ".lock"):
+
+        # Another launch may have pulled the image while we were waiting
+        entry = read_index(image)
+        if entry is not None and entry["pulled_at"] >= started:
+            logger.info("Image %s was pulled by a concurrent launch", image)
+            return
+
+        if cancelled is not None and cancelled.is_set():
+            raise Exception("Pull of %s was cancelled" % image)
+
+        pull_image(image, cancelled)
@@ -0,0 +1,154 @@
+
+import os
+import errno
+import fcntl
+import threading
+
+
+class LockTimeout(Exception):
+    """
+    Raised when a lock couldn't be acquired within its timeout.
+    """
+
+    pass
+
+
+class FileLock(object):
+    """
+    A lock on a file using `flock`, so it's held by an open file description
+    rather than the existence of the file. It excludes other processes and
+    other threads of this process alike, waiters block in the kernel rather
+    than polling, and it's released by the kernel if the holder dies.
+
+    A shared lock can be held by many holders at once, an exclusive one only
+    by one. A timeout of None waits forever, and 0 gives up straight away.
+    """
+
+    def __init__(self, path, shared=False, timeout=None):
+        self.path = path
+        self.operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        self.timeout = timeout
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+            lock_file(fd, self.operation, self.timeout, self.path)
+
+            # The file may have been removed by the previous holder while we
+            # were waiting, in which case the lock we hold is on nothing.
+            try:
+                info = os.stat(self.path)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    os.close(fd)
+                    raise
+                info = None
+
+            fd_info = os.fstat(fd)
+            if info is not None and (info.st_dev, info.st_ino) == (fd_info.st_dev, fd_info.st_ino):
+                self.fd = fd
+                return
+
+            os.close(fd)
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def remove(self):
+        """
+        Remove the lock file while holding the lock, for when whatever it
+        protects is gone for good. Anyone waiting on it will try again.
+        """
+
+        try:
+            os.unlink(self.path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def lock_file(fd, operation, timeout, path):
+    """
+    Take a `flock` on the file descriptor, waiting up to `timeout` seconds.
+    If the lock can't be taken the file descriptor is closed, or will be once
+    the wait in the background finishes, and `LockTimeout` is raised.
+    """
+
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return
+    except IOError, e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            os.close(fd)
+            raise
+
+    if timeout is not None and timeout <= 0:
+        os.close(fd)
+        raise LockTimeout("Lock %s is held" % path)
+
+    if timeout is None:
+        try:
+            blocking_flock(fd, operation)
+        except:
+            os.close(fd)
+            raise
+        return
+
+    # flock can't time out, so wait for it in a thread. If we give up first,
+    # the thread drops the lock as soon as it gets it.
+    guard = threading.Lock()
+    acquired = threading.Event()
+    state = {"abandoned": False, "error": None}
+
+    def wait():
+        try:
+            blocking_flock(fd, operation)
+        except Exception, e:
+            state["error"] = e
+
+        with guard:
+            if state["abandoned"] or state["error"]:
+                os.close(fd)
+            acquired.set()
+
+    thread = threading.Thread(target=wait, name="lock-%s" % os.path.basename(path))
+    thread.daemon = True
+    thread.start()
+
+    acquired.wait(timeout)
+
+    with guard:
+        if not acquired.is_set():
+            state["abandoned"] = True
+            raise LockTimeout("Timed out after %ss waiting for lock %s" % (timeout, path))
+
+    if state["error"]:
+        raise state["error"]
+
+
+def blocking_flock(fd, operation):
+    while True:
+        try:
+            fcntl.flock(fd, operation)
+            return
+        except IOError, e:
+            if e.errno != errno.EINTR:
+                raise
@@ -0,0 +1,442 @@
+
+import os
+import time
+import gzip
+import errno
+import shutil
+import logging
+import calendar
+import threading
+
+from containerizer import environ, environment
+from containerizer.docker import docker_client
+from containerizer.state import read_container_state, update_container_state
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_LOG_MAX_FILES = 5
+DEFAULT_LOG_MAX_AGE = 0  # Seconds, never rotated by age
+DEFAULT_LOG_BUDGET = 0  # Bytes, unlimited
+DEFAULT_DOCKER_LOG_MAX_SIZE = "10m"
+
+# The sandbox files each output stream of a container is written to
+LOG_FILES = {1: "docker_stdout", 2: "docker_stderr"}
+
+# Output is written through a buffer this big, and flushed (but never synced)
+# this often in seconds, so chatty tasks cost few writes.
+BUFFER_SIZE = 256 * 1024
+FLUSH_INTERVAL = 1
+
+# How long to wait in seconds for the rest of the output of a container once
+# it's exited
+DRAIN_TIMEOUT = 10
+
+BUDGET_MESSAGE = "docker-containerizer: Output exceeded the log budget of %d bytes, " \
+    "discarding the rest\n"
+
+LOST_MESSAGE = "docker-containerizer: Output was lost, docker rotated its copy before " \
+    "it was written here\n"
+
+# The log drivers docker can cap with `max-size` and read back through the
+# logs API, which capturing the output relies on
+CAPTURE_LOG_DRIVERS = ("json-file", "local")
+
+# Appended to the command of a container whose output can't be captured, so
+# it's written to the sandbox by the container itself
+SANDBOX_REDIRECT = " >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+
+
+def log_settings():
+    """
+    Return a dictionary of how sandbox logs are rotated and capped, set with
+    the `CONTAINERIZER_LOG_*` environment variables.
+    """
+
+    return {
+        "max_size": int(environ().get("CONTAINERIZER_LOG_MAX_SIZE", DEFAULT_LOG_MAX_SIZE)),
+        "max_files": int(environ().get("CONTAINERIZER_LOG_MAX_FILES", DEFAULT_LOG_MAX_FILES)),
+        "max_age": int(environ().get("CONTAINERIZER_LOG_MAX_AGE", DEFAULT_LOG_MAX_AGE)),
+        "compress": environ().get("CONTAINERIZER_LOG_COMPRESS", "false").lower() == "true",
+        "budget": int(environ().get("CONTAINERIZER_LOG_BUDGET", DEFAULT_LOG_BUDGET))
+    }
+
+
+def docker_log_driver():
+    """
+    Return the default log driver of the docker daemon. It's asked for once
+    per process, unless set with `CONTAINERIZER_DOCKER_LOG_DRIVER`.
+    """
+
+    driver = environ().get("CONTAINERIZER_DOCKER_LOG_DRIVER")
+    if driver:
+        return driver
+
+    client = docker_client()
+    with _log_drivers_lock:
+        driver = _log_drivers.get(client.socket_path)
+
+    if driver is None:
+        driver = client.info().get("LoggingDriver") or "json-file"
+        with _log_drivers_lock:
+            _log_drivers[client.socket_path] = driver
+
+    return driver
+
+
+def capture_enabled(extra_args):
+    """
+    Return whether the output of a container launched with the given extra
+    `docker run` arguments can be captured from docker. Containers given a
+    log driver of their own, or launched where the default driver can't be
+    read back, write their output to the sandbox themselves.
+    """
+
+    if any(argument.startswith("--log-driver") for argument in extra_args):
+        return False
+
+    return docker_log_driver() in CAPTURE_LOG_DRIVERS
+
+
+def sandbox_command(executor, extra_args):
+    """
+    Return the command a container runs the executor with, redirecting its
+    output to the sandbox if it won't be captured.
+    """
+
+    if capture_enabled(extra_args):
+        return executor
+
+    return executor + SANDBOX_REDIRECT
+
+
+def docker_log_arguments(extra_args):
+    """
+    Return the `docker run` arguments capping the copy of the output docker
+    keeps itself, if it's captured. It's only read back to fill the sandbox,
+    so there's no need for more than the capture could fall behind by.
+    """
+
+    if not capture_enabled(extra_args):
+        return []
+
+    max_size = environ().get("CONTAINERIZER_DOCKER_LOG_MAX_SIZE", DEFAULT_DOCKER_LOG_MAX_SIZE)
+    if not max_size:
+        return []
+
+    return ["--log-opt", "max-size=%s" % max_size]
+
+
+def normalize_timestamp(timestamp):
+    """
+    Pad the fraction of a docker timestamp, which has trailing zeros
+    trimmed, so timestamps compare in order as strings.
+
+    >>> normalize_timestamp("2015-01-02T03:04:05.12Z")
+    '2015-01-02T03:04:05.120000000Z'
+    >>> normalize_timestamp("2015-01-02T03:04:05Z")
+    '2015-01-02T03:04:05.000000000Z'
+    """
+
+    seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+    return "%s.%sZ" % (seconds, fraction.ljust(9, "0")[:9])
+
+
+def timestamp_seconds(timestamp):
+    """
+    Return the whole unix time of a docker timestamp.
+
+    >>> timestamp_seconds("2015-01-02T03:04:05.120000000Z")
+    1420167845
+    """
+
+    return calendar.timegm(time.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S"))
+
+
+class RotatingLog(object):
+    """
+    A log file in the sandbox, rotated to `<name>.1` (and so on, up to
+    `max_files`) once it grows past `max_size` bytes or gets older than
+    `max_age` seconds. Rotated files can be compressed with gzip.
+    """
+
+    def __init__(self, path, max_size, max_files, max_age=0, compress=False):
+        self.path = path
+        self.max_size = max_size
+        self.max_files = max_files
+        self.max_age = max_age
+        self.compress = compress
+        self.file = None
+        self.size = 0
+        self.opened_at = None
+
+    def open(self):
+        self.file = open(self.path, "ab", BUFFER_SIZE)
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.opened_at = time.time()
+
+    def write(self, data):
+        if self.file is None:
+            self.open()
+
+        if self.size and (
+            (self.max_size and self.size + len(data) > self.max_size) or
+            (self.max_age and time.time() - self.opened_at >= self.max_age)
+        ):
+            self.rotate()
+
+        self.file.write(data)
+        self.size += len(data)
+
+    def rotated_path(self, index):
+        path = "%s.%d" % (self.path, index)
+        if self.compress:
+            path += ".gz"
+        return path
+
+    def rotate(self):
+        self.file.close()
+        self.file = None
+
+        if self.max_files < 1:
+            os.unlink(self.path)
+        else:
+            try:
+                os.unlink(self.rotated_path(self.max_files))
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+            for index in xrange(self.max_files - 1, 0, -1):
+                if os.path.exists(self.rotated_path(index)):
+                    os.rename(self.rotated_path(index), self.rotated_path(index + 1))
+
+            if self.compress:
+                with open(self.path, "rb") as source:
+                    with gzip.open(self.rotated_path(1), "wb", 1) as target:
+                        shutil.copyfileobj(source, target, BUFFER_SIZE)
+                os.unlink(self.path)
+            else:
+                os.rename(self.path, self.rotated_path(1))
+
+        self.open()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LogCapture(threading.Thread):
+    """
+    Follows the output of a container from docker and writes it to the
+    sandbox, in place of the executor redirecting it there itself. How far
+    it got is kept with the state of the container, so a capture started
+    again after a restart carries on where the last one stopped.
+    """
+
+    def __init__(self, container_id, lxc_container_id, directory):
+        super(LogCapture, self).__init__(name="logs-%s" % container_id)
+        self.daemon = True
+        self.container_id = container_id
+        self.lxc_container_id = lxc_container_id
+        self.lock = threading.Lock()
+        self.dirty = False
+
+        # Written to in the environment of whoever asked for the capture
+        self.environ = environ()
+
+        settings = log_settings()
+        self.budget = settings.pop("budget")
+        self.logs = dict(
+            (stream, RotatingLog(os.path.join(directory, name), **settings))
+            for stream, name in LOG_FILES.iteritems()
+        )
+
+        record = read_container_state(container_id) or {}
+        position = record.get("log_position") or {}
+        self.timestamp = position.get("timestamp")
+        self.written = position.get("bytes", 0)
+        self.discarding = position.get("discarding", False)
+
+    def run(self):
+        with environment(self.environ):
+            try:
+                self.capture()
+            except Exception:
+                logger.exception("Failed to capture the output of container %s",
+                                 self.container_id)
+            finally:
+                with self.lock:
+                    self.flush()
+                    for log in self.logs.itervalues():
+                        log.close()
+
+    def capture(self):
+        since = timestamp_seconds(self.timestamp) if self.timestamp else None
+        resuming = self.timestamp is not None
+        for stream, data in docker_client().logs(self.lxc_container_id, since=since):
+            timestamp, _, line = data.partition(" ")
+            timestamp = normalize_timestamp(timestamp)
+
+            # Docker gives the last line written before a restart back again,
+            # unless it's been rotated out of the copy docker keeps
+            if resuming:
+                resuming = False
+                if timestamp > self.timestamp:
+                    self.lost()
+
+            # Docker only goes back to the second, so skip what was already
+            # written before a restart
+            if self.timestamp and timestamp <= self.timestamp:
+                continue
+
+            with self.lock:
+                self.write(stream, line)
+                self.timestamp = timestamp
+                self.dirty = True
+
+    def lost(self):
+        logger.warning("Output of container %s was lost, the capture fell behind the "
+                       "%s cap on docker's copy", self.container_id,
+                       environ().get("CONTAINERIZER_DOCKER_LOG_MAX_SIZE",
+                                     DEFAULT_DOCKER_LOG_MAX_SIZE))
+        with self.lock:
+            if not self.discarding:
+                self.logs[2].write(LOST_MESSAGE)
+                self.dirty = True
+
+    def write(self, stream, data):
+        if stream not in self.logs or self.discarding:
+            return
+
+        if self.budget and self.written + len(data) > self.budget:
+            logger.warning("Container %s exceeded its log budget of %d bytes",
+                           self.container_id, self.budget)
+            self.logs[2].write(BUDGET_MESSAGE % self.budget)
+            self.discarding = True
+            return
+
+        self.logs[stream].write(data)
+        self.written += len(data)
+
+    def flush(self):
+        """
+        Flush the buffered output to the sandbox, and record how far the
+        capture has got. Callers hold the lock.
+        """
+
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        for log in self.logs.itervalues():
+            log.flush()
+
+        # Don't bring back the record of a container that's been destroyed
+        if read_container_state(self.container_id) is not None:
+            update_container_state(self.container_id, log_position={
+                "timestamp": self.timestamp,
+                "bytes": self.written,
+                "discarding": self.discarding
+            })
+
+
+class LogFlusher(threading.Thread):
+    """
+    Flushes the output of every capture in this process every so often, so
+    idle containers don't leave their last lines sitting in a buffer.
+    """
+
+    def __init__(self):
+        super(LogFlusher, self).__init__(name="log-flusher")
+        self.daemon = True
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+
+            with _captures_lock:
+                captures = _captures.values()
+
+            for capture in captures:
+                try:
+                    with environment(capture.environ):
+                        with capture.lock:
+                            capture.flush()
+                except Exception:
+                    logger.exception("Failed to flush the output of container %s",
+                                     capture.container_id)
+
+
+_log_drivers = {}  # Docker socket path to the default log driver
+_log_drivers_lock = threading.Lock()
+
+_captures = {}  # Container ID to LogCapture
+_captures_lock = threading.Lock()
+_flusher = None
+
+
+def capture_logs(container_id, lxc_container_id, directory):
+    """
+    Write the output of a container to its sandbox directory while it runs,
+    unless it's already being written by this process, or the container
+    writes it there itself. Failing to capture it is logged rather than
+    raised.
+    """
+
+    global _flusher
+
+    if not directory:
+        logger.error("No sandbox to write the output of container %s to", container_id)
+        return
+
+    with _captures_lock:
+        capture = _captures.get(container_id)
+        if capture is not None and capture.is_alive():
+            return
+
+        try:
+            info = docker_client().inspect_container(lxc_container_id)
+            driver = ((info.get("HostConfig") or {}).get("LogConfig") or {}).get("Type")
+            if driver and driver not in CAPTURE_LOG_DRIVERS:
+                logger.info("Container %s logs with %s, its output isn't captured",
+                            container_id, driver)
+                return
+
+            capture = LogCapture(container_id, lxc_container_id, directory)
+        except Exception, e:
+            logger.error("Unable to capture the output of container %s: %s", container_id, e)
+            return
+
+        _captures[container_id] = capture
+        capture.start()
+
+        if _flusher is None:
+            _flusher = LogFlusher()
+            _flusher.start()
+
+    logger.info("Capturing the output of container %s", container_id)
+
+
+def finish_logs(container_id, timeout=DRAIN_TIMEOUT):
+    """
+    Wait for the rest of the output of a container that's exited to be
+    written to its sandbox.
+    """
+
+    with _captures_lock:
+        capture = _captures.pop(container_id, None)
+
+    if capture is None:
+        return
+
+    capture.join(timeout)
+    if capture.is_alive():
+        logger.warning("Gave up waiting for the output of container %s", container_id)
+        with capture.lock:
+            capture.flush()
@@ -0,0 +1,93 @@
+
+import os
+import errno
+import logging
+
+from containerizer.cgroups import hierarchy
+
+logger = logging.getLogger(__name__)
+
+PROC_ROOT = "/proc"
+
+# The columns of /proc/net/dev counted, after the interface name, and the
+# `ResourceStatistics` fields they're reported as
+NETWORK_COUNTERS = (
+    (0, "net_rx_bytes"),
+    (1, "net_rx_packets"),
+    (2, "net_rx_errors"),
+    (3, "net_rx_dropped"),
+    (8, "net_tx_bytes"),
+    (9, "net_tx_packets"),
+    (10, "net_tx_errors"),
+    (11, "net_tx_dropped")
+)
+
+
+def container_pid(lxc_container_id):
+    """
+    Return the ID of a process in a linux container, or None if there isn't
+    one.
+    """
+
+    directory = hierarchy().cgroup_directory(lxc_container_id, "cpu")
+    if directory is None:
+        return None
+
+    try:
+        with open(os.path.join(directory, "cgroup.procs"), "r") as f:
+            for line in f:
+                return int(line)
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    return None
+
+
+def network_namespace(pid):
+    return os.readlink(os.path.join(PROC_ROOT, str(pid), "ns", "net"))
+
+
+def parse_network_counters(data):
+    """
+    Total up the counters of every interface in the contents of a
+    /proc/<pid>/net/dev file, leaving out the loopback interface.
+    """
+
+    usage = dict((field, 0) for _, field in NETWORK_COUNTERS)
+
+    for line in data.splitlines()[2:]:  # Skip the headers
+        interface, _, counters = line.partition(":")
+        if interface.strip() == "lo":
+            continue
+
+        counters = counters.split()
+        for column, field in NETWORK_COUNTERS:
+            usage[field] += int(counters[column])
+
+    return usage
+
+
+def network_statistics(lxc_container_id):
+    """
+    Return the network counters of a linux container as a dictionary keyed
+    by `ResourceStatistics` field names. Containers sharing the network of
+    the host (docker's `--net host`) have no counters of their own, so an
+    empty dictionary is returned for them, as it is for stopped containers.
+    """
+
+    try:
+        pid = container_pid(lxc_container_id)
+        if pid is None:
+            return {}
+
+        if network_namespace(pid) == network_namespace("self"):
+            return {}
+
+        with open(os.path.join(PROC_ROOT, str(pid), "net", "dev"), "r") as f:
+            return parse_network_counters(f.read())
+    except (IOError, OSError), e:
+        # The process may have exited since its ID was read
+        if e.errno != errno.ENOENT:
+            logger.error("Failed to read network statistics of %s: %s", lxc_container_id, e)
+        return {}
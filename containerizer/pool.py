@@ -0,0 +1,394 @@
+
+import os
+import json
+import time
+import pipes
+import errno
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from containerizer import environ, environment, state_path
+from containerizer.docker import invoke_docker, docker_client, PIPE, POOL_LABEL, \
+    CONTAINER_LABEL
+from containerizer.reaper import enqueue_removal, wake_reaper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 0
+DEFAULT_POOL_SHAPES = 4
+DEFAULT_POOL_MIN_LAUNCHES = 2
+
+# The file in the sandbox a pooled container reads the environment of its
+# launch from, before starting the executor
+ENVIRONMENT_FILE = ".containerizer_env"
+
+# The name of every pooled container starts with this, until it's claimed
+POOL_NAME_PREFIX = "mesos-pool-"
+
+# Seconds to wait before creating containers of a shape again, after
+# failing to create one
+RETRY_DELAY = 10
+
+
+def pool_directory():
+    return state_path("pool")
+
+
+def claims_directory():
+    return state_path("pool-claims")
+
+
+def placeholder_directory():
+    """
+    The empty directory the sandbox of every pooled container points at
+    until it's claimed.
+    """
+
+    directory = os.path.join(pool_directory(), ".empty")
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    return directory
+
+
+def pooled_command(executor):
+    """
+    Return the command a pooled container runs, which reads the environment
+    of the launch that claimed it before running the executor.
+    """
+
+    return ". /mesos-sandbox/%s\n%s" % (ENVIRONMENT_FILE, executor)
+
+
+def write_environment_file(directory, variables):
+    """
+    Write the (name, value) environment variables of a launch to its
+    sandbox, for a pooled container to read.
+    """
+
+    with open(os.path.join(directory, ENVIRONMENT_FILE), "w") as f:
+        for name, value in variables:
+            f.write("export %s=%s\n" % (name, pipes.quote(value)))
+
+
+def bind_sandbox(pooled, directory):
+    """
+    Point the sandbox of a pooled container at the sandbox of the launch
+    that claimed it. The bind mount follows the link when the container is
+    started, after which the link can go.
+    """
+
+    temp_path = pooled["link"] + ".claim"
+    os.symlink(directory, temp_path)
+    os.rename(temp_path, pooled["link"])
+
+
+def remove_link(pooled):
+    try:
+        os.unlink(pooled["link"])
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def record_claim(docker_id, labels):
+    """
+    Record the mesos (key, value) labels of the launch that claimed a pooled
+    container, before the container is started. Docker can't label a
+    container once it's created, so this is what ties a claimed container
+    to its launch if nothing else about the launch gets recorded.
+    """
+
+    directory = claims_directory()
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".%s." % docker_id)
+    with os.fdopen(fd, "w") as f:
+        json.dump(dict(labels), f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(temp_path, os.path.join(directory, docker_id))
+
+
+def read_claim(docker_id):
+    """
+    Return the mesos labels recorded when a pooled container was claimed,
+    or None if it wasn't.
+    """
+
+    try:
+        with open(os.path.join(claims_directory(), docker_id), "r") as f:
+            return json.load(f)
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    except ValueError:
+        logger.error("Ignoring corrupt claim of pooled container %s", docker_id)
+
+    return None
+
+
+def list_claims():
+    """
+    Return the docker IDs of the pooled containers that have been claimed.
+    """
+
+    try:
+        names = os.listdir(claims_directory())
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+        return []
+
+    return [name for name in names if not name.startswith(".")]
+
+
+def remove_claim(docker_id):
+    try:
+        os.unlink(os.path.join(claims_directory(), docker_id))
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def docker_labels(docker_container):
+    """
+    Return the labels of a container from the docker container list, with
+    the mesos labels recorded when it was claimed from the pool, if it was.
+    """
+
+    labels = dict(docker_container.get("Labels") or {})
+    if POOL_LABEL in labels and CONTAINER_LABEL not in labels:
+        labels.update(read_claim(docker_container["Id"]) or {})
+
+    return labels
+
+
+def discard_pooled(pooled):
+    """
+    Queue a pooled container to be removed by the reaper.
+    """
+
+    remove_link(pooled)
+    remove_claim(pooled["docker_id"])
+    enqueue_removal(pooled["docker_id"])
+    wake_reaper()
+
+
+class PoolShape(object):
+    """
+    The warm containers created for launches of one shape, along with the
+    `docker create` arguments and starting cgroup `limits` they're given.
+    """
+
+    def __init__(self, key, arguments, limits):
+        self.key = key
+        self.arguments = arguments
+        self.limits = limits
+        self.launches = 0
+        self.idle = []
+        self.failed_at = 0
+
+        # Containers are created in the environment of the latest launch
+        self.environ = environ()
+
+
+class ContainerPool(threading.Thread):
+    """
+    Keeps `size` containers created ahead of time for each of the `shapes`
+    most recently launched shapes of container, that have been launched at
+    least `min_launches` times. Claimed containers are replaced in the
+    background, so creating them is kept off the path of a launch.
+    """
+
+    def __init__(self, size, shapes, min_launches):
+        super(ContainerPool, self).__init__(name="container-pool")
+        self.daemon = True
+        self.size = size
+        self.max_shapes = shapes
+        self.min_launches = min_launches
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.shapes = OrderedDict()  # Key to PoolShape, least recently launched first
+
+    def offer(self, key, arguments, limits):
+        """
+        Count a launch of the given shape, making it a candidate for pooling.
+        The least recently launched shape is dropped once there are more
+        than `max_shapes`, and its containers removed.
+        """
+
+        evicted = []
+        with self.lock:
+            shape = self.shapes.pop(key, None)
+            if shape is None:
+                shape = PoolShape(key, arguments, limits)
+            else:
+                shape.arguments, shape.limits, shape.environ = arguments, limits, environ()
+
+            shape.launches += 1
+            self.shapes[key] = shape
+
+            while len(self.shapes) > self.max_shapes:
+                _, stale_shape = self.shapes.popitem(last=False)
+                evicted.extend(stale_shape.idle)
+
+        for pooled in evicted:
+            discard_pooled(pooled)
+
+        self.wakeup.set()
+
+    def claim(self, key):
+        """
+        Take an idle container of the given shape out of the pool, returning
+        a dictionary of its `docker_id`, `name`, sandbox `link` and applied
+        `limits`, or None if there isn't one.
+        """
+
+        with self.lock:
+            shape = self.shapes.get(key)
+            if shape is None or not shape.idle:
+                return None
+            pooled = shape.idle.pop(0)
+
+        self.wakeup.set()
+        return pooled
+
+    def wanting(self):
+        """
+        Return a shape that's short of containers, or None.
+        """
+
+        with self.lock:
+            for shape in reversed(self.shapes.values()):
+                if shape.launches >= self.min_launches and len(shape.idle) < self.size and \
+                        time.time() - shape.failed_at >= RETRY_DELAY:
+                    return shape
+
+        return None
+
+    def create(self, shape):
+        name = POOL_NAME_PREFIX + os.urandom(8).encode("hex")
+        link = os.path.join(pool_directory(), name)
+        os.symlink(placeholder_directory(), link)
+
+        arguments = ["--name", name, "--label", "%s=%s" % (POOL_LABEL, shape.key),
+                     "-v", "%s:/mesos-sandbox" % link]
+        arguments.extend(shape.arguments)
+
+        stdout, _, return_code = invoke_docker("create", arguments, stdout=PIPE)
+        if return_code > 0:
+            os.unlink(link)
+            raise Exception("Failed to create container %s" % name)
+
+        return {"docker_id": stdout.read().strip(), "name": name, "link": link,
+                "limits": dict(shape.limits)}
+
+    def run(self):
+        while True:
+            shape = self.wanting()
+            if shape is None:
+                self.wakeup.wait(RETRY_DELAY)
+                self.wakeup.clear()
+                continue
+
+            try:
+                with environment(shape.environ):
+                    pooled = self.create(shape)
+            except Exception, e:
+                logger.error("Unable to add a container to the pool: %s", e)
+                shape.failed_at = time.time()
+                continue
+
+            with self.lock:
+                if self.shapes.get(shape.key) is shape:
+                    shape.idle.append(pooled)
+                    pooled = None
+
+            # The shape was dropped while the container was being created
+            if pooled is not None:
+                with environment(shape.environ):
+                    discard_pooled(pooled)
+
+
+def remove_stale_containers():
+    """
+    Remove the pooled containers left behind by a previous daemon. Claimed
+    containers keep the pool label, so only those never started and still
+    under their pool name are removed.
+    """
+
+    client = docker_client()
+    containers = client.list_containers(
+        all=True, filters={"label": [POOL_LABEL], "status": ["created"]}
+    )
+    for container in containers:
+        names = [name.lstrip("/") for name in container.get("Names") or []]
+        if names and all(name.startswith(POOL_NAME_PREFIX) for name in names):
+            enqueue_removal(container["Id"])
+
+    if os.path.isdir(pool_directory()):
+        for name in os.listdir(pool_directory()):
+            if not name.startswith("."):
+                os.unlink(os.path.join(pool_directory(), name))
+
+    wake_reaper()
+
+
+_pool = None
+
+
+def start_container_pool():
+    """
+    Keep warm containers for launches in a thread of this process, if
+    `CONTAINERIZER_POOL_SIZE` is set. Only a long lived process can keep
+    them, so the pool is used by the `serve` daemon alone.
+    """
+
+    global _pool
+
+    size = int(environ().get("CONTAINERIZER_POOL_SIZE", DEFAULT_POOL_SIZE))
+    if _pool is not None or size < 1:
+        return
+
+    try:
+        remove_stale_containers()
+    except Exception, e:
+        logger.error("Failed to remove stale pooled containers: %s", e)
+
+    _pool = ContainerPool(
+        size,
+        int(environ().get("CONTAINERIZER_POOL_SHAPES", DEFAULT_POOL_SHAPES)),
+        int(environ().get("CONTAINERIZER_POOL_MIN_LAUNCHES", DEFAULT_POOL_MIN_LAUNCHES))
+    )
+    _pool.start()
+
+    logger.info("Keeping %d warm containers for each of up to %d shapes",
+                size, _pool.max_shapes)
+
+
+def pool_enabled():
+    return _pool is not None
+
+
+def offer_pool_shape(key, arguments, limits):
+    if _pool is not None:
+        _pool.offer(key, arguments, limits)
+
+
+def claim_pooled_container(key):
+    if _pool is None:
+        return None
+    return _pool.claim(key)
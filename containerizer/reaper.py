@@ -0,0 +1,245 @@
+
+import os
+import sys
+import json
+import time
+import errno
+import logging
+import tempfile
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+from containerizer import environ, environment, state_path
+from containerizer.docker import docker_client, DockerAPIError
+from containerizer.locks import FileLock, LockTimeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REAPER_WORKERS = 2
+DEFAULT_REAPER_ATTEMPTS = 5
+
+# Seconds to wait before retrying a failed removal, doubled for each attempt
+RETRY_DELAY = 1
+
+
+def queue_directory():
+    return state_path("reap")
+
+
+def queue_path(container):
+    return os.path.join(queue_directory(), container)
+
+
+def make_queue_directory():
+    directory = queue_directory()
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def write_entry(container, entry):
+    make_queue_directory()
+
+    fd, temp_path = tempfile.mkstemp(dir=queue_directory(), prefix=".%s." % container)
+    with os.fdopen(fd, "w") as f:
+        json.dump(entry, f)
+
+    os.rename(temp_path, queue_path(container))
+
+
+def remove_entry(container):
+    try:
+        os.unlink(queue_path(container))
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def read_queue():
+    """
+    Return a dictionary of container to queue entry, a dictionary of the
+    number of `attempts` made to remove it and the time it can next be tried
+    (`not_before`).
+    """
+
+    try:
+        names = os.listdir(queue_directory())
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+
+    entries = {}
+    for name in names:
+        if name.startswith("."):
+            continue  # The lock, or an in progress write
+        try:
+            with open(queue_path(name), "r") as f:
+                entries[name] = json.load(f)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            entries[name] = {"attempts": 0, "not_before": 0}
+
+    return entries
+
+
+def enqueue_removal(container):
+    """
+    Queue a stopped container to have its filesystem removed by the reaper.
+    The queue is kept on disk, so removals survive a restart.
+    """
+
+    logger.info("Queueing removal of container %s", container)
+    write_entry(container, {"attempts": 0, "not_before": 0})
+
+
+def remove_container(container):
+    """
+    Remove a container, returning whether it's gone.
+    """
+
+    try:
+        docker_client().remove_container(container)
+    except DockerAPIError, e:
+        if e.status == 404:
+            return True
+        logger.error("Failed to remove container %s: %s", container, e)
+        return False
+    except Exception:
+        logger.exception("Failed to remove container %s", container)
+        return False
+
+    logger.info("Removed container %s", container)
+    return True
+
+
+def drain_queue(workers, max_attempts):
+    """
+    Remove every queued container, at most `workers` at a time, retrying
+    failed removals with an exponential backoff. Containers that still can't
+    be removed after `max_attempts` are dropped from the queue.
+    """
+
+    pool = ThreadPool(workers)
+    try:
+        while True:
+            entries = read_queue()
+            if not entries:
+                return
+
+            now = time.time()
+            due = [name for name, entry in entries.iteritems()
+                   if entry.get("not_before", 0) <= now]
+
+            if not due:
+                time.sleep(min(entry["not_before"] for entry in entries.values()) - now)
+                continue
+
+            for name, removed in zip(due, pool.map(remove_container, due)):
+                entry = entries[name]
+                entry["attempts"] = entry.get("attempts", 0) + 1
+
+                if removed:
+                    remove_entry(name)
+                elif entry["attempts"] >= max_attempts:
+                    logger.error("Giving up removing container %s after %d attempts",
+                                 name, entry["attempts"])
+                    remove_entry(name)
+                else:
+                    entry["not_before"] = time.time() + RETRY_DELAY * 2 ** (entry["attempts"] - 1)
+                    write_entry(name, entry)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def reap_containers():
+    """
+    Drain the removal queue, unless another reaper is already draining it.
+    """
+
+    workers = int(environ().get("CONTAINERIZER_REAPER_WORKERS", DEFAULT_REAPER_WORKERS))
+    max_attempts = int(environ().get("CONTAINERIZER_REAPER_ATTEMPTS", DEFAULT_REAPER_ATTEMPTS))
+
+    make_queue_directory()
+
+    while True:
+        try:
+            with FileLock(queue_path(".lock"), timeout=0):
+                drain_queue(workers, max_attempts)
+        except LockTimeout:
+            logger.info("Another reaper is draining the queue")
+            return
+
+        # Something may have been queued by a reaper that gave up on the lock
+        # while this one held it
+        if not read_queue():
+            return
+
+
+class BackgroundReaper(threading.Thread):
+    """
+    Drains the removal queue in a long lived process whenever it's woken.
+    """
+
+    def __init__(self):
+        super(BackgroundReaper, self).__init__(name="reaper")
+        self.daemon = True
+        self.wakeup = threading.Event()
+        self.environ = environ()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        with environment(self.environ):
+            while True:
+                try:
+                    reap_containers()
+                except Exception:
+                    logger.exception("Failed to drain the removal queue")
+
+                self.wakeup.wait()
+                self.wakeup.clear()
+
+
+_background_reaper = None
+
+
+def start_background_reaper():
+    """
+    Reap containers in a thread of this process, rather than starting a
+    `reap` process each time a container is destroyed.
+    """
+
+    global _background_reaper
+    if _background_reaper is None:
+        _background_reaper = BackgroundReaper()
+        _background_reaper.start()
+
+
+def wake_reaper():
+    """
+    Make sure the removal queue is being drained, without waiting for it.
+    """
+
+    if _background_reaper is not None:
+        _background_reaper.wake()
+        return
+
+    # The reaper outlives this process, so it mustn't hold on to the streams
+    # mesos is reading from
+    make_queue_directory()
+    with open(os.devnull, "r+") as devnull:
+        with open(state_path("reap", ".log"), "a") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "containerizer.__main__", "reap"],
+                stdin=devnull, stdout=devnull, stderr=log,
+                env=dict(environ()), close_fds=True, preexec_fn=os.setsid
+            )
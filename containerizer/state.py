@@ -0,0 +1,116 @@
+
+import os
+import json
+import errno
+import logging
+import tempfile
+
+from containerizer import state_path
+from containerizer.locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def record_directory():
+    return state_path("containers")
+
+
+def record_path(container_id):
+    return os.path.join(record_directory(), container_id)
+
+
+def read_container_state(container_id):
+    """
+    Return the record of a container the containerizer launched, a dictionary
+    that may contain the `docker_id`, `cgroups` (subsystem to cgroup
+    directory), `image`, `image_digest`, `resources`, applied cgroup `limits`,
+    sandbox `directory` and `launched_at` time of the container, along with
+    whatever's recorded while it runs. Returns None if there's no record of
+    it.
+    """
+
+    try:
+        with open(record_path(container_id), "r") as f:
+            return json.load(f)
+    except IOError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    except ValueError:
+        logger.error("Ignoring corrupt state for container %s", container_id)
+
+    return None
+
+
+def write_container_state(container_id, record):
+    """
+    Replace the record of a container. Records are written atomically, so
+    readers never need to hold the container lock.
+    """
+
+    directory = record_directory()
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    record = dict(record, container_id=container_id)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".%s." % container_id)
+    with os.fdopen(fd, "w") as f:
+        json.dump(record, f)
+
+    os.rename(temp_path, record_path(container_id))
+
+
+def update_container_state(container_id, **fields):
+    """
+    Merge the given fields into the record of a container, creating it if
+    there isn't one. Returns the new record. Records can be updated by more
+    than the holder of the container lock, such as when memory events are
+    recorded, so updates are serialized by a lock of their own.
+    """
+
+    with FileLock(os.path.join(record_directory(), ".lock")):
+        record = read_container_state(container_id) or {}
+        record.update(fields)
+        write_container_state(container_id, record)
+
+    return record
+
+
+def remove_container_state(container_id):
+    """
+    Drop the record of a container, if there is one.
+    """
+
+    try:
+        os.unlink(record_path(container_id))
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def list_container_states():
+    """
+    Return a dictionary of container ID to record, for every container the
+    containerizer has a record of.
+    """
+
+    try:
+        names = os.listdir(record_directory())
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+
+    records = {}
+    for container_id in names:
+        if container_id.startswith("."):
+            continue  # In progress write
+        record = read_container_state(container_id)
+        if record is not None:
+            records[container_id] = record
+
+    return records
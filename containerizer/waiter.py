@@ -0,0 +1,179 @@
+
+import time
+import logging
+import threading
+
+from containerizer.docker import docker_client, DockerAPIError
+
+logger = logging.getLogger(__name__)
+
+# How long to back off before re-subscribing to a failed event stream
+RECONNECT_DELAY = 1
+
+# How long to wait for the event stream subscription before giving up
+SUBSCRIBE_TIMEOUT = 30
+
+# How often a waiting container is inspected, in case an event was missed
+RECHECK_INTERVAL = 300
+
+
+class ContainerExit(object):
+    """
+    The pending exit of a container, shared by everything waiting on it.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.status = None
+        self.oom_killed = False
+        self.error = None
+
+    def resolve(self, status, oom_killed=False, error=None):
+        self.status = status
+        self.oom_killed = oom_killed
+        self.error = error
+        self.event.set()
+
+
+class ContainerWaiter(object):
+    """
+    Waits for containers to exit using a single subscription to the docker
+    event stream, rather than a blocked `docker wait` per container. When a
+    `die` event arrives for a container being waited on, it is inspected once
+    to find its exit code and whether the OOM killer got to it. A container
+    that's been removed has stopped, with the exit code of its `die` event
+    if one was seen, or an unknown (None) status if not.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or docker_client()
+        self.lock = threading.Lock()
+        self.pending = {}  # Container name to ContainerExit
+        self.names = {}  # Full docker ID to container name
+        self.exit_codes = {}  # Container name to the exit code of its die event
+        self.thread = None
+        self.subscribed = threading.Event()
+
+    def wait(self, container):
+        """
+        Block until the given container exits, and return its `ContainerExit`.
+        Raises an exception if the container can't be inspected.
+        """
+
+        with self.lock:
+            pending = self.pending.get(container)
+            if pending is None:
+                pending = self.pending[container] = ContainerExit()
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.watch)
+                self.thread.daemon = True
+                self.thread.start()
+
+        # Only look at the container once subscribed, so its exit can't be
+        # missed between the two.
+        if not self.subscribed.wait(SUBSCRIBE_TIMEOUT):
+            self.resolve(container, None, error="Unable to subscribe to docker events")
+        else:
+            self.check(container)
+
+        # Waiting with a timeout keeps the thread responsive to signals, and
+        # covers a container dying before its docker ID was known.
+        while not pending.event.wait(RECHECK_INTERVAL):
+            self.check(container)
+
+        if pending.error:
+            raise Exception(pending.error)
+
+        return pending
+
+    def check(self, container):
+        """
+        Inspect a container being waited on, and resolve it if it has stopped.
+        """
+
+        try:
+            info = self.client.inspect_container(container)
+        except DockerAPIError, e:
+            if e.status == 404:
+                with self.lock:
+                    status = self.exit_codes.get(container)
+                logger.info("Container %s no longer exists", container)
+                self.resolve(container, status)
+            else:
+                self.resolve(container, None, error="Failed to inspect container: %s" % e)
+            return
+
+        with self.lock:
+            self.names[info["Id"]] = container
+
+        state = info.get("State", {})
+        if not state.get("Running"):
+            self.resolve(container, int(state.get("ExitCode", 0)),
+                         bool(state.get("OOMKilled")))
+
+    def resolve(self, container, status, oom_killed=False, error=None):
+        with self.lock:
+            pending = self.pending.pop(container, None)
+            self.exit_codes.pop(container, None)
+            for docker_id, name in self.names.items():
+                if name == container:
+                    del self.names[docker_id]
+
+        if pending is not None:
+            logger.info("Container %s exited with status %r", container, status)
+            pending.resolve(status, oom_killed, error)
+
+    def watch(self):
+        """
+        Follow the docker event stream forever, re-subscribing if it fails.
+        """
+
+        while True:
+            try:
+                events = self.client.events(filters={
+                    "type": ["container"],
+                    "event": ["die"]
+                })
+
+                self.subscribed.set()
+
+                with self.lock:
+                    missed = self.pending.keys()
+                for container in missed:
+                    self.check(container)
+
+                for event in events:
+                    # Newer versions of docker include the container name
+                    attributes = event.get("Actor", {}).get("Attributes", {})
+                    with self.lock:
+                        container = self.names.get(event.get("id"))
+                        if container is None and attributes.get("name") in self.pending:
+                            container = attributes["name"]
+                        if container is not None and "exitCode" in attributes:
+                            self.exit_codes[container] = int(attributes["exitCode"])
+                    if container is not None:
+                        self.check(container)
+            except Exception:
+                logger.exception("Docker event stream failed, re-subscribing")
+
+            self.subscribed.clear()
+
+            time.sleep(RECONNECT_DELAY)
+
+
+_waiter = None
+_waiter_lock = threading.Lock()
+
+
+def container_waiter():
+    """
+    Return the shared `ContainerWaiter` for this process.
+    """
+
+    global _waiter
+    with _waiter_lock:
+        if _waiter is None:
+            _waiter = ContainerWaiter()
+
+    return _waiter
@@ -1,23 +1,64 @@
-from StringIO import StringIO
 from unittest import TestCase
+from mock import patch, call
 
-from containerizer.commands.containers import parse_docker_ps
+from containerizer.commands.containers import parse_container_list, list_mesos_containers
 
 
 class RunningContainersTestCase(TestCase):
 
     def test_running_containers(self):
 
-        docker_ps = StringIO()
-        docker_ps.write(
-            "CONTAINER ID    IMAGE    COMMAND    CREATED    STATUS    PORTS    NAMES\n"  # Header record
-            "XXXXXXXXXXXX    XXXXX    XXXXXXX    XXXXXXX    XXXXXX             foobar\n"
-            "YYYYYYYYYYYY    YYYYY    YYYYYYY    YYYYYYY    YYYYYY             bazwin\n"
-        )
+        docker_containers = [
+            {"Id": "XXXXXXXXXXXX", "Names": ["/foobar"]},
+            {"Id": "YYYYYYYYYYYY", "Names": ["/bazwin"]}
+        ]
 
-        docker_ps.seek(0)  # Seek the StringIO back to the beginning
-        running_containers = parse_docker_ps(docker_ps)
+        running_containers = parse_container_list(docker_containers)
 
         self.assertEqual(len(running_containers.containers), 2)
         self.assertEqual(running_containers.containers[0].value, "foobar")
         self.assertEqual(running_containers.containers[1].value, "bazwin")
+
+    def test_labelled_containers(self):
+
+        docker_containers = [
+            {"Id": "XXXXXXXXXXXX", "Names": ["/foobar"],
+             "Labels": {"mesos.container_id": "container-foo"}}
+        ]
+
+        running_containers = parse_container_list(docker_containers)
+
+        self.assertEqual(running_containers.containers[0].value, "container-foo")
+
+    @patch("containerizer.commands.containers.list_claims", return_value=["bbbb", "cccc"])
+    @patch("containerizer.commands.containers.list_container_states")
+    @patch("containerizer.commands.containers.docker_client")
+    def test_list_mesos_containers(self, docker_client, list_container_states, _):
+
+        client = docker_client.return_value
+        client.list_containers.side_effect = [
+            [{"Id": "aaaa", "Labels": {"mesos.container_id": "container-foo"}}],
+            [{"Id": "bbbb", "Names": ["/container-bar"]},
+             {"Id": "cccc", "Names": ["/container-pooled"]}]
+        ]
+        list_container_states.return_value = {
+            "container-foo": {"docker_id": "aaaa"},
+            "container-bar": {"docker_id": "bbbb"}
+        }
+
+        self.assertEqual([c["Id"] for c in list_mesos_containers()], ["aaaa", "bbbb", "cccc"])
+        self.assertEqual(client.list_containers.call_args_list, [
+            call(filters={"label": ["mesos.container_id"]}),
+            call(filters={"id": ["bbbb", "cccc"]})
+        ])
+
+    @patch("containerizer.commands.containers.list_claims", return_value=[])
+    @patch("containerizer.commands.containers.list_container_states", return_value={})
+    @patch("containerizer.commands.containers.docker_client")
+    def test_list_mesos_containers_single_call(self, docker_client, _, __):
+
+        client = docker_client.return_value
+        client.list_containers.return_value = []
+
+        self.assertEqual(list_mesos_containers(), [])
+        self.assertEqual(client.list_containers.call_count, 1)
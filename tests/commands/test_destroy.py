@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+
+from containerizer.commands.destroy import destroy_container
+from containerizer.docker import DockerAPIError
+from containerizer.ids import cache_container_id, cached_container_id
+from containerizer.proto import ContainerID
+from containerizer.reaper import read_queue
+
+
+@patch("containerizer.commands.destroy.docker_client")
+class DestroyContainerTestCase(TestCase):
+
+    def setUp(self):
+        self.state_directory = tempfile.mkdtemp()
+        self.patcher = patch.dict("os.environ", {
+            "CONTAINERIZER_STATE_DIR": self.state_directory,
+            "CONTAINERIZER_STOP_TIMEOUT": "3"
+        })
+        self.patcher.start()
+
+        self.container_id = ContainerID()
+        self.container_id.value = "container-foo"
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.state_directory)
+
+    def test_stop_and_queue_removal(self, docker_client):
+        cache_container_id("container-foo", "aaaa")
+
+        self.assertTrue(destroy_container(self.container_id))
+
+        client = docker_client.return_value
+        client.stop_container.assert_called_once_with("container-foo", timeout=3)
+        self.assertFalse(client.remove_container.called)
+
+        self.assertEqual(read_queue().keys(), ["aaaa"])
+        self.assertIsNone(cached_container_id("container-foo"))
+
+    def test_stop_failure(self, docker_client):
+        docker_client.return_value.stop_container.side_effect = DockerAPIError(500, "oops")
+
+        self.assertFalse(destroy_container(self.container_id))
+        self.assertEqual(read_queue(), {})
@@ -0,0 +1,109 @@
+import os
+import mock
+from unittest import TestCase
+
+from containerizer.cgroups import close_handles
+from containerizer.commands.exporter import MetricsCache, container_labels, render_metrics
+from tests.fakes import FixtureTestCase, write_files
+
+
+class ContainerLabelsTestCase(TestCase):
+
+    def test_docker_labels(self):
+        client = mock.Mock()
+        with mock.patch("containerizer.commands.exporter.docker_client", return_value=client):
+            labels = container_labels({
+                "Id": "aaaa",
+                "Names": ["/mesos-1"],
+                "Labels": {"mesos.framework_id": "fw", "mesos.executor_id": "ex"}
+            })
+
+        self.assertEqual(labels, {
+            "container_id": "mesos-1", "framework_id": "fw", "executor_id": "ex"
+        })
+        self.assertFalse(client.inspect_container.called)
+
+    def test_environment_fallback(self):
+        client = mock.Mock()
+        client.inspect_container.return_value = {"Config": {"Env": [
+            "MESOS_FRAMEWORK_ID=fw", "MESOS_EXECUTOR_ID=ex=1", "PATH=/bin"
+        ]}}
+        with mock.patch("containerizer.commands.exporter.docker_client", return_value=client):
+            labels = container_labels({"Id": "aaaa", "Names": ["/mesos-1"]})
+
+        self.assertEqual(labels["framework_id"], "fw")
+        self.assertEqual(labels["executor_id"], "ex=1")
+        client.inspect_container.assert_called_once_with("aaaa")
+
+
+class RenderMetricsTestCase(TestCase):
+
+    def test_render(self):
+        text = render_metrics([
+            ({"container_id": "a\"b", "framework_id": "", "executor_id": ""},
+             {"mem_rss_bytes": 4096, "cpus_nr_throttled": 2})
+        ])
+
+        self.assertIn("containerizer_containers 1\n", text)
+        self.assertIn("# TYPE containerizer_memory_usage_bytes gauge\n", text)
+        self.assertIn("# TYPE containerizer_cpu_throttled_periods_total counter\n", text)
+        self.assertIn(
+            'containerizer_memory_usage_bytes{container_id="a\\"b",'
+            'executor_id="",framework_id=""} 4096.0\n', text
+        )
+        self.assertNotIn("containerizer_memory_limit_bytes", text)
+
+
+@mock.patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "2"})
+class MetricsCacheTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(MetricsCacheTestCase, self).setUp()
+        self.root = os.path.join(self.directory, "cgroup")
+        self.start_patchers(mock.patch("containerizer.cgroups.CGROUP_ROOT", self.root))
+
+        write_files(os.path.join(self.root, "docker", "aaaa"), {
+            "cpu.stat": "user_usec 5000000\nsystem_usec 2500000\n"
+                        "nr_periods 10\nnr_throttled 2\nthrottled_usec 3000000\n",
+            "memory.current": "4096\n",
+            "io.stat": "8:0 rbytes=1024 wbytes=2048 rios=1 wios=2\n",
+            "memory.events": "low 0\nhigh 3\nmax 1\noom 1\noom_kill 1\n",
+            "memory.pressure": "some avg10=2.50 avg60=0.00 avg300=0.00 total=10\n"
+                               "full avg10=1.25 avg60=0.00 avg300=0.00 total=5\n"
+        })
+
+        self.client = mock.Mock()
+        self.client.list_containers.return_value = [{
+            "Id": "aaaa",
+            "Names": ["/mesos-1"],
+            "Labels": {"mesos.framework_id": "fw", "mesos.executor_id": "ex"}
+        }]
+        self.start_patchers(mock.patch("containerizer.commands.exporter.docker_client",
+                                       return_value=self.client))
+
+    def tearDown(self):
+        close_handles()
+
+    def test_sample(self):
+        text = MetricsCache(15).get()
+        labels = '{container_id="mesos-1",executor_id="ex",framework_id="fw"}'
+
+        self.assertIn("containerizer_memory_usage_bytes%s 4096.0\n" % labels, text)
+        self.assertIn("containerizer_memory_oom_kills_total%s 1.0\n" % labels, text)
+        self.assertIn("containerizer_memory_high_events_total%s 3.0\n" % labels, text)
+        self.assertIn("containerizer_memory_pressure_full_avg10%s 1.25\n" % labels, text)
+        self.assertIn("containerizer_cpu_throttled_periods_total%s 2.0\n" % labels, text)
+        self.assertIn("containerizer_disk_read_bytes_total%s 1024.0\n" % labels, text)
+
+    def test_cached_within_interval(self):
+        cache = MetricsCache(15)
+        first = cache.get()
+
+        write_files(os.path.join(self.root, "docker", "aaaa"), {"memory.current": "8192\n"})
+
+        self.assertEqual(cache.get(), first)
+        self.assertEqual(self.client.list_containers.call_count, 1)
+
+        cache.sampled_at -= 15
+        self.assertIn("8192.0", cache.get())
+        self.assertEqual(self.client.list_containers.call_count, 2)
@@ -1,16 +1,26 @@
+import os
+import time
+import shutil
+import tempfile
+from collections import OrderedDict
 from unittest import TestCase
 from mock import patch
 
-from containerizer.commands.launch import build_docker_args
+from containerizer.commands import launch as launch_command
+from containerizer.commands.launch import build_docker_args, mesos_labels
+from containerizer.commands.recover import reconcile_containers
+from containerizer.pool import read_claim
 from containerizer.proto import Launch
+from containerizer.state import list_container_states
 
 
 @patch.dict("os.environ", {
     "MESOS_LIBEXEC_DIRECTORY": "/bin",
-    "MESOS_DEFAULT_CONTAINER_IMAGE": "default/container"
+    "MESOS_DEFAULT_CONTAINER_IMAGE": "default/container",
+    "CONTAINERIZER_DOCKER_LOG_DRIVER": "json-file"
 })
 @patch("containerizer.commands.launch.fetch_uris", return_value=0)
-@patch("containerizer.commands.launch.invoke_docker", return_value=(None, None, 0))
+@patch("containerizer.commands.launch.ensure_image")
 class LaunchContainerTestCase(TestCase):
 
     def test_launch_container_task_info_default(self, _, __):
@@ -23,14 +33,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "default/container",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
         ])
 
     def test_launch_container_task_info_resources(self, _, __):
@@ -65,19 +77,20 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
             "-c", "1024",
             "-m", "1024m",
-            "-p", ":4400",
-            "-p", ":4401",
             "-p", ":2234",
+            "-p", ":4400-4401",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "default/container",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
         ])
 
     def test_launch_container_task_info_container_info(self, _, __):
@@ -94,14 +107,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "bridge",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "custom/image",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
         ])
 
     def test_launch_container_task_info_container_info_bad_ports(self, _, __):
@@ -123,14 +138,16 @@ class LaunchContainerTestCase(TestCase):
             self.assertEqual(build_docker_args(launch), [
                 "-d",
                 "--name", "container-foo-bar",
+                "--label", "mesos.container_id=container-foo-bar",
                 "--net", "bridge",
                 "-u", "test",
+                "--log-opt", "max-size=10m",
                 "-e", "MESOS_DIRECTORY=/mesos-sandbox",
                 "-v", "/tmp:/mesos-sandbox",
                 "-w", "/mesos-sandbox",
                 "custom/image",
                 "sh", "-c",
-                "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+                "/bin/mesos-executor"
             ])
 
     def test_launch_container_task_info_container_info_port_map(self, _, __):
@@ -164,10 +181,11 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "bridge",
             "-u", "test",
-            "-p", ":1234",
-            "-p", ":1235",
+            "-p", ":1234-1235",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
@@ -175,9 +193,40 @@ class LaunchContainerTestCase(TestCase):
             "-p", "1235:9002/udp",
             "custom/image",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
         ])
 
+    def test_launch_container_port_ranges(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        port_resource = launch.task_info.resources.add()
+        port_resource.name = "ports"
+        port_resource.type = 1
+
+        for begin, end in ((35000, 40999), (31000, 34999), (80, 80)):
+            port = port_resource.ranges.range.add()
+            port.begin = begin
+            port.end = end
+
+        launch.task_info.container.type = 1  # DOCKER
+        launch.task_info.container.docker.image = "custom/image"
+        launch.task_info.container.docker.network = 2
+
+        port = launch.task_info.container.docker.port_mappings.add()
+        port.host_port = 36000
+        port.container_port = 8080
+
+        arguments = build_docker_args(launch)
+        self.assertEqual([arguments[i + 1] for i, arg in enumerate(arguments) if arg == "-p"],
+                         [":80", ":31000-40999", "36000:8080"])
+
+        port.host_port = 81
+        with self.assertRaises(Exception):
+            build_docker_args(launch)
+
     def test_launch_container_task_info_command_container_info(self, _, __):
 
         launch = Launch()
@@ -190,14 +239,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "custom/image",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
         ])
 
     def test_launch_container_executor_info(self, _, __):
@@ -213,14 +264,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "default/container",
             "sh", "-c",
-            "bin/foo-bar >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "bin/foo-bar"
         ])
 
     def test_launch_container_executor_info_no_shell(self, _, __):
@@ -238,14 +291,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "default/container",
             "sh", "-c",
-            "bin/foo-bar baz >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "bin/foo-bar baz"
         ])
 
     def test_launch_container_executor_info_task_info_container_info(self, _, __):
@@ -264,14 +319,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "bridge",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "custom/image",
             "sh", "-c",
-            "bin/foo-bar >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "bin/foo-bar"
         ])
 
     def test_launch_container_executor_info_task_info_container_info_overlap(self, _, __):
@@ -293,14 +350,16 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "custom/executor",
             "sh", "-c",
-            "bin/foo-bar >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "bin/foo-bar"
         ])
 
     def test_launch_container_task_info_docker_registry(self, _, __):
@@ -316,12 +375,362 @@ class LaunchContainerTestCase(TestCase):
         self.assertEqual(build_docker_args(launch), [
             "-d",
             "--name", "container-foo-bar",
+            "--label", "mesos.container_id=container-foo-bar",
             "--net", "host",
             "-u", "test",
+            "--log-opt", "max-size=10m",
             "-e", "MESOS_DIRECTORY=/mesos-sandbox",
             "-v", "/tmp:/mesos-sandbox",
             "-w", "/mesos-sandbox",
             "my-registry.net/custom/image",
             "sh", "-c",
-            "/bin/mesos-executor >> /mesos-sandbox/docker_stdout 2>> /mesos-sandbox/docker_stderr"
+            "/bin/mesos-executor"
+        ])
+
+    def test_launch_container_journald(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        with patch.dict("os.environ", {"CONTAINERIZER_DOCKER_LOG_DRIVER": "journald"}):
+            arguments = build_docker_args(launch)
+
+        self.assertNotIn("--log-opt", arguments)
+        self.assertEqual(arguments[-1], "/bin/mesos-executor >> /mesos-sandbox/docker_stdout "
+                                        "2>> /mesos-sandbox/docker_stderr")
+
+    def test_record_launch_failure(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        with patch("containerizer.commands.launch.image_digest", return_value=None), \
+                patch("containerizer.commands.launch.update_container_state",
+                      side_effect=IOError("No space left on device")) as update:
+            launch_command.record_launch(launch, "a" * 64)
+
+        self.assertTrue(update.called)
+
+    def test_launch_container_cpu_quota(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        cpu_resource = launch.task_info.resources.add()
+        cpu_resource.name = "cpus"
+        cpu_resource.type = 0
+        cpu_resource.scalar.value = 0.5
+
+        with patch.dict("os.environ", {"CONTAINERIZER_CPU_LIMIT": "quota",
+                                       "CONTAINERIZER_CPU_PERIOD": "50000"}):
+            arguments = build_docker_args(launch)
+
+        self.assertEqual(arguments[7:13], [
+            "-c", "512",
+            "--cpu-period", "50000",
+            "--cpu-quota", "25000"
+        ])
+
+    def test_launch_container_cpuset(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        cpu_resource = launch.task_info.resources.add()
+        cpu_resource.name = "cpus"
+        cpu_resource.type = 0
+        cpu_resource.scalar.value = 2
+
+        cpuset = {"cpus": [4, 5], "mems": [1], "exclusive": True}
+        with patch("containerizer.commands.launch.allocate_cpuset", return_value=cpuset) as allocate:
+            arguments = build_docker_args(launch)
+
+        allocate.assert_called_once_with("container-foo-bar", 2.0)
+        self.assertEqual(arguments[7:13], [
+            "-c", "2048",
+            "--cpuset-cpus", "4-5",
+            "--cpuset-mems", "1"
+        ])
+
+    def test_launch_container_labels(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+
+        with patch.dict("os.environ", {"MESOS_FRAMEWORK_ID": "framework-1",
+                                       "MESOS_EXECUTOR_ID": "executor-1"}):
+            self.assertEqual(mesos_labels(launch), [
+                ("mesos.container_id", "container-foo-bar"),
+                ("mesos.framework_id", "framework-1"),
+                ("mesos.executor_id", "executor-1")
+            ])
+
+            launch.executor_info.executor_id.value = "executor-2"
+            launch.executor_info.framework_id.value = "framework-2"
+
+            self.assertEqual(mesos_labels(launch), [
+                ("mesos.container_id", "container-foo-bar"),
+                ("mesos.framework_id", "framework-2"),
+                ("mesos.executor_id", "executor-2")
+            ])
+
+
+    def test_launch_container_volumes(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+
+        launch.task_info.container.type = 1  # DOCKER
+        launch.task_info.container.docker.image = "custom/image"
+
+        volume = launch.task_info.container.volumes.add()
+        volume.container_path = "/data"
+        volume.host_path = "/srv/data"
+        volume.mode = 2  # RO
+
+        volume = launch.task_info.container.volumes.add()
+        volume.container_path = "/scratch"
+        volume.mode = 1  # RW
+
+        with self.assertRaises(Exception):
+            build_docker_args(launch)
+
+        launch.task_info.container.volumes[1].host_path = "/srv/scratch"
+
+        self.assertEqual(build_docker_args(launch)[-10:], [
+            "-w", "/mesos-sandbox",
+            "-v", "/srv/data:/data:ro",
+            "-v", "/srv/scratch:/scratch:rw",
+            "custom/image",
+            "sh", "-c",
+            "/bin/mesos-executor"
         ])
+
+    def test_launch_template_reused(self, _, __):
+
+        def make_launch(name, host_port):
+            launch = Launch()
+            launch.container_id.value = name
+            launch.directory = "/tmp/%s" % name
+
+            port_resource = launch.task_info.resources.add()
+            port_resource.name = "ports"
+            port_resource.type = 1
+            port = port_resource.ranges.range.add()
+            port.begin = port.end = host_port
+
+            launch.task_info.container.type = 1  # DOCKER
+            launch.task_info.container.docker.image = "custom/image"
+            launch.task_info.container.docker.network = 2
+            port = launch.task_info.container.docker.port_mappings.add()
+            port.host_port = host_port
+            port.container_port = 9001
+            return launch
+
+        compile_template = launch_command.compile_launch_template
+        with patch("containerizer.commands.launch._templates", OrderedDict()), \
+                patch("containerizer.commands.launch.compile_launch_template",
+                      side_effect=compile_template) as compiled:
+            first = build_docker_args(make_launch("container-a", 1234))
+            second = build_docker_args(make_launch("container-b", 1235))
+
+            self.assertEqual(compiled.call_count, 1)
+            self.assertIn("1234:9001", first)
+            self.assertIn("1235:9001", second)
+            self.assertIn("/tmp/container-b:/mesos-sandbox", second)
+
+            launch = make_launch("container-c", 1236)
+            launch.task_info.container.docker.image = "other/image"
+            self.assertIn("other/image", build_docker_args(launch))
+            self.assertEqual(compiled.call_count, 2)
+
+    def test_pool_arguments(self, _, __):
+
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+        launch.user = "test"
+
+        mem_resource = launch.task_info.resources.add()
+        mem_resource.name = "mem"
+        mem_resource.type = 0
+        mem_resource.scalar.value = 512
+
+        with patch.dict("os.environ", {"MESOS_SLAVE_ID": "slave-1"}):
+            arguments, limits = launch_command.pool_arguments(launch)
+
+        self.assertEqual(arguments, [
+            "--net", "host",
+            "-u", "test",
+            "-m", "512m",
+            "--log-opt", "max-size=10m",
+            "-e", "MESOS_DIRECTORY=/mesos-sandbox",
+            "-w", "/mesos-sandbox",
+            "default/container",
+            "sh", "-c",
+            ". /mesos-sandbox/.containerizer_env\n/bin/mesos-executor"
+        ])
+        self.assertEqual(limits, {"memory_limit": 512 * 1024 * 1024})
+
+        launch.task_info.container.type = 1  # DOCKER
+        launch.task_info.container.docker.image = "custom/image"
+        launch.task_info.container.docker.network = 2
+        port = launch.task_info.container.docker.port_mappings.add()
+        port.host_port = 1234
+        port.container_port = 9001
+
+        self.assertIsNone(launch_command.pool_arguments(launch))
+
+    def make_pooled_launch(self, directory):
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = os.path.join(directory, "sandbox")
+        os.mkdir(launch.directory)
+
+        cpu_resource = launch.task_info.resources.add()
+        cpu_resource.name = "cpus"
+        cpu_resource.type = 0
+        cpu_resource.scalar.value = 2
+
+        pooled = {"docker_id": "a" * 64, "name": "mesos-pool-a", "limits": {"cpu_shares": 1024},
+                  "link": os.path.join(directory, "mesos-pool-a")}
+        os.symlink(directory, pooled["link"])
+
+        return launch, pooled
+
+    def test_launch_pooled(self, _, __):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        launch, pooled = self.make_pooled_launch(directory)
+
+        with patch("containerizer.commands.launch.docker_client") as client, \
+                patch("containerizer.commands.launch.record_launch") as record_launch, \
+                patch("containerizer.commands.launch.update_container") as update_container, \
+                patch.dict("os.environ", {"MESOS_SLAVE_ID": "slave-1",
+                                          "CONTAINERIZER_STATE_DIR": directory}):
+            launch_command.launch_pooled(launch, pooled)
+            self.assertEqual(read_claim("a" * 64), {"mesos.container_id": "container-foo-bar"})
+
+        client.return_value.rename_container.assert_called_once_with("a" * 64,
+                                                                     "container-foo-bar")
+        client.return_value.start_container.assert_called_once_with("a" * 64)
+        record_launch.assert_called_once_with(launch, "a" * 64, limits={"cpu_shares": 1024})
+
+        container_id, resources = update_container.call_args[0]
+        self.assertEqual(container_id, "container-foo-bar")
+        self.assertEqual([(r.name, r.scalar.value) for r in resources], [("cpus", 2)])
+
+        self.assertFalse(os.path.lexists(pooled["link"]))
+        with open(os.path.join(launch.directory, ".containerizer_env")) as f:
+            self.assertEqual(f.read(), "export MESOS_SLAVE_ID=slave-1\n")
+
+    def test_launch_pooled_record_failure(self, _, __):
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        launch, pooled = self.make_pooled_launch(directory)
+
+        with patch("containerizer.commands.launch.docker_client"), \
+                patch("containerizer.commands.launch.image_digest", return_value=None), \
+                patch("containerizer.commands.launch.update_container_state",
+                      side_effect=IOError("No space left on device")), \
+                patch("containerizer.commands.launch.update_container"), \
+                patch("containerizer.cgroups.CGROUP_ROOT", directory), \
+                patch.dict("os.environ", {"CONTAINERIZER_STATE_DIR": directory,
+                                          "CONTAINERIZER_CGROUP_VERSION": "1"}):
+            launch_command.launch_pooled(launch, pooled)
+            self.assertEqual(list_container_states(), {})
+
+            # The claimed container only has the pool label, but is recovered
+            reconcile_containers(list_container_states(), [
+                {"Id": "a" * 64, "Names": ["/container-foo-bar"],
+                 "Labels": {"mesos.pool": "shape-a"}}
+            ])
+            records = list_container_states()
+
+        self.assertEqual(records.keys(), ["container-foo-bar"])
+        self.assertEqual(records["container-foo-bar"]["docker_id"], "a" * 64)
+
+def slow(duration, result=None, error=None):
+    def _slow(*args):
+        time.sleep(duration)
+        if error:
+            raise error
+        return result
+    return _slow
+
+
+@patch.dict("os.environ", {
+    "MESOS_LIBEXEC_DIRECTORY": "/bin",
+    "MESOS_DEFAULT_CONTAINER_IMAGE": "default/container",
+    "CONTAINERIZER_DOCKER_LOG_DRIVER": "json-file"
+})
+class LaunchPhasesTestCase(TestCase):
+
+    def make_launch(self):
+        launch = Launch()
+        launch.container_id.value = "container-foo-bar"
+        launch.directory = "/tmp"
+        launch.user = "test"
+        return launch
+
+    @patch("containerizer.commands.launch.fetch_uris", slow(0.5, result=0))
+    @patch("containerizer.commands.launch.ensure_image", slow(0.5))
+    def test_fetch_and_pull_overlap(self):
+        started = time.time()
+        build_docker_args(self.make_launch())
+
+        self.assertLess(time.time() - started, 0.9)
+
+    @patch("containerizer.commands.launch.fetch_uris", slow(2, result=0))
+    @patch("containerizer.commands.launch.ensure_image", slow(0, error=Exception("No such image")))
+    def test_pull_failure(self):
+        started = time.time()
+        with self.assertRaises(Exception) as context:
+            build_docker_args(self.make_launch())
+
+        self.assertEqual(str(context.exception), "No such image")
+        self.assertLess(time.time() - started, 1)
+
+    @patch("containerizer.commands.launch.fetch_uris", slow(0, result=1))
+    @patch("containerizer.commands.launch.ensure_image", slow(0))
+    def test_fetch_failure(self):
+        with self.assertRaises(Exception):
+            build_docker_args(self.make_launch())
+
+    @patch("containerizer.commands.launch.ensure_image", slow(0, error=Exception("No such image")))
+    def test_pull_failure_cancels_fetch(self):
+        fetches = []
+
+        def fetch_uris(directory, uris, cancelled):
+            fetches.append(cancelled)
+            cancelled.wait(5)
+            return 1
+
+        with patch("containerizer.commands.launch.fetch_uris", fetch_uris):
+            with self.assertRaises(Exception):
+                build_docker_args(self.make_launch())
+
+        self.assertTrue(fetches[0].is_set())
+
+    @patch("containerizer.commands.launch.fetch_uris")
+    @patch("containerizer.commands.launch.ensure_image")
+    def test_bad_ports_before_phases(self, ensure_image, fetch_uris):
+        launch = self.make_launch()
+        launch.task_info.container.type = 1  # DOCKER
+        launch.task_info.container.docker.image = "custom/image"
+        port_mapping = launch.task_info.container.docker.port_mappings.add()
+        port_mapping.host_port = 8080
+        port_mapping.container_port = 80
+
+        with self.assertRaises(Exception):
+            build_docker_args(launch)
+
+        self.assertFalse(fetch_uris.called)
+        self.assertFalse(ensure_image.called)
@@ -0,0 +1,65 @@
+import os
+from mock import patch
+
+from containerizer.commands.recover import reconcile_containers
+from containerizer.pool import list_claims, record_claim
+from containerizer.state import list_container_states, update_container_state
+from tests.fakes import FixtureTestCase
+
+
+class ReconcileContainersTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ReconcileContainersTestCase, self).setUp()
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        self.start_patchers(
+            patch.dict("os.environ", {
+                "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state"),
+                "CONTAINERIZER_CGROUP_VERSION": "1"
+            }),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root)
+        )
+
+    def test_reconcile(self):
+        os.makedirs(os.path.join(self.cgroup_root, "memory", "docker", "cccc"))
+
+        update_container_state("container-gone", docker_id="aaaa")
+        update_container_state("container-same", docker_id="bbbb", cgroups={})
+        update_container_state("container-replaced", docker_id="bbbb", image="busybox")
+
+        reconcile_containers(list_container_states(), [
+            {"Id": "bbbb", "Names": ["/container-same"]},
+            {"Id": "cccc", "Names": ["/container-replaced"]},
+            {"Id": "dddd", "Names": ["/not-ours"]},
+            {"Id": "eeee", "Names": ["/renamed"], "Image": "busybox",
+             "Labels": {"mesos.container_id": "container-unknown"}}
+        ])
+
+        records = list_container_states()
+        self.assertEqual(sorted(records), [
+            "container-replaced", "container-same", "container-unknown"
+        ])
+        self.assertEqual(records["container-unknown"]["docker_id"], "eeee")
+        self.assertEqual(records["container-same"]["docker_id"], "bbbb")
+        self.assertEqual(records["container-replaced"], {
+            "container_id": "container-replaced",
+            "docker_id": "cccc",
+            "cgroups": {"memory": os.path.join(self.cgroup_root, "memory", "docker", "cccc")},
+            "image": "busybox"
+        })
+
+    def test_reconcile_claimed_pooled_containers(self):
+        record_claim("ffff", [("mesos.container_id", "container-pooled")])
+        record_claim("gggg", [("mesos.container_id", "container-gone")])
+
+        reconcile_containers(list_container_states(), [
+            {"Id": "ffff", "Names": ["/container-pooled"], "Labels": {"mesos.pool": "shape-a"}},
+            {"Id": "hhhh", "Names": ["/mesos-pool-0123456789abcdef"],
+             "Labels": {"mesos.pool": "shape-a"}}
+        ])
+
+        records = list_container_states()
+        self.assertEqual(records.keys(), ["container-pooled"])
+        self.assertEqual(records["container-pooled"]["docker_id"], "ffff")
+        self.assertEqual(list_claims(), ["ffff"])
@@ -0,0 +1,112 @@
+import os
+import sys
+import struct
+import threading
+import subprocess
+from mock import patch
+
+from containerizer.commands.serve import ContainerizerServer, run_command
+from containerizer.proto import Containers, ResourceStatistics
+from tests.fakes import FixtureTestCase
+
+CLIENT = os.path.join(
+    os.path.dirname(__file__), "..", "..", "bin", "docker-containerizer-client"
+)
+
+
+@patch("containerizer.commands.containers.docker_client")
+class ServeTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ServeTestCase, self).setUp()
+        self.socket_path = os.path.join(self.directory, "containerizer.sock")
+
+        # The environment commands run in on behalf of a client
+        self.env = {"CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state")}
+
+    def test_run_command(self, docker_client):
+        docker_client().list_containers.return_value = [{"Id": "aaaa", "Names": ["/foobar"]}]
+
+        status, output = run_command("containers", "", self.env)
+        self.assertEqual(status, 0)
+
+        size = struct.unpack('I', output[:4])[0]
+        containers = Containers()
+        containers.ParseFromString(output[4:4 + size])
+        self.assertEqual(containers.containers[0].value, "foobar")
+
+    def test_run_command_exit_status(self, docker_client):
+        docker_client().list_containers.return_value = [{"Id": "aaaa", "Names": []}]
+
+        status, _ = run_command("containers", "", self.env)
+        self.assertEqual(status, 1)
+
+    def call_daemon(self, arguments, stdin=""):
+        """
+        Make a call through the client to a daemon serving in this process,
+        returning a tuple of the client's (exit_status, stdout).
+        """
+
+        server = ContainerizerServer(self.socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            env = dict(os.environ, CONTAINERIZER_DAEMON_SOCKET=self.socket_path, **self.env)
+            client = subprocess.Popen(
+                [sys.executable, "-S", CLIENT] + arguments,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env
+            )
+            output, _ = client.communicate(stdin)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return client.returncode, output
+
+    def test_client_round_trip(self, docker_client):
+        docker_client().list_containers.return_value = [{"Id": "aaaa", "Names": ["/foobar"]}]
+
+        status, output = self.call_daemon(["containers"])
+
+        self.assertEqual(status, 0)
+        self.assertEqual(output, run_command("containers", "", self.env)[1])
+
+    @patch("containerizer.commands.usage.lookup_container_id", lambda c: "lxc-" + c)
+    @patch("containerizer.commands.usage.collect_containers_stats")
+    def test_client_batch_usage(self, collect_containers_stats, _):
+        stats = ResourceStatistics()
+        stats.timestamp = 1
+        stats.cpus_limit = 2
+        collect_containers_stats.return_value = {"lxc-foo": stats}
+
+        containers = Containers()
+        containers.containers.add().value = "foo"
+        containers.containers.add().value = "bar"
+        data = containers.SerializeToString()
+
+        status, output = self.call_daemon(["usage", "--batch"],
+                                          struct.pack('I', len(data)) + data)
+        self.assertEqual(status, 0)
+
+        results = []
+        while output:
+            size = struct.unpack('I', output[:4])[0]
+            result = ResourceStatistics()
+            result.ParseFromString(output[4:4 + size])
+            results.append(result)
+            output = output[4 + size:]
+
+        self.assertEqual([r.cpus_limit for r in results], [2, 0])
+        self.assertEqual(sorted(collect_containers_stats.call_args[0][0]), ["lxc-bar", "lxc-foo"])
+
+    def test_client_daemon_unavailable(self, _):
+        env = dict(os.environ, CONTAINERIZER_DAEMON_SOCKET=self.socket_path)
+        client = subprocess.Popen(
+            [sys.executable, "-S", CLIENT, "containers"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+        )
+        client.communicate()
+
+        self.assertEqual(client.returncode, 75)
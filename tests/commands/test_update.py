@@ -0,0 +1,130 @@
+import os
+import errno
+from mock import patch
+
+from containerizer.cgroups import close_handles, hierarchy, write_metric
+from containerizer.commands.update import update_container, shrink_memory_limit
+from containerizer.proto import Update, Value
+from containerizer.state import read_container_state, update_container_state
+from tests.fakes import FixtureTestCase, write_files
+
+
+def update_resources(cpus, mem):
+    update = Update()
+    for name, value in (("cpus", cpus), ("mem", mem)):
+        resource = update.resources.add()
+        resource.name = name
+        resource.type = Value.SCALAR
+        resource.scalar.value = value
+    return update.resources
+
+
+class UpdateContainerTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(UpdateContainerTestCase, self).setUp()
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        self.start_patchers(
+            patch.dict("os.environ", {
+                "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state"),
+                "CONTAINERIZER_CGROUP_VERSION": "1"
+            }),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root)
+        )
+
+        self.write_cgroup("cpu", {
+            "cpu.shares": "1024\n",
+            "cpu.cfs_quota_us": "-1\n",
+            "cpu.cfs_period_us": "100000\n"
+        })
+        self.write_cgroup("memory", {
+            "memory.limit_in_bytes": "268435456\n",
+            "memory.soft_limit_in_bytes": "268435456\n",
+            "memory.usage_in_bytes": "67108864\n"
+        })
+        update_container_state("container-foo", docker_id="aaaa")
+
+    def tearDown(self):
+        close_handles()
+
+    def write_cgroup(self, subsystem, files):
+        write_files(os.path.join(self.cgroup_root, subsystem, "docker", "aaaa"), files)
+
+    def read_cgroup(self, subsystem, name):
+        with open(os.path.join(self.cgroup_root, subsystem, "docker", "aaaa", name)) as f:
+            return f.read()
+
+    def test_update(self):
+        update_container("container-foo", update_resources(0.5, 128))
+
+        self.assertEqual(self.read_cgroup("cpu", "cpu.shares"), "512")
+        self.assertEqual(self.read_cgroup("memory", "memory.soft_limit_in_bytes"), "134217728")
+        self.assertEqual(self.read_cgroup("memory", "memory.limit_in_bytes"), "134217728")
+        self.assertEqual(read_container_state("container-foo")["limits"], {
+            "cpu_shares": 512,
+            "memory_limit": 134217728,
+            "memory_soft_limit": 134217728
+        })
+
+    def test_unchanged_update(self):
+        update_container("container-foo", update_resources(2, 256))
+
+        with patch("containerizer.cgroups.write_metric", side_effect=write_metric) as write:
+            update_container("container-foo", update_resources(2, 256))
+        self.assertFalse(write.called)
+
+        with patch("containerizer.cgroups.write_metric", side_effect=write_metric) as write:
+            update_container("container-foo", update_resources(3, 256))
+        write.assert_called_once_with("aaaa", "cpu.shares", 3072)
+
+    def test_shrink_blocked_by_usage(self):
+        backend = hierarchy()
+        write_memory_limit = backend.write_memory_limit
+
+        # Usage can't be reclaimed below 192MB, so the kernel refuses to
+        # lower the limit any further
+        def write_limit(lxc_container_id, limit):
+            if limit < 201326592:
+                raise IOError(errno.EBUSY, "Device or resource busy")
+            write_memory_limit(lxc_container_id, limit)
+
+        with patch.object(backend, "write_memory_limit", side_effect=write_limit):
+            update_container("container-foo", update_resources(1, 128))
+
+        self.assertEqual(self.read_cgroup("memory", "memory.limit_in_bytes"), "201326592")
+        self.assertEqual(read_container_state("container-foo")["limits"]["memory_limit"],
+                         201326592)
+
+        # Nothing is forced out of the page cache of the container
+        self.assertFalse(os.path.exists(os.path.join(
+            self.cgroup_root, "memory", "docker", "aaaa", "memory.force_empty"
+        )))
+
+    def test_shrink_steps(self):
+        limits = []
+        backend = hierarchy()
+        with patch.object(backend, "write_memory_limit", side_effect=lambda _, l: limits.append(l)):
+            limit = shrink_memory_limit(backend, "aaaa", 268435456, 134217728)
+
+        self.assertEqual(limit, 134217728)
+        self.assertEqual(limits, [234881024, 201326592, 167772160, 134217728])
+
+    def test_cpu_quota(self):
+        quota_mode = {"CONTAINERIZER_CPU_LIMIT": "quota", "CONTAINERIZER_CPU_BURST": "0.5"}
+        with patch.dict("os.environ", quota_mode):
+            update_container("container-foo", update_resources(1.5, 256))
+
+        self.assertEqual(self.read_cgroup("cpu", "cpu.shares"), "1536")
+        self.assertEqual(self.read_cgroup("cpu", "cpu.cfs_quota_us"), "150000")
+        self.assertEqual(self.read_cgroup("cpu", "cpu.cfs_period_us"), "100000")
+        # The kernel doesn't support bursting, as there's no cpu.cfs_burst_us
+        self.assertEqual(read_container_state("container-foo")["limits"]["cpu_burst"], 0)
+
+        self.write_cgroup("cpu", {"cpu.cfs_burst_us": "0\n"})
+        with patch.dict("os.environ", quota_mode):
+            update_container("container-foo", update_resources(0.5, 256))
+
+        self.assertEqual(self.read_cgroup("cpu", "cpu.cfs_quota_us"), "50000")
+        self.assertEqual(self.read_cgroup("cpu", "cpu.cfs_burst_us"), "25000")
+        self.assertEqual(read_container_state("container-foo")["limits"]["cpu_burst"], 25000)
@@ -1,14 +1,18 @@
+import os
 import mock
 from unittest import TestCase
 
-from containerizer.commands.usage import collect_container_stats
+from containerizer.cgroups import close_handles
+from containerizer.commands.usage import collect_container_stats, collect_containers_stats
 from containerizer.proto import ResourceStatistics
+from tests.fakes import FixtureTestCase, write_files
 
 
 def mock_docker_ps():
     exit(1)
 
 
+@mock.patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "1"})
 class ContainerStatsTestCase(TestCase):
 
     def test_collect_stats(self):
@@ -44,3 +48,104 @@ class ContainerStatsTestCase(TestCase):
 
         self.assertEqual(stats.mem_limit_bytes, 4)
         self.assertEqual(stats.mem_rss_bytes, 5)
+
+    def test_collect_stats_many(self):
+
+        results = {
+            "aaaa": {
+                "cpu.shares": {None: "512"},
+                "cpuacct.stat": {"user": "100", "system": "200"},
+                "memory.limit_in_bytes": {None: "4"},
+                "memory.usage_in_bytes": {None: "5"},
+                "memory.stat": {"total_cache": "6", "total_rss": "7"}
+            }
+        }
+
+        with mock.patch('containerizer.commands.usage.sweep_metrics', return_value=results) as sweep:
+            all_stats = collect_containers_stats(["aaaa", "bbbb"], 100)
+
+        self.assertEqual(sweep.call_args[0][0], ["aaaa", "bbbb"])
+        self.assertEqual(all_stats.keys(), ["aaaa"])
+
+        stats = all_stats["aaaa"]
+        self.assertEqual(stats.cpus_limit, 2)
+        self.assertEqual(stats.cpus_user_time_secs, 1)
+        self.assertEqual(stats.cpus_system_time_secs, 2)
+        self.assertEqual(stats.mem_limit_bytes, 4)
+        self.assertEqual(stats.mem_rss_bytes, 5)
+        self.assertEqual(stats.mem_file_bytes, 6)
+        self.assertEqual(stats.mem_anon_bytes, 7)
+
+
+class HierarchyStatsTestCase(FixtureTestCase):
+
+    def tearDown(self):
+        close_handles()
+
+    def use_root(self, name):
+        self.root = os.path.join(self.directory, name)
+        self.start_patchers(mock.patch("containerizer.cgroups.CGROUP_ROOT", self.root))
+
+    def write_v1_tree(self):
+        self.use_root("v1")
+        write_files(os.path.join(self.root, "cpu", "docker", "aaaa"), {
+            "cpu.shares": "1024\n",
+            "cpu.stat": "nr_periods 10\nnr_throttled 2\nthrottled_time 3000250000\n"
+        })
+        write_files(os.path.join(self.root, "cpuacct", "docker", "aaaa"), {
+            "cpuacct.stat": "user 500\nsystem 250\n"
+        })
+        write_files(os.path.join(self.root, "memory", "docker", "aaaa"), {
+            "memory.limit_in_bytes": "1073741824\n",
+            "memory.usage_in_bytes": "4096\n",
+            "memory.stat": "total_cache 1024\ntotal_rss 2048\ntotal_mapped_file 512\n"
+        })
+
+    def write_v2_tree(self, parent):
+        self.use_root("v2")
+        write_files(self.root, {"cgroup.controllers": "cpu memory io\n"})
+        write_files(os.path.join(self.root, parent), {
+            "cpu.weight": "39\n",
+            "cpu.max": "max 100000\n",
+            "cpu.stat": "usage_usec 7500000\nuser_usec 5000000\nsystem_usec 2500000\n"
+                        "nr_periods 10\nnr_throttled 2\nthrottled_usec 3000250\n",
+            "cpu.pressure": "some avg10=1.50 avg60=0.00 avg300=0.00 total=10\n"
+                            "full avg10=0.50 avg60=0.00 avg300=0.00 total=5\n",
+            "memory.max": "1073741824\n",
+            "memory.current": "4096\n",
+            "memory.stat": "anon 2048\nfile 1024\nfile_mapped 512\n",
+            "memory.pressure": "some avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+                               "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+        })
+
+    def collect(self):
+        return collect_container_stats("aaaa", ResourceStatistics(), 100)
+
+    def assertStatsEqual(self, v1_stats, v2_stats):
+        for field in ResourceStatistics.DESCRIPTOR.fields_by_name:
+            if field == "timestamp":
+                continue
+            elif field == "cpus_limit":
+                # cpu.weight is coarser than cpu.shares
+                self.assertAlmostEqual(v1_stats.cpus_limit, v2_stats.cpus_limit, delta=0.1)
+            else:
+                self.assertEqual(getattr(v1_stats, field), getattr(v2_stats, field), field)
+
+    def test_v1_v2_equivalent(self):
+        self.write_v1_tree()
+        v1_stats = self.collect()
+
+        self.write_v2_tree(os.path.join("system.slice", "docker-aaaa.scope"))
+        v2_stats = self.collect()
+
+        self.assertEqual(v1_stats.cpus_user_time_secs, 5)
+        self.assertEqual(v1_stats.mem_anon_bytes, 2048)
+        self.assertEqual(v1_stats.cpus_throttled_time_secs, 3.00025)
+        self.assertStatsEqual(v1_stats, v2_stats)
+
+    def test_v2_sweep(self):
+        self.write_v2_tree(os.path.join("docker", "aaaa"))
+        all_stats = collect_containers_stats(["aaaa", "bbbb"], 100)
+
+        self.assertEqual(all_stats.keys(), ["aaaa"])
+        self.assertStatsEqual(self.collect(), all_stats["aaaa"])
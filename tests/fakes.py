@@ -0,0 +1,130 @@
+"""
+Fakes and fixtures shared between the test cases.
+"""
+
+import os
+import json
+import Queue
+import shutil
+import tempfile
+import SocketServer
+import BaseHTTPServer
+from unittest import TestCase
+
+
+def write_file(path, contents):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def write_files(directory, files):
+    for name, contents in files.iteritems():
+        write_file(os.path.join(directory, name), contents)
+
+
+class FixtureTestCase(TestCase):
+    """
+    A test case with a temporary `directory` that's removed after each test,
+    and patchers started with `start_patchers` that are stopped after it.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def start_patchers(self, *patchers):
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class FakeDockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def respond(self):
+        self.server.requests.append((self.command, self.path))
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        if (self.command, self.path.split("?")[0]) == ("GET", "/events"):
+            return self.stream_events()
+        if self.command == "GET" and self.path.split("?")[0] in self.server.logs:
+            return self.stream_logs(self.server.logs[self.path.split("?")[0]])
+
+        route = self.server.routes.get(
+            (self.command, self.path.split("?")[0]), (404, {"message": "not found"})
+        )
+
+        # Routes without a response drop the connection, as a dying daemon would
+        if route is None:
+            self.close_connection = 1
+            return
+
+        status, body = route
+
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+
+        # Stream events pushed by the test until it pushes None
+        while True:
+            event = self.server.events.get()
+            data = json.dumps(event) if event is not None else ""
+            self.wfile.write("%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            if event is None:
+                break
+
+    def stream_logs(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # Send the output in small chunks, that split the frames up
+        for offset in xrange(0, len(data), 5):
+            chunk = data[offset:offset + 5]
+            self.wfile.write("%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write("0\r\n\r\n")
+
+    do_GET = do_POST = do_DELETE = respond
+
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDockerServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, routes):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, FakeDockerHandler)
+        self.routes = routes
+        self.requests = []
+        self.connections = 0
+        self.events = Queue.Queue()
+        self.logs = {}  # Path to the raw output streamed from it
@@ -0,0 +1,219 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+
+from containerizer import cgroups
+
+
+def write_cgroup_file(root, subsystem, lxc_container_id, metric, contents):
+    directory = os.path.join(root, subsystem, "docker", lxc_container_id)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with open(os.path.join(directory, metric), "w") as f:
+        f.write(contents)
+
+
+class CgroupMetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch("containerizer.cgroups.CGROUP_ROOT", self.root)
+        self.patcher.start()
+
+        for lxc_container_id in ("aaaa", "bbbb"):
+            write_cgroup_file(self.root, "cpu", lxc_container_id, "cpu.shares", "1024\n")
+            write_cgroup_file(self.root, "cpu", lxc_container_id, "cpu.stat",
+                              "nr_periods 1\nnr_throttled 2\nthrottled_time 3\n")
+            write_cgroup_file(self.root, "memory", lxc_container_id,
+                              "memory.usage_in_bytes", "4096\n")
+
+    def tearDown(self):
+        cgroups.close_handles()
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+
+    def test_read_metrics(self):
+        self.assertEqual(dict(cgroups.read_metrics("aaaa", "cpu.stat")), {
+            "nr_periods": "1",
+            "nr_throttled": "2",
+            "throttled_time": "3"
+        })
+
+    def test_read_metric(self):
+        self.assertEqual(cgroups.read_metric("aaaa", "cpu.shares"), "1024")
+        self.assertEqual(cgroups.read_metric("aaaa", "cpu.stat", "nr_throttled"), "2")
+
+    def test_read_missing_metric(self):
+        with self.assertRaises(Exception):
+            cgroups.read_metric("cccc", "cpu.shares")
+
+    def test_sweep_metrics(self):
+        results = cgroups.sweep_metrics(
+            ["aaaa", "bbbb", "cccc"],
+            ["cpu.shares", "cpu.stat", "memory.usage_in_bytes", "memory.stat"]
+        )
+
+        self.assertEqual(sorted(results.keys()), ["aaaa", "bbbb"])
+        self.assertEqual(results["aaaa"]["cpu.shares"], {None: "1024"})
+        self.assertEqual(results["bbbb"]["cpu.stat"]["nr_throttled"], "2")
+        self.assertEqual(results["bbbb"]["memory.usage_in_bytes"], {None: "4096"})
+        self.assertNotIn("memory.stat", results["aaaa"])
+
+    def test_handle_reread(self):
+        path = cgroups.metric_path("aaaa", "cpu.stat")
+        handle = cgroups.CgroupHandle(path)
+
+        record = handle.read()
+        keys = record.keys
+        self.assertEqual(record.get("nr_periods"), "1")
+
+        with open(path, "w") as f:
+            f.write("nr_periods 5\nnr_throttled 6\nthrottled_time 7\n")
+
+        record = handle.read()
+        self.assertIs(record.keys, keys)
+        self.assertEqual(record.get("nr_periods"), "5")
+        self.assertIsNone(record.get("missing"))
+
+        handle.close()
+
+    def test_handle_large_file(self):
+        write_cgroup_file(self.root, "memory", "aaaa", "memory.stat", "".join(
+            "key_%d %d\n" % (i, i) for i in xrange(1000)
+        ))
+
+        record = cgroups.CgroupHandle(cgroups.metric_path("aaaa", "memory.stat")).read()
+        self.assertEqual(len(record.keys), 1000)
+        self.assertEqual(record.get("key_999"), "999")
+
+    def test_handles_reused(self):
+        cgroups.read_metric("aaaa", "cpu.shares")
+        handle = cgroups.open_handle(cgroups.metric_path("aaaa", "cpu.shares"))
+
+        cgroups.read_metric("aaaa", "cpu.shares")
+        self.assertIs(cgroups.open_handle(cgroups.metric_path("aaaa", "cpu.shares")), handle)
+
+        cgroups.close_handles("aaaa")
+        self.assertIsNot(cgroups.open_handle(cgroups.metric_path("aaaa", "cpu.shares")), handle)
+
+    def test_handle_evicted_while_reading(self):
+        path = cgroups.metric_path("aaaa", "cpu.shares")
+        handle = cgroups.open_handle(path)
+        cgroups.close_handles("aaaa")  # Evicted by another thread
+
+        handles = [handle]
+        open_handle = cgroups.open_handle
+        with patch("containerizer.cgroups.open_handle",
+                   side_effect=lambda p: handles.pop() if handles else open_handle(p)):
+            self.assertEqual(cgroups.read_metric("aaaa", "cpu.shares"), "1024")
+
+    def test_handles_reserved_for_sweep(self):
+        with patch("containerizer.cgroups._handles_limit", 2):
+            cgroups.sweep_metrics(["aaaa", "bbbb"],
+                                  ["cpu.shares", "cpu.stat", "memory.usage_in_bytes"])
+            self.assertEqual(len(cgroups._handles), 6)
+            self.assertFalse(any(h.file.closed for h in cgroups._handles.values()))
+
+    def test_write_metric(self):
+        cgroups.write_metric("aaaa", "cpu.shares", 512)
+        self.assertEqual(cgroups.read_metric("aaaa", "cpu.shares"), "512")
+
+    def test_device_keys(self):
+        write_cgroup_file(self.root, "blkio", "aaaa", "blkio.throttle.io_service_bytes",
+                          "8:0 Read 4096\n8:0 Write 1024\n8:0 Sync 0\n8:0 Async 5120\n"
+                          "8:0 Total 5120\n8:16 Read 1\n8:16 Write 2\nTotal 5123\n")
+
+        stats = dict(cgroups.read_metrics("aaaa", "blkio.throttle.io_service_bytes"))
+        self.assertEqual(stats["8:0.Read"], "4096")
+        self.assertEqual(stats["Total"], "5123")
+
+        usage = cgroups.CgroupV1Hierarchy().usage_statistics(
+            {"blkio.throttle.io_service_bytes": stats}, 100
+        )
+        self.assertEqual((usage["disk_read_bytes"], usage["disk_write_bytes"]), (4097, 1026))
+
+    def test_event_statistics(self):
+        events = cgroups.CgroupV1Hierarchy().event_statistics({
+            "memory.oom_control": {"oom_kill_disable": "0", "under_oom": "1", "oom_kill": "2"}
+        })
+        self.assertEqual(events, {"mem_under_oom": 1, "mem_oom_kills": 2})
+
+
+class CgroupV2TestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.patcher = patch("containerizer.cgroups.CGROUP_ROOT", self.root)
+        self.patcher.start()
+
+        with open(os.path.join(self.root, "cgroup.controllers"), "w") as f:
+            f.write("cpu memory io\n")
+
+        self.cgroup = os.path.join(self.root, "system.slice", "docker-aaaa.scope")
+        os.makedirs(self.cgroup)
+
+        for name, contents in (("cpu.weight", "100\n"),
+                               ("cpu.max", "max 100000\n"),
+                               ("memory.max", "max\n"),
+                               ("io.stat", "8:0 rbytes=1 wbytes=2\n8:16 rbytes=3 wbytes=4\n")):
+            with open(os.path.join(self.cgroup, name), "w") as f:
+                f.write(contents)
+
+    def tearDown(self):
+        cgroups.close_handles()
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+
+    def test_detect_hierarchy(self):
+        self.assertEqual(cgroups.hierarchy().version, 2)
+
+        with patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "1"}):
+            self.assertEqual(cgroups.hierarchy().version, 1)
+
+    def test_cgroup_exists(self):
+        self.assertTrue(cgroups.cgroup_exists("aaaa"))
+        self.assertFalse(cgroups.cgroup_exists("bbbb"))
+        self.assertEqual(cgroups.hierarchy().list_cgroups(), {"aaaa": self.cgroup})
+
+    def test_nested_keys(self):
+        self.assertEqual(dict(cgroups.read_metrics("aaaa", "io.stat")), {
+            "8:0.rbytes": "1",
+            "8:0.wbytes": "2",
+            "8:16.rbytes": "3",
+            "8:16.wbytes": "4"
+        })
+
+    def test_io_statistics(self):
+        usage = cgroups.hierarchy().usage_statistics({
+            "io.stat": dict(cgroups.read_metrics("aaaa", "io.stat"))
+        }, 100)
+        self.assertEqual((usage["disk_read_bytes"], usage["disk_write_bytes"]), (4, 6))
+
+    def test_memory_limit(self):
+        backend = cgroups.hierarchy()
+        self.assertEqual(backend.read_memory_limit("aaaa"), cgroups.UNLIMITED_MEMORY)
+
+        backend.write_memory_limit("aaaa", 1024)
+        self.assertEqual(backend.read_memory_limit("aaaa"), 1024)
+
+    def test_cpu_limits(self):
+        backend = cgroups.hierarchy()
+
+        backend.write_cpu_shares("aaaa", 1024)
+        self.assertEqual(cgroups.read_metric("aaaa", "cpu.weight"), "39")
+
+        backend.write_cpu_quota("aaaa", 50000, 100000)
+        self.assertEqual(dict(cgroups.read_metrics("aaaa", "cpu.max")), {"50000": "100000"})
+
+        backend.write_cpu_quota("aaaa", -1, 100000)
+        self.assertEqual(dict(cgroups.read_metrics("aaaa", "cpu.max")), {"max": "100000"})
+        self.assertEqual(backend.read_cpu_quota("aaaa"), (-1, 100000))
+
+        backend.write_cpu_quota("aaaa", 50000, 100000)
+        self.assertEqual(backend.read_cpu_quota("aaaa"), (50000, 100000))
+
+        self.assertEqual(backend.read_cpu_burst("aaaa"), 0)
+        self.assertFalse(backend.write_cpu_burst("aaaa", 10000))
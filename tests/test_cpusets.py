@@ -0,0 +1,124 @@
+import os
+import shutil
+from mock import patch
+
+from containerizer import cpusets
+from containerizer.cgroups import close_handles
+from containerizer.state import read_container_state, update_container_state
+from tests.fakes import FixtureTestCase, write_file
+
+
+class CpusetAllocatorTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(CpusetAllocatorTestCase, self).setUp()
+        self.sysfs = os.path.join(self.directory, "sys")
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        # Two NUMA nodes of four CPUs each
+        write_file(os.path.join(self.sysfs, "node", "node0", "cpulist"), "0-3\n")
+        write_file(os.path.join(self.sysfs, "node", "node1", "cpulist"), "4-7\n")
+        write_file(os.path.join(self.sysfs, "node", "possible"), "0-1\n")
+
+        self.start_patchers(
+            patch.dict("os.environ", {
+                "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state"),
+                "CONTAINERIZER_RUN_DIR": os.path.join(self.directory, "run"),
+                "CONTAINERIZER_CGROUP_VERSION": "1",
+                "CONTAINERIZER_CPUSET": "exclusive"
+            }),
+            patch("containerizer.cpusets.SYSFS_ROOT", self.sysfs),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root)
+        )
+
+    def tearDown(self):
+        close_handles()
+
+    def cgroup_path(self, lxc_container_id):
+        return os.path.join(self.cgroup_root, "cpuset", "docker", lxc_container_id, "cpuset.cpus")
+
+    def test_topology(self):
+        self.assertEqual(cpusets.read_topology().items(), [(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])])
+
+        shutil.rmtree(os.path.join(self.sysfs, "node"))
+        write_file(os.path.join(self.sysfs, "cpu", "online"), "0-1\n")
+        self.assertEqual(cpusets.read_topology().items(), [(0, [0, 1])])
+
+    def test_disabled(self):
+        with patch.dict("os.environ", {"CONTAINERIZER_CPUSET": "none"}):
+            self.assertEqual(cpusets.allocate_cpuset("container-a", 2), None)
+        self.assertEqual(read_container_state("container-a"), None)
+
+    def test_allocate(self):
+        shared = cpusets.allocate_cpuset("container-shared", 0.5)
+        self.assertEqual(shared, {"cpus": range(8), "mems": [], "exclusive": False})
+
+        # The shared container is running by now
+        update_container_state("container-shared", docker_id="aaaa")
+        write_file(self.cgroup_path("aaaa"), "0-7\n")
+
+        self.assertEqual(cpusets.allocate_cpuset("container-a", 2),
+                         {"cpus": [0, 1], "mems": [0], "exclusive": True})
+        self.assertEqual(cpusets.allocate_cpuset("container-b", 3),
+                         {"cpus": [4, 5, 6], "mems": [1], "exclusive": True})
+
+        # The node with the fewest CPUs that fit is used
+        self.assertEqual(cpusets.allocate_cpuset("container-c", 1),
+                         {"cpus": [7], "mems": [1], "exclusive": True})
+
+        with open(self.cgroup_path("aaaa")) as f:
+            self.assertEqual(f.read(), "2-3")
+
+    def test_keep_shared_cpus(self):
+        with patch.dict("os.environ", {"CONTAINERIZER_CPUSET_RESERVED": "0"}):
+            self.assertEqual(cpusets.allocate_cpuset("container-a", 7),
+                             {"cpus": range(1, 8), "mems": [0, 1], "exclusive": True})
+
+        # Allocating the last CPU would leave nothing to share
+        self.assertEqual(cpusets.allocate_cpuset("container-b", 1),
+                         {"cpus": [0], "mems": [], "exclusive": False})
+
+    def test_release(self):
+        cpusets.allocate_cpuset("container-shared", 0.5)
+        update_container_state("container-shared", docker_id="aaaa")
+        write_file(self.cgroup_path("aaaa"), "0-7\n")
+
+        cpusets.allocate_cpuset("container-a", 4)
+        with open(self.cgroup_path("aaaa")) as f:
+            self.assertEqual(f.read(), "4-7")
+
+        cpusets.release_cpuset("container-a")
+        self.assertEqual(read_container_state("container-a")["cpuset"], None)
+        self.assertEqual(read_container_state("container-shared")["cpuset"]["cpus"], range(8))
+        with open(self.cgroup_path("aaaa")) as f:
+            self.assertEqual(f.read(), "0-7")
+
+        self.assertEqual(cpusets.allocate_cpuset("container-b", 4)["cpus"], [0, 1, 2, 3])
+
+    def test_started_after_resize(self):
+        # The shared container is allocated CPUs, but isn't running yet when
+        # another takes CPUs of its own
+        cpusets.allocate_cpuset("container-shared", 0.5)
+        cpusets.allocate_cpuset("container-a", 4)
+        self.assertEqual(read_container_state("container-shared")["cpuset"]["cpus"], range(4, 8))
+
+        # Docker started it on the CPUs it was first given
+        write_file(self.cgroup_path("aaaa"), "0-7\n")
+        with cpusets.cpuset_lock():
+            update_container_state("container-shared", docker_id="aaaa")
+            cpusets.apply_cpuset("container-shared", "aaaa")
+
+        with open(self.cgroup_path("aaaa")) as f:
+            self.assertEqual(f.read(), "4-7")
+
+    def test_unallocated_container_moved(self):
+        # Launched before CPUs were allocated
+        update_container_state("container-old", docker_id="bbbb")
+        write_file(self.cgroup_path("bbbb"), "0-7\n")
+
+        cpusets.allocate_cpuset("container-a", 4)
+
+        with open(self.cgroup_path("bbbb")) as f:
+            self.assertEqual(f.read(), "4-7")
+        self.assertEqual(read_container_state("container-old")["cpuset"],
+                         {"cpus": range(4, 8), "mems": [], "exclusive": False})
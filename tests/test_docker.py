@@ -0,0 +1,119 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+from unittest import TestCase
+
+from containerizer.docker import DockerClient, DockerAPIError, UnixHTTPConnection
+from tests.fakes import FakeDockerServer
+
+
+class DockerClientTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "docker.sock")
+
+        self.server = FakeDockerServer(self.socket_path, {
+            ("GET", "/containers/foo/json"): (200, {"Id": "a" * 64, "Name": "/foo"}),
+            ("GET", "/containers/json"): (200, [{"Id": "a" * 64, "Names": ["/foo"]}]),
+            ("POST", "/containers/foo/kill"): (204, None),
+            ("POST", "/containers/foo/stop"): (204, None),
+            ("DELETE", "/containers/foo"): (204, None),
+            ("POST", "/containers/foo/wait"): (200, {"StatusCode": 3}),
+            ("GET", "/containers/dropped/json"): None,
+            ("POST", "/containers/dropped/kill"): None
+        })
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.client = DockerClient(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_inspect_container(self):
+        info = self.client.inspect_container("foo")
+        self.assertEqual(info["Id"], "a" * 64)
+
+    def test_list_containers(self):
+        containers = self.client.list_containers(all=True)
+        self.assertEqual(containers[0]["Names"], ["/foo"])
+        self.assertEqual(self.server.requests, [("GET", "/containers/json?all=1")])
+
+    def test_kill_and_remove_container(self):
+        self.client.kill_container("foo")
+        self.client.remove_container("foo")
+        self.assertEqual(self.server.requests, [
+            ("POST", "/containers/foo/kill"),
+            ("DELETE", "/containers/foo")
+        ])
+
+    def test_stop_container(self):
+        self.client.stop_container("foo", timeout=5)
+        self.assertEqual(self.server.requests, [("POST", "/containers/foo/stop?t=5")])
+
+    def test_wait_container(self):
+        self.assertEqual(self.client.wait_container("foo"), 3)
+
+    def test_missing_container(self):
+        with self.assertRaises(DockerAPIError) as context:
+            self.client.inspect_container("bar")
+        self.assertEqual(context.exception.status, 404)
+
+    def test_connection_reuse(self):
+        for _ in xrange(5):
+            self.client.inspect_container("foo")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reconnect_after_close(self):
+        self.client.inspect_container("foo")
+        self.client.idle_connections[0].sock.close()
+        self.client.inspect_container("foo")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_reconnect_after_server_close(self):
+        local, remote = socket.socketpair()
+        connection = UnixHTTPConnection(self.socket_path)
+        connection.sock = local
+        self.client.release_connection(connection)
+        remote.close()
+
+        self.client.kill_container("foo")
+        self.assertEqual(self.server.requests, [("POST", "/containers/foo/kill")])
+
+    def test_retry_idempotent_requests(self):
+        with self.assertRaises(Exception):
+            self.client.inspect_container("dropped")
+        self.assertEqual(self.server.requests, [("GET", "/containers/dropped/json")] * 2)
+
+    def test_no_retry_after_sending(self):
+        with self.assertRaises(Exception):
+            self.client.kill_container("dropped")
+        self.assertEqual(self.server.requests, [("POST", "/containers/dropped/kill")])
+
+    def test_events(self):
+        self.server.events.put({"id": "a" * 64, "status": "die"})
+        self.server.events.put({"id": "b" * 64, "status": "die"})
+        self.server.events.put(None)
+
+        events = self.client.events(filters={"event": ["die"]})
+        self.assertEqual([event["id"] for event in events], ["a" * 64, "b" * 64])
+
+    def test_logs(self):
+        frames = [(1, "2015-01-02T03:04:05.1Z hello\n"), (2, "2015-01-02T03:04:06Z oops\n"),
+                  (1, "2015-01-02T03:04:07Z " + "x" * 100 + "\n")]
+        self.server.logs["/containers/foo/logs"] = "".join(
+            struct.pack(">BxxxL", stream, len(data)) + data for stream, data in frames
+        )
+
+        self.assertEqual(list(self.client.logs("foo", since=1420167845.5)), frames)
+        self.assertIn("since=1420167845", self.server.requests[-1][1])
+        self.assertIn("follow=1", self.server.requests[-1][1])
@@ -0,0 +1,121 @@
+import os
+import shutil
+import time
+import struct
+from mock import patch
+
+from containerizer import events
+from containerizer.cgroups import close_handles
+from containerizer.state import update_container_state
+from tests.fakes import FixtureTestCase, write_file
+
+
+class MemoryMonitorTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(MemoryMonitorTestCase, self).setUp()
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        self.start_patchers(
+            patch.dict("os.environ", {
+                "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state"),
+                "CONTAINERIZER_RUN_DIR": os.path.join(self.directory, "run")
+            }),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root),
+            patch("containerizer.events.FLUSH_INTERVAL", 0.05)
+        )
+
+        update_container_state("container-foo", docker_id="aaaa")
+
+        self.monitor = events.MemoryMonitor()
+        self.monitor.start()
+
+    def tearDown(self):
+        self.monitor.unwatch("container-foo")
+        close_handles()
+
+    def wait_for_events(self, expected):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            recorded = events.memory_events("container-foo")
+            if all(recorded.get(key) == value for key, value in expected.iteritems()):
+                return recorded
+            time.sleep(0.01)
+
+        self.fail("Expected memory events %r, recorded %r" % (expected, recorded))
+
+    def test_v1(self):
+        cgroup = os.path.join(self.cgroup_root, "memory", "docker", "aaaa")
+        write_file(os.path.join(cgroup, "memory.oom_control"),
+                   "oom_kill_disable 0\nunder_oom 0\noom_kill 0\n")
+        write_file(os.path.join(cgroup, "memory.pressure_level"), "")
+        write_file(os.path.join(cgroup, "cgroup.event_control"), "")
+
+        with patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "1"}):
+            self.monitor.watch("container-foo", "aaaa")
+
+            # Three events are registered, for OOM and each pressure level
+            with open(os.path.join(cgroup, "cgroup.event_control")) as f:
+                registered = f.read()
+            self.assertTrue(registered.endswith(" critical"))
+
+            event_fds = [fd for fd, (watched, _) in self.monitor.handlers.items()
+                         if watched is not None]
+            self.assertEqual(len(event_fds), 3)
+            oom_fd, medium_fd, _ = sorted(event_fds)
+
+            write_file(os.path.join(cgroup, "memory.oom_control"),
+                       "oom_kill_disable 0\nunder_oom 0\noom_kill 2\n")
+            os.write(oom_fd, struct.pack("Q", 1))
+            os.write(medium_fd, struct.pack("Q", 1))
+
+            recorded = self.wait_for_events({
+                "oom_events": 1, "oom_kills": 2, "pressure_medium_events": 1
+            })
+            self.assertEqual(recorded["pressure_level"], "medium")
+
+    def test_v1_cgroup_removed(self):
+        cgroup = os.path.join(self.cgroup_root, "memory", "docker", "aaaa")
+        write_file(os.path.join(cgroup, "memory.oom_control"), "oom_kill_disable 0\n")
+        write_file(os.path.join(cgroup, "memory.pressure_level"), "")
+        write_file(os.path.join(cgroup, "cgroup.event_control"), "")
+
+        with patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "1"}):
+            self.monitor.watch("container-foo", "aaaa")
+
+            event_fds = [fd for fd, (watched, _) in self.monitor.handlers.items()
+                         if watched is not None]
+            _, medium_fd, critical_fd = sorted(event_fds)
+
+            # Removing the cgroup signals the pressure eventfds
+            shutil.rmtree(cgroup)
+            os.write(medium_fd, struct.pack("Q", 1))
+            os.write(critical_fd, struct.pack("Q", 1))
+
+            deadline = time.time() + 5
+            while "container-foo" in self.monitor.containers and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertNotIn("container-foo", self.monitor.containers)
+
+        self.assertEqual(events.memory_events("container-foo"), {})
+
+    def test_v2(self):
+        write_file(os.path.join(self.cgroup_root, "cgroup.controllers"), "cpu memory\n")
+        cgroup = os.path.join(self.cgroup_root, "docker", "aaaa")
+        write_file(os.path.join(cgroup, "memory.events"),
+                   "low 0\nhigh 1\nmax 0\noom 0\noom_kill 0\n")
+
+        with patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "2"}):
+            self.monitor.watch("container-foo", "aaaa")
+            self.wait_for_events({"high_events": 1, "oom_kills": 0})
+
+            write_file(os.path.join(cgroup, "memory.events"),
+                       "low 0\nhigh 4\nmax 2\noom 1\noom_kill 1\n")
+            self.wait_for_events({"high_events": 4, "oom_events": 1, "oom_kills": 1})
+
+            # The cgroup going away stops the watch
+            shutil.rmtree(cgroup)
+            deadline = time.time() + 5
+            while "container-foo" in self.monitor.containers and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertNotIn("container-foo", self.monitor.containers)
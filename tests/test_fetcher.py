@@ -0,0 +1,250 @@
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import threading
+import BaseHTTPServer
+from StringIO import StringIO
+from unittest import TestCase
+from mock import patch
+
+from containerizer.fetcher import fetch_uris, DownloadCache
+from containerizer.proto import CommandInfo
+
+
+class FakeHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.server.downloads.append(self.path)
+        self.respond(body=True)
+
+    def respond(self, body):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", '"%d"' % hash(data))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_uri(value, executable=False, extract=True):
+    uri = CommandInfo.URI()
+    uri.value = value
+    uri.executable = executable
+    uri.extract = extract
+    return uri
+
+
+class FetcherTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, "cache")
+        self.sandbox = os.path.join(self.directory, "sandbox")
+        os.makedirs(self.sandbox)
+
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), FakeHTTPHandler)
+        self.server.files = {"/executor.sh": "#!/bin/sh\necho hello\n"}
+        self.server.downloads = []
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+        self.patcher = patch.dict("os.environ", {
+            "CONTAINERIZER_FETCH_CACHE_DIR": self.cache_directory
+        })
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_fetch_http_cached(self):
+        uri = make_uri(self.url + "/executor.sh", executable=True)
+
+        self.assertEqual(fetch_uris(self.sandbox, [uri]), 0)
+        os.unlink(os.path.join(self.sandbox, "executor.sh"))
+        self.assertEqual(fetch_uris(self.sandbox, [uri]), 0)
+
+        path = os.path.join(self.sandbox, "executor.sh")
+        with open(path) as f:
+            self.assertEqual(f.read(), "#!/bin/sh\necho hello\n")
+        self.assertTrue(os.access(path, os.X_OK))
+        self.assertEqual(self.server.downloads, ["/executor.sh"])
+
+    def test_fetch_http_changed(self):
+        uri = make_uri(self.url + "/executor.sh")
+
+        fetch_uris(self.sandbox, [uri])
+        self.server.files["/executor.sh"] = "#!/bin/sh\necho goodbye\n"
+        fetch_uris(self.sandbox, [uri])
+
+        self.assertEqual(len(self.server.downloads), 2)
+        with open(os.path.join(self.sandbox, "executor.sh")) as f:
+            self.assertEqual(f.read(), "#!/bin/sh\necho goodbye\n")
+
+    def test_fetch_missing(self):
+        uri = make_uri(self.url + "/missing.sh")
+        self.assertEqual(fetch_uris(self.sandbox, [uri]), 1)
+
+    def test_fetch_cancelled(self):
+        cancelled = threading.Event()
+        cancelled.set()
+
+        uri = make_uri(self.url + "/executor.sh")
+        self.assertEqual(fetch_uris(self.sandbox, [uri], cancelled), 1)
+        self.assertEqual(self.server.downloads, [])
+        self.assertFalse(os.path.exists(os.path.join(self.sandbox, "executor.sh")))
+
+    def test_fetch_file_and_extract(self):
+        source = os.path.join(self.directory, "source")
+        os.makedirs(source)
+        with open(os.path.join(source, "config.txt"), "w") as f:
+            f.write("config")
+
+        archive_path = os.path.join(self.directory, "bundle.tar.gz")
+        archive = tarfile.open(archive_path, "w:gz")
+        archive.add(os.path.join(source, "config.txt"), "bundle/config.txt")
+        archive.close()
+
+        uris = [make_uri("file://" + archive_path), make_uri(self.url + "/executor.sh")]
+        self.assertEqual(fetch_uris(self.sandbox, uris), 0)
+
+        with open(os.path.join(self.sandbox, "bundle", "config.txt")) as f:
+            self.assertEqual(f.read(), "config")
+        self.assertTrue(os.path.exists(os.path.join(self.sandbox, "executor.sh")))
+
+    def test_sandbox_copy_independent(self):
+        path = os.path.join(self.directory, "artifact")
+        with open(path, "w") as f:
+            f.write("x" * 1024)
+
+        fetch_uris(self.sandbox, [make_uri(path, executable=True)])
+
+        cached = self.cached_names()
+        self.assertEqual(len(cached), 1)
+        cache_path = os.path.join(self.cache_directory, cached[0])
+
+        # Writing to the sandbox copy, or making it executable, leaves the
+        # cached copy alone
+        with open(os.path.join(self.sandbox, "artifact"), "w") as f:
+            f.write("y")
+
+        with open(cache_path) as f:
+            self.assertEqual(f.read(), "x" * 1024)
+        self.assertFalse(os.access(cache_path, os.X_OK))
+
+    def write_tar(self, path, members):
+        archive = tarfile.open(path, "w")
+        for name, type, link in members:
+            info = tarfile.TarInfo(name)
+            info.type = type
+            if type == tarfile.REGTYPE:
+                info.size = 6
+                archive.addfile(info, StringIO("config"))
+            else:
+                info.linkname = link or ""
+                archive.addfile(info)
+        archive.close()
+
+    def test_extract_outside_sandbox(self):
+        for index, members in enumerate(([("../escaped.txt", tarfile.REGTYPE, None)],
+                        [("/tmp/escaped.txt", tarfile.REGTYPE, None)],
+                        [("bundle/link", tarfile.SYMTYPE, "/etc/passwd")],
+                        [("bundle/link", tarfile.SYMTYPE, "../../escaped")],
+                        [("bundle/link", tarfile.LNKTYPE, "../escaped")],
+                        [("bundle/fifo", tarfile.FIFOTYPE, None)],
+                        [("bundle/link", tarfile.SYMTYPE, "."),
+                         ("bundle/link/config.txt", tarfile.REGTYPE, None)])):
+            # Archives of the same size and age would be the same cache entry
+            name = "bundle-%d.tar" % index
+            archive_path = os.path.join(self.directory, name)
+            self.write_tar(archive_path, members)
+
+            self.assertEqual(fetch_uris(self.sandbox, [make_uri("file://" + archive_path)]), 1)
+            self.assertEqual(os.listdir(self.sandbox), [name])
+            os.unlink(os.path.join(self.sandbox, name))
+
+    def test_extract_links(self):
+        archive_path = os.path.join(self.directory, "bundle.tar")
+        self.write_tar(archive_path, [
+            ("bundle/lib/libfoo.so.1", tarfile.REGTYPE, None),
+            ("bundle/lib/libfoo.so", tarfile.SYMTYPE, "libfoo.so.1"),
+            ("bundle/lib/libfoo.so.hard", tarfile.LNKTYPE, "bundle/lib/libfoo.so.1"),
+            ("bundle/lib64", tarfile.SYMTYPE, "lib")
+        ])
+
+        self.assertEqual(fetch_uris(self.sandbox, [make_uri("file://" + archive_path)]), 0)
+
+        bundle = os.path.join(self.sandbox, "bundle")
+        self.assertEqual(os.readlink(os.path.join(bundle, "lib", "libfoo.so")), "libfoo.so.1")
+        self.assertEqual(os.readlink(os.path.join(bundle, "lib64")), "lib")
+        with open(os.path.join(bundle, "lib64", "libfoo.so.hard")) as f:
+            self.assertEqual(f.read(), "config")
+
+    def test_extract_zip_links(self):
+        archive_path = os.path.join(self.directory, "bundle.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("bundle/lib/libfoo.so.1", "config")
+            for name, target in (("bundle/lib/libfoo.so", "libfoo.so.1"),
+                                 ("bundle/escaped", "../../escaped")):
+                info = zipfile.ZipInfo(name)
+                info.external_attr = (0120777 << 16)
+                archive.writestr(info, target)
+
+        self.assertEqual(fetch_uris(self.sandbox, [make_uri("file://" + archive_path)]), 1)
+        self.assertEqual(os.listdir(self.sandbox), ["bundle.zip"])
+
+        archive_path = os.path.join(self.directory, "libs.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("bundle/lib/libfoo.so.1", "config")
+            info = zipfile.ZipInfo("bundle/lib/libfoo.so")
+            info.external_attr = (0120777 << 16)
+            archive.writestr(info, "libfoo.so.1")
+
+        self.assertEqual(fetch_uris(self.sandbox, [make_uri("file://" + archive_path)]), 0)
+        with open(os.path.join(self.sandbox, "bundle", "lib", "libfoo.so")) as f:
+            self.assertEqual(f.read(), "config")
+
+    def test_cache_eviction(self):
+        cache = DownloadCache(self.cache_directory, 2048)
+
+        for name in ("a", "b", "c"):
+            path = os.path.join(self.directory, name)
+            with open(path, "w") as f:
+                f.write(name * 1024)
+            cached_path = cache.fetch(path)
+            os.utime(cached_path, (0, {"a": 1, "b": 3, "c": 2}[name]))
+
+        # Nothing is evicted while an entry could be being copied out
+        with cache.lock(shared=True):
+            cache.evict()
+        self.assertEqual(len(self.cached_names()), 3)
+
+        cache.evict()
+
+        remaining = sorted(
+            open(os.path.join(self.cache_directory, name)).read(1)
+            for name in self.cached_names()
+        )
+        self.assertEqual(remaining, ["b", "c"])
+
+    def cached_names(self):
+        return [name for name in os.listdir(self.cache_directory) if not name.startswith(".")]
@@ -0,0 +1,54 @@
+import os
+from mock import patch
+
+from containerizer import ids
+from tests.fakes import FixtureTestCase
+
+
+class ContainerIDCacheTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ContainerIDCacheTestCase, self).setUp()
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        self.start_patchers(
+            patch.dict("os.environ", {
+                "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state")
+            }),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root)
+        )
+
+    def make_cgroup(self, lxc_container_id):
+        os.makedirs(os.path.join(self.cgroup_root, "cpu", "docker", lxc_container_id))
+
+    @patch("containerizer.ids.inspect_container")
+    def test_cache_hit(self, inspect_container):
+        self.make_cgroup("aaaa")
+        ids.cache_container_id("container-foo", "aaaa")
+
+        self.assertEqual(ids.lookup_container_id("container-foo"), "aaaa")
+        self.assertFalse(inspect_container.called)
+
+    @patch("containerizer.ids.inspect_container", return_value={"Id": "bbbb"})
+    def test_cache_miss(self, inspect_container):
+        self.make_cgroup("bbbb")
+
+        self.assertEqual(ids.lookup_container_id("container-foo"), "bbbb")
+        self.assertEqual(ids.cached_container_id("container-foo"), "bbbb")
+
+    @patch("containerizer.ids.inspect_container", return_value={"Id": "bbbb"})
+    def test_stale_cache_entry(self, inspect_container):
+        ids.cache_container_id("container-foo", "aaaa")
+
+        self.assertEqual(ids.lookup_container_id("container-foo"), "bbbb")
+        self.assertTrue(inspect_container.called)
+
+        # The new container has no cgroup, so it mustn't be cached
+        self.assertEqual(ids.cached_container_id("container-foo"), "aaaa")
+
+    def test_forget_container_id(self):
+        ids.cache_container_id("container-foo", "aaaa")
+        ids.forget_container_id("container-foo")
+        ids.forget_container_id("container-foo")
+
+        self.assertIsNone(ids.cached_container_id("container-foo"))
@@ -0,0 +1,110 @@
+import time
+import threading
+from mock import patch
+
+from containerizer import images
+from tests.fakes import FixtureTestCase
+
+DIGEST = "custom/image@sha256:" + "a" * 64
+
+
+class ImagePullTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ImagePullTestCase, self).setUp()
+
+        self.pulls = []
+        self.present = set()
+
+        def invoke_docker(command, arguments, cancelled=None):
+            time.sleep(0.1)
+            self.pulls.append(arguments[0])
+            self.present.add(arguments[0])
+            return None, None, 0
+
+        def image_digest(image):
+            return image if image in self.present else None
+
+        self.start_patchers(
+            patch.dict("os.environ", {"CONTAINERIZER_STATE_DIR": self.directory}),
+            patch("containerizer.images.invoke_docker", invoke_docker),
+            patch("containerizer.images.image_digest", image_digest)
+        )
+
+    def ensure_image(self, image, policy, **env):
+        env["CONTAINERIZER_PULL_POLICY"] = policy
+        with patch.dict("os.environ", env):
+            images.ensure_image(image)
+
+    def test_always(self):
+        self.ensure_image("custom/image", "always")
+        self.ensure_image("custom/image", "always")
+        self.ensure_image(DIGEST, "always")
+
+        self.assertEqual(self.pulls, ["custom/image", "custom/image", DIGEST])
+
+    def test_if_not_present(self):
+        self.ensure_image("custom/image", "if-not-present")
+        self.ensure_image("custom/image", "if-not-present")
+
+        self.assertEqual(self.pulls, ["custom/image"])
+
+        # The image was removed behind our back
+        self.present.clear()
+        self.ensure_image("custom/image", "if-not-present")
+
+        self.assertEqual(self.pulls, ["custom/image", "custom/image"])
+
+    def test_max_age(self):
+        self.ensure_image("custom/image", "max-age", CONTAINERIZER_PULL_MAX_AGE="60")
+        self.ensure_image("custom/image", "max-age", CONTAINERIZER_PULL_MAX_AGE="60")
+        self.assertEqual(self.pulls, ["custom/image"])
+
+        self.ensure_image("custom/image", "max-age", CONTAINERIZER_PULL_MAX_AGE="-1")
+        self.assertEqual(self.pulls, ["custom/image", "custom/image"])
+
+        self.ensure_image(DIGEST, "max-age", CONTAINERIZER_PULL_MAX_AGE="-1")
+        self.ensure_image(DIGEST, "max-age", CONTAINERIZER_PULL_MAX_AGE="-1")
+        self.assertEqual(self.pulls.count(DIGEST), 1)
+
+    def test_never_for_digests(self):
+        self.ensure_image(DIGEST, "never-for-digests")
+        self.ensure_image(DIGEST, "never-for-digests")
+        self.ensure_image("custom/image", "never-for-digests")
+        self.ensure_image("custom/image", "never-for-digests")
+
+        self.assertEqual(self.pulls, [DIGEST, "custom/image", "custom/image"])
+
+    def test_index(self):
+        self.ensure_image("custom/image", "always")
+
+        entry = images.read_index("custom/image")
+        self.assertEqual(entry["digest"], "custom/image")
+        self.assertAlmostEqual(entry["pulled_at"], time.time(), delta=5)
+
+    @patch.dict("os.environ", {"CONTAINERIZER_PULL_POLICY": "always"})
+    def test_concurrent_pulls_are_shared(self):
+        threads = [
+            threading.Thread(target=images.ensure_image, args=("custom/image",))
+            for _ in xrange(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(self.pulls), 4)
+
+    def test_cancelled(self):
+        cancelled = threading.Event()
+        cancelled.set()
+
+        with patch.dict("os.environ", {"CONTAINERIZER_PULL_POLICY": "always"}):
+            with self.assertRaises(Exception):
+                images.ensure_image("custom/image", cancelled)
+
+        self.assertEqual(self.pulls, [])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(Exception):
+            self.ensure_image("custom/image", "sometimes")
@@ -0,0 +1,100 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from mock import patch
+
+from containerizer import container_lock
+from containerizer.locks import FileLock, LockTimeout
+
+
+class FileLockTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "locks", "container-foo")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exclusive(self):
+        with FileLock(self.path):
+            with self.assertRaises(LockTimeout):
+                FileLock(self.path, timeout=0).acquire()
+
+            with self.assertRaises(LockTimeout):
+                FileLock(self.path, shared=True, timeout=0).acquire()
+
+        with FileLock(self.path, timeout=0):
+            pass
+
+    def test_shared(self):
+        with FileLock(self.path, shared=True):
+            with FileLock(self.path, shared=True, timeout=0):
+                pass
+
+            with self.assertRaises(LockTimeout):
+                FileLock(self.path, timeout=0).acquire()
+
+    def test_timeout(self):
+        with FileLock(self.path):
+            started = time.time()
+            with self.assertRaises(LockTimeout):
+                FileLock(self.path, timeout=0.2).acquire()
+            self.assertGreaterEqual(time.time() - started, 0.2)
+
+        # The abandoned wait mustn't keep hold of the lock once it gets it
+        time.sleep(0.1)
+        with FileLock(self.path, timeout=0):
+            pass
+
+    def test_blocking(self):
+        holder = FileLock(self.path)
+        holder.acquire()
+
+        acquired = []
+
+        def wait():
+            with FileLock(self.path, timeout=5):
+                acquired.append(time.time())
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+
+        time.sleep(0.1)
+        self.assertEqual(acquired, [])
+
+        released = time.time()
+        holder.release()
+        thread.join()
+
+        self.assertGreaterEqual(acquired[0], released)
+
+    def test_removed_while_waiting(self):
+        holder = FileLock(self.path)
+        holder.acquire()
+
+        waiter = FileLock(self.path)
+        thread = threading.Thread(target=waiter.acquire)
+        thread.start()
+
+        time.sleep(0.1)
+        holder.remove()
+        holder.release()
+        thread.join()
+
+        # The waiter has the lock on a new file, which excludes newcomers
+        self.assertTrue(os.path.exists(self.path))
+        with self.assertRaises(LockTimeout):
+            FileLock(self.path, timeout=0).acquire()
+
+        waiter.release()
+
+    def test_container_lock(self):
+        with patch.dict("os.environ", {"CONTAINERIZER_RUN_DIR": self.directory,
+                                       "CONTAINERIZER_LOCK_TIMEOUT": "0"}):
+            with container_lock("container-foo"):
+                with self.assertRaises(LockTimeout):
+                    container_lock("container-foo", shared=True).acquire()
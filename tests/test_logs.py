@@ -0,0 +1,189 @@
+import os
+import gzip
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+
+from containerizer import logs
+from containerizer.state import read_container_state, update_container_state
+
+
+class FakeClient(object):
+
+    def __init__(self, frames, driver="json-file"):
+        self.frames = frames
+        self.driver = driver
+        self.since = []
+
+    def inspect_container(self, container):
+        return {"HostConfig": {"LogConfig": {"Type": self.driver, "Config": {}}}}
+
+    def logs(self, container, since=None):
+        self.since.append(since)
+        return iter(self.frames)
+
+
+def read_file(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+class RotatingLogTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "docker_stdout")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rotate_by_size(self):
+        log = logs.RotatingLog(self.path, max_size=10, max_files=2)
+        for line in ("aaaa\n", "bbbb\n", "cccc\n", "dddd\n", "eeee\n", "ffff\n", "gggg\n"):
+            log.write(line)
+        log.close()
+
+        self.assertEqual(read_file(self.path), "gggg\n")
+        self.assertEqual(read_file(self.path + ".1"), "eeee\nffff\n")
+        self.assertEqual(read_file(self.path + ".2"), "cccc\ndddd\n")
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+    def test_rotate_compressed(self):
+        log = logs.RotatingLog(self.path, max_size=10, max_files=1, compress=True)
+        for line in ("aaaa\n", "bbbb\n", "cccc\n"):
+            log.write(line)
+        log.close()
+
+        self.assertEqual(read_file(self.path), "cccc\n")
+        with gzip.open(self.path + ".1.gz", "rb") as f:
+            self.assertEqual(f.read(), "aaaa\nbbbb\n")
+
+    def test_rotate_by_age(self):
+        log = logs.RotatingLog(self.path, max_size=0, max_files=1, max_age=60)
+        with patch("time.time", return_value=1000):
+            log.write("aaaa\n")
+        with patch("time.time", return_value=1061):
+            log.write("bbbb\n")
+        log.close()
+
+        self.assertEqual(read_file(self.path), "bbbb\n")
+        self.assertEqual(read_file(self.path + ".1"), "aaaa\n")
+
+    def test_append_to_existing(self):
+        with open(self.path, "w") as f:
+            f.write("aaaa\n")
+
+        log = logs.RotatingLog(self.path, max_size=8, max_files=1)
+        log.write("bbbb\n")
+        log.close()
+
+        self.assertEqual(read_file(self.path), "bbbb\n")
+        self.assertEqual(read_file(self.path + ".1"), "aaaa\n")
+
+
+class LogCaptureTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.patcher = patch.dict("os.environ", {
+            "CONTAINERIZER_STATE_DIR": os.path.join(self.directory, "state"),
+            "CONTAINERIZER_LOG_MAX_SIZE": "1024"
+        })
+        self.patcher.start()
+
+        update_container_state("container-foo", docker_id="aaaa", directory=self.directory)
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.directory)
+
+    def capture(self, frames, driver="json-file"):
+        client = FakeClient(frames, driver)
+        with patch("containerizer.logs.docker_client", return_value=client):
+            logs.capture_logs("container-foo", "aaaa", self.directory)
+            logs.finish_logs("container-foo")
+        return client
+
+    def test_capture(self):
+        self.capture([
+            (1, "2015-01-02T03:04:05.1Z hello\n"),
+            (2, "2015-01-02T03:04:05.2Z oops\n"),
+            (1, "2015-01-02T03:04:06Z world\n")
+        ])
+
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stdout")),
+                         "hello\nworld\n")
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stderr")), "oops\n")
+
+        position = read_container_state("container-foo")["log_position"]
+        self.assertEqual(position["timestamp"], "2015-01-02T03:04:06.000000000Z")
+        self.assertEqual(position["bytes"], 17)
+
+    def test_resume(self):
+        self.capture([(1, "2015-01-02T03:04:05.1Z hello\n")])
+        client = self.capture([
+            (1, "2015-01-02T03:04:05.1Z hello\n"),
+            (1, "2015-01-02T03:04:05.3Z world\n")
+        ])
+
+        self.assertEqual(client.since, [1420167845])
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stdout")),
+                         "hello\nworld\n")
+
+    def test_budget(self):
+        with patch.dict("os.environ", {"CONTAINERIZER_LOG_BUDGET": "10"}):
+            self.capture([
+                (1, "2015-01-02T03:04:05Z hello\n"),
+                (1, "2015-01-02T03:04:06Z world\n"),
+                (1, "2015-01-02T03:04:07Z !\n")
+            ])
+
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stdout")), "hello\n")
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stderr")),
+                         logs.BUDGET_MESSAGE % 10)
+        self.assertTrue(read_container_state("container-foo")["log_position"]["discarding"])
+
+    def test_lost(self):
+        self.capture([(1, "2015-01-02T03:04:05.1Z hello\n")])
+        self.capture([
+            (1, "2015-01-02T03:04:05.3Z world\n")
+        ])
+
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stdout")),
+                         "hello\nworld\n")
+        self.assertEqual(read_file(os.path.join(self.directory, "docker_stderr")),
+                         logs.LOST_MESSAGE)
+
+    def test_other_log_driver(self):
+        client = self.capture([(1, "2015-01-02T03:04:05Z hello\n")], driver="journald")
+
+        self.assertEqual(client.since, [])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "docker_stdout")))
+
+
+class LogDriverTestCase(TestCase):
+
+    def test_capture_enabled(self):
+        with patch.dict("os.environ", {"CONTAINERIZER_DOCKER_LOG_DRIVER": "json-file"}):
+            self.assertTrue(logs.capture_enabled([]))
+            self.assertFalse(logs.capture_enabled(["--log-driver=syslog"]))
+            self.assertEqual(logs.docker_log_arguments([]), ["--log-opt", "max-size=10m"])
+            self.assertEqual(logs.sandbox_command("run", []), "run")
+
+        with patch.dict("os.environ", {"CONTAINERIZER_DOCKER_LOG_DRIVER": "journald"}):
+            self.assertFalse(logs.capture_enabled([]))
+            self.assertEqual(logs.docker_log_arguments([]), [])
+            self.assertEqual(logs.sandbox_command("run", []), "run" + logs.SANDBOX_REDIRECT)
+
+    def test_detect_driver(self):
+        client = FakeClient([])
+        client.socket_path = "/var/run/docker.sock"
+        client.info = lambda: {"LoggingDriver": "journald"}
+
+        with patch("containerizer.logs.docker_client", return_value=client), \
+                patch("containerizer.logs._log_drivers", {}):
+            self.assertEqual(logs.docker_log_driver(), "journald")
+
+            client.info = lambda: {"LoggingDriver": "json-file"}
+            self.assertEqual(logs.docker_log_driver(), "journald")
@@ -0,0 +1,62 @@
+import os
+import shutil
+from mock import patch
+
+from containerizer import network
+from tests.fakes import FixtureTestCase, write_file
+
+NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  500000    5000    0    0    0     0          0         0   500000    5000    0    0    0     0       0          0
+  eth0:    1000      10    1    2    0     0          0         0     2000      20    3    4    0     0       0          0
+  eth1:     100       1    0    0    0     0          0         0      200       2    0    0    0     0       0          0
+"""
+
+
+class NetworkStatisticsTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(NetworkStatisticsTestCase, self).setUp()
+        self.proc = os.path.join(self.directory, "proc")
+        self.cgroup_root = os.path.join(self.directory, "cgroup")
+
+        write_file(os.path.join(self.cgroup_root, "cpu", "docker", "aaaa", "cgroup.procs"),
+                   "1234\n1240\n")
+
+        os.makedirs(os.path.join(self.proc, "1234", "ns"))
+        os.makedirs(os.path.join(self.proc, "1234", "net"))
+        os.makedirs(os.path.join(self.proc, "self", "ns"))
+        os.symlink("net:[4026532000]", os.path.join(self.proc, "1234", "ns", "net"))
+        os.symlink("net:[4026531993]", os.path.join(self.proc, "self", "ns", "net"))
+        with open(os.path.join(self.proc, "1234", "net", "dev"), "w") as f:
+            f.write(NET_DEV)
+
+        self.start_patchers(
+            patch.dict("os.environ", {"CONTAINERIZER_CGROUP_VERSION": "1"}),
+            patch("containerizer.network.PROC_ROOT", self.proc),
+            patch("containerizer.cgroups.CGROUP_ROOT", self.cgroup_root)
+        )
+
+    def test_network_statistics(self):
+        self.assertEqual(network.network_statistics("aaaa"), {
+            "net_rx_bytes": 1100,
+            "net_rx_packets": 11,
+            "net_rx_errors": 1,
+            "net_rx_dropped": 2,
+            "net_tx_bytes": 2200,
+            "net_tx_packets": 22,
+            "net_tx_errors": 3,
+            "net_tx_dropped": 4
+        })
+
+    def test_host_network(self):
+        os.unlink(os.path.join(self.proc, "self", "ns", "net"))
+        os.symlink("net:[4026532000]", os.path.join(self.proc, "self", "ns", "net"))
+
+        self.assertEqual(network.network_statistics("aaaa"), {})
+
+    def test_stopped_container(self):
+        shutil.rmtree(os.path.join(self.proc, "1234"))
+        self.assertEqual(network.network_statistics("aaaa"), {})
+        self.assertEqual(network.network_statistics("bbbb"), {})
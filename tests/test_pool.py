@@ -0,0 +1,113 @@
+import os
+import time
+import subprocess
+from StringIO import StringIO
+from mock import patch
+
+from containerizer import pool
+from tests.fakes import FixtureTestCase
+
+
+class ContainerPoolTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ContainerPoolTestCase, self).setUp()
+        self.created = []
+
+        def create(command, arguments, stdout=None):
+            self.created.append(arguments)
+            return StringIO("%064d\n" % len(self.created)), None, 0
+
+        self.start_patchers(
+            patch.dict("os.environ", {"CONTAINERIZER_STATE_DIR": self.directory}),
+            patch("containerizer.pool.invoke_docker", side_effect=create),
+            patch("containerizer.pool.enqueue_removal"),
+            patch("containerizer.pool.wake_reaper"),
+            patch("containerizer.pool.docker_client")
+        )
+
+        self.pool = pool.ContainerPool(size=2, shapes=1, min_launches=2)
+        self.pool.start()
+
+    def wait_for_idle(self, key, count):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            with self.pool.lock:
+                shape = self.pool.shapes.get(key)
+                if shape and len(shape.idle) == count:
+                    return
+            time.sleep(0.01)
+
+        self.fail("Pool never had %d idle containers" % count)
+
+    def test_fill(self):
+        self.pool.offer("shape-a", ["image-a"], {"cpu_shares": 1024})
+        self.assertIsNone(self.pool.claim("shape-a"))
+
+        self.pool.offer("shape-a", ["image-a"], {"cpu_shares": 1024})
+        self.wait_for_idle("shape-a", 2)
+
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.created[0][-1], "image-a")
+        self.assertIn("mesos.pool=shape-a", self.created[0])
+
+        pooled = self.pool.claim("shape-a")
+        self.assertEqual(pooled["docker_id"], "%064d" % 1)
+        self.assertEqual(pooled["limits"], {"cpu_shares": 1024})
+        self.assertTrue(os.path.islink(pooled["link"]))
+
+        # The claimed container is replaced
+        self.wait_for_idle("shape-a", 2)
+        self.assertEqual(len(self.created), 3)
+
+    def test_evict(self):
+        self.pool.offer("shape-a", ["image-a"], {})
+        self.pool.offer("shape-a", ["image-a"], {})
+        self.wait_for_idle("shape-a", 2)
+
+        self.pool.offer("shape-b", ["image-b"], {})
+        self.assertIsNone(self.pool.claim("shape-a"))
+        self.assertEqual(pool.enqueue_removal.call_count, 2)
+
+    def test_remove_stale_containers(self):
+        client = pool.docker_client.return_value
+        client.list_containers.return_value = [
+            {"Id": "a" * 64, "Names": ["/mesos-pool-0123456789abcdef"]},
+            {"Id": "b" * 64, "Names": ["/container-foo-bar"]}
+        ]
+
+        pool.remove_stale_containers()
+
+        client.list_containers.assert_called_once_with(
+            all=True, filters={"label": ["mesos.pool"], "status": ["created"]}
+        )
+        pool.enqueue_removal.assert_called_once_with("a" * 64)
+
+
+class SandboxTestCase(FixtureTestCase):
+
+    def test_bind_sandbox(self):
+        placeholder = os.path.join(self.directory, "empty")
+        sandbox = os.path.join(self.directory, "sandbox")
+        os.mkdir(placeholder)
+        os.mkdir(sandbox)
+
+        pooled = {"link": os.path.join(self.directory, "mesos-pool-a")}
+        os.symlink(placeholder, pooled["link"])
+
+        pool.bind_sandbox(pooled, sandbox)
+        self.assertEqual(os.readlink(pooled["link"]), sandbox)
+
+        pool.remove_link(pooled)
+        self.assertFalse(os.path.lexists(pooled["link"]))
+
+    def test_environment_file(self):
+        pool.write_environment_file(self.directory, [
+            ("MESOS_SLAVE_ID", "slave-1"),
+            ("MESOS_SLAVE_PID", "slave(1)@10.0.0.1:5051 'quoted'")
+        ])
+
+        command = pool.pooled_command('echo "$MESOS_SLAVE_ID $MESOS_SLAVE_PID"')
+        command = command.replace("/mesos-sandbox", self.directory)
+        self.assertEqual(subprocess.check_output(["sh", "-c", command]),
+                         "slave-1 slave(1)@10.0.0.1:5051 'quoted'\n")
@@ -0,0 +1,73 @@
+import os
+from mock import patch
+
+from containerizer import reaper
+from containerizer.docker import DockerAPIError
+from containerizer.locks import FileLock
+from tests.fakes import FixtureTestCase
+
+
+class ReaperTestCase(FixtureTestCase):
+
+    def setUp(self):
+        super(ReaperTestCase, self).setUp()
+        self.start_patchers(
+            patch.dict("os.environ", {"CONTAINERIZER_STATE_DIR": self.directory}),
+            patch("containerizer.reaper.RETRY_DELAY", 0),
+            patch("containerizer.reaper.docker_client")
+        )
+
+        self.client = reaper.docker_client.return_value
+
+        # Create the mocked method up front, rather than letting the reaper's
+        # workers race to create it
+        self.client.remove_container.return_value = None
+
+    def test_reap(self):
+        reaper.enqueue_removal("aaaa")
+        reaper.enqueue_removal("bbbb")
+
+        reaper.reap_containers()
+
+        self.assertEqual(sorted(c[0][0] for c in self.client.remove_container.call_args_list),
+                         ["aaaa", "bbbb"])
+        self.assertEqual(reaper.read_queue(), {})
+
+    def test_retry(self):
+        self.client.remove_container.side_effect = [
+            DockerAPIError(500, "Device or resource busy"), None
+        ]
+
+        reaper.enqueue_removal("aaaa")
+        reaper.reap_containers()
+
+        self.assertEqual(self.client.remove_container.call_count, 2)
+        self.assertEqual(reaper.read_queue(), {})
+
+    def test_give_up(self):
+        self.client.remove_container.side_effect = DockerAPIError(500, "Device or resource busy")
+
+        with patch.dict("os.environ", {"CONTAINERIZER_REAPER_ATTEMPTS": "3"}):
+            reaper.enqueue_removal("aaaa")
+            reaper.reap_containers()
+
+        self.assertEqual(self.client.remove_container.call_count, 3)
+        self.assertEqual(reaper.read_queue(), {})
+
+    def test_already_removed(self):
+        self.client.remove_container.side_effect = DockerAPIError(404, "No such container")
+
+        reaper.enqueue_removal("aaaa")
+        reaper.reap_containers()
+
+        self.assertEqual(self.client.remove_container.call_count, 1)
+        self.assertEqual(reaper.read_queue(), {})
+
+    def test_queue_locked(self):
+        reaper.enqueue_removal("aaaa")
+
+        with FileLock(reaper.queue_path(".lock")):
+            reaper.reap_containers()
+
+        self.assertFalse(self.client.remove_container.called)
+        self.assertEqual(reaper.read_queue().keys(), ["aaaa"])
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+
+from containerizer import state
+
+
+class ContainerStateTestCase(TestCase):
+
+    def setUp(self):
+        self.state_directory = tempfile.mkdtemp()
+        self.patcher = patch.dict("os.environ", {"CONTAINERIZER_STATE_DIR": self.state_directory})
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.state_directory)
+
+    def test_missing_record(self):
+        self.assertIsNone(state.read_container_state("container-foo"))
+        self.assertEqual(state.list_container_states(), {})
+
+    def test_write_and_update(self):
+        state.write_container_state("container-foo", {"docker_id": "aaaa", "image": "busybox"})
+        state.update_container_state("container-foo", docker_id="bbbb")
+
+        self.assertEqual(state.read_container_state("container-foo"), {
+            "container_id": "container-foo",
+            "docker_id": "bbbb",
+            "image": "busybox"
+        })
+
+    def test_list_and_remove(self):
+        state.update_container_state("container-foo", docker_id="aaaa")
+        state.update_container_state("container-bar", docker_id="bbbb")
+
+        # Left behind by an interrupted write
+        with open(os.path.join(self.state_directory, "containers", ".container-baz.x"), "w") as f:
+            f.write("{")
+
+        self.assertEqual(sorted(state.list_container_states()), ["container-bar", "container-foo"])
+
+        state.remove_container_state("container-foo")
+        state.remove_container_state("container-foo")
+
+        self.assertEqual(state.list_container_states().keys(), ["container-bar"])
+
+    def test_corrupt_record(self):
+        os.makedirs(os.path.join(self.state_directory, "containers"))
+        with open(os.path.join(self.state_directory, "containers", "container-foo"), "w") as f:
+            f.write("{")
+
+        self.assertIsNone(state.read_container_state("container-foo"))
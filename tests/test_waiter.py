@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from containerizer.docker import DockerClient
+from containerizer.waiter import ContainerWaiter
+from tests.fakes import FakeDockerServer
+
+RUNNING = {"Id": "a" * 64, "State": {"Running": True, "ExitCode": 0}}
+OOM_KILLED = {"Id": "a" * 64, "State": {"Running": False, "ExitCode": 137, "OOMKilled": True}}
+
+
+class ContainerWaiterTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        socket_path = os.path.join(self.directory, "docker.sock")
+
+        self.routes = {}
+        self.server = FakeDockerServer(socket_path, self.routes)
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.waiter = ContainerWaiter(DockerClient(socket_path))
+
+    def tearDown(self):
+        self.server.events.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def wait_in_background(self, container):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.waiter.wait(container)))
+        thread.daemon = True
+        thread.start()
+        return thread, results
+
+    def test_wait_for_die_event(self):
+        self.routes[("GET", "/containers/foo/json")] = (200, RUNNING)
+
+        first, first_results = self.wait_in_background("foo")
+        second, second_results = self.wait_in_background("foo")
+
+        # Give the waiters time to register and inspect the container
+        first.join(0.5)
+        self.assertTrue(first.is_alive())
+
+        self.routes[("GET", "/containers/foo/json")] = (200, OOM_KILLED)
+        self.server.events.put({"id": "a" * 64, "status": "die"})
+
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(first_results[0].status, 137)
+        self.assertTrue(first_results[0].oom_killed)
+        self.assertIs(first_results[0], second_results[0])
+
+        # A single event subscription is shared by every waiter
+        subscriptions = [path for _, path in self.server.requests if path.startswith("/events")]
+        self.assertEqual(len(subscriptions), 1)
+
+    def test_wait_for_stopped_container(self):
+        self.routes[("GET", "/containers/foo/json")] = (200, OOM_KILLED)
+
+        self.assertEqual(self.waiter.wait("foo").status, 137)
+
+    def test_wait_for_missing_container(self):
+        self.assertIsNone(self.waiter.wait("bar").status)
+
+    def test_wait_for_removed_container(self):
+        self.routes[("GET", "/containers/foo/json")] = (200, RUNNING)
+
+        thread, results = self.wait_in_background("foo")
+        thread.join(0.5)
+
+        # Removed straight after it died, before it could be inspected
+        del self.routes[("GET", "/containers/foo/json")]
+        self.server.events.put({"id": "a" * 64, "status": "die",
+                                "Actor": {"Attributes": {"name": "foo", "exitCode": "3"}}})
+
+        thread.join(5)
+        self.assertEqual(results[0].status, 3)
+
+    def test_inspect_failure(self):
+        self.routes[("GET", "/containers/foo/json")] = (500, {"message": "oops"})
+
+        with self.assertRaises(Exception):
+            self.waiter.wait("foo")